@@ -1,21 +1,640 @@
-from flask import Flask, render_template, request, jsonify, send_file
-from gtts import gTTS
-from deep_translator import GoogleTranslator
+from flask import Flask, Response, g, render_template, request, jsonify, send_file, stream_with_context
+# gtts, deep_translator, asyncio, http.client được import lười ở chỗ dùng (khởi động nhanh hơn,
+# đo bằng tools/startup_bench.py)
 import re 
 import io
+import gc
+import sys
+import hmac
+import marshal
+import itertools
+import functools
 import json
+import gzip
+import hashlib
+import sqlite3
 import os
 import threading
+import atexit
+import time
+import shutil
+import subprocess
+import wave
 from difflib import SequenceMatcher
 from datetime import datetime
-import urllib.request
 import urllib.parse
+import importlib
+import importlib.util
 import random
-from collections import OrderedDict
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
 
 app = Flask(__name__)
 app.secret_key = 'robo_english_super_secret'
 
+# --- Singleflight: gộp các request giống hệt nhau đang chạy song song ---
+# Khi cả lớp cùng mở 1 topic, 30 request /api/phonetic?word=Slide chỉ tạo 1 lần gọi ra ngoài;
+# các request còn lại chờ và nhận chung kết quả.
+class _SingleFlight:
+    class _Call:
+        __slots__ = ('event', 'result', 'error')
+
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: dict = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """Chạy fn(*args) cho key; nếu key đang chạy ở thread khác thì chờ và dùng chung kết quả."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                leader = False
+            else:
+                call = _SingleFlight._Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'in_flight': len(self._calls), 'executed': self.executed, 'shared': self.shared}
+
+
+_PHONETIC_FLIGHT = _SingleFlight('phonetic')
+_TRANSLATION_FLIGHT = _SingleFlight('translation')
+_TTS_FLIGHT = _SingleFlight('tts')
+# Xuất ra /metrics (robo_singleflight_*); bản async đăng ký thêm ở phần ASGI
+_SINGLE_FLIGHTS: list = [_PHONETIC_FLIGHT, _TRANSLATION_FLIGHT, _TTS_FLIGHT]
+
+
+# --- Metrics: bộ đếm + histogram trong process, xuất dạng Prometheus tại /metrics ---
+# Không cần prometheus_client: mỗi lần observe chỉ là bisect + cộng dưới 1 lock.
+# Mỗi process (worker) có số liệu riêng.
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ''
+    parts = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _metric_header(name: str, help_text: str, kind: str) -> list[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+
+class _Counter:
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def get(self, *labels) -> float:
+        with self._lock:
+            return self._values.get(labels, 0.0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = _metric_header(self.name, self.help, 'counter')
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+
+class _StageTimer:
+    __slots__ = ('hist', 'labels', 'started')
+
+    def __init__(self, hist: '_Histogram', labels: tuple):
+        self.hist = hist
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+class _Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = _LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # labels -> [số mẫu theo từng bucket (không cộng dồn, phần tử cuối là +Inf), tổng, số mẫu]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[labels] = series
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labels) -> _StageTimer:
+        """with hist.time('label'): ... -> ghi thời gian chạy của khối lệnh (giây)."""
+        return _StageTimer(self, labels)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((labels, (list(s[0]), s[1], s[2])) for labels, s in self._series.items())
+        lines = _metric_header(self.name, self.help, 'histogram')
+        names = self.labelnames + ('le',)
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+_HTTP_REQUESTS = _Counter('robo_http_requests_total', 'Số request HTTP theo route/method/status.', ('method', 'route', 'status'))
+_HTTP_LATENCY = _Histogram('robo_http_request_duration_seconds', 'Thời gian xử lý request theo route.', ('method', 'route'))
+_CHECK_LATENCY = _Histogram('robo_check_duration_seconds', 'Thời gian chấm /api/check theo chế độ.', ('mode', 'degraded'))
+_STAGE_SECONDS = _Histogram(
+    'robo_stage_duration_seconds',
+    'Thời gian từng bước bên trong request (model, LanguageTool, lịch sử, dịch, TTS, phiên âm).',
+    ('stage',),
+)
+_CACHE_LOOKUPS = _Counter('robo_cache_lookups_total', 'Số lần tra cache theo kết quả.', ('cache', 'result'))
+_METRICS = [_HTTP_REQUESTS, _HTTP_LATENCY, _CHECK_LATENCY, _STAGE_SECONDS, _CACHE_LOOKUPS]
+# Hàm lấy số liệu tức thời lúc scrape (kích thước file, số phiên...), trả về các dòng text
+_METRIC_COLLECTORS: list = []
+
+
+# --- Tracing: cây span cho từng request, ghi JSON lines (1 dòng / span) ---
+# Bật bằng ROBO_TRACE_FILE=traces.jsonl (hoặc '-' để ghi ra stderr). Chỉ ghi request chậm hơn
+# ROBO_TRACE_SLOW_MS hoặc có span bị lỗi (kể cả lỗi bị nuốt bởi try/except bên ngoài span).
+# Không có trace đang chạy thì _span() trả về span rỗng dùng chung -> gần như không tốn gì.
+_TRACE_FILE = os.getenv('ROBO_TRACE_FILE', '').strip()
+_TRACE_SLOW_MS = float(os.getenv('ROBO_TRACE_SLOW_MS', '500'))
+_TRACE_LOCK = threading.Lock()
+_CURRENT_SPAN: ContextVar = ContextVar('robo_current_span', default=None)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'attrs', 'start', 'started', 'duration_ms', 'error', '_token')
+
+    def __init__(self, trace: '_Trace', name: str, parent_id: str | None, attrs: dict):
+        self.trace = trace
+        self.span_id = os.urandom(4).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.start = 0.0
+        self.started = 0.0
+        self.duration_ms = 0.0
+        self.error = None
+        self._token = None
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self._token = _CURRENT_SPAN.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ms = (time.perf_counter() - self.started) * 1000
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        if self._token is not None:
+            try:
+                _CURRENT_SPAN.reset(self._token)
+            except ValueError:
+                # Kết thúc ở context khác với lúc mở (vd. hook Flask chạy khác context)
+                _CURRENT_SPAN.set(None)
+            self._token = None
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            'trace_id': self.trace.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start': round(self.start, 6),
+            'duration_ms': round(self.duration_ms, 3),
+            'attrs': self.attrs,
+            'error': self.error,
+        }
+
+
+class _Trace:
+    __slots__ = ('trace_id', 'spans', '_lock')
+
+    def __init__(self):
+        self.trace_id = os.urandom(8).hex()
+        self.spans: list[_Span] = []
+        self._lock = threading.Lock()
+
+    def new_span(self, name: str, parent_id: str | None, attrs: dict) -> _Span:
+        span = _Span(self, name, parent_id, attrs)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+
+def _span(name: str, **attrs):
+    """Span con của span hiện tại (dùng với `with`); không có trace thì trả về span rỗng."""
+    parent = _CURRENT_SPAN.get()
+    if parent is None:
+        return _NOOP_SPAN
+    return parent.trace.new_span(name, parent.span_id, attrs)
+
+
+def _start_trace(name: str, **attrs) -> _Span:
+    return _Trace().new_span(name, None, attrs)
+
+
+def _mark_span_error(e: BaseException) -> None:
+    """Gắn lỗi vào span hiện tại (cho các chỗ bắt lỗi rồi trả về phản hồi thay vì raise)."""
+    span = _CURRENT_SPAN.get()
+    if span is not None:
+        span.error = f"{type(e).__name__}: {e}"
+
+
+def _emit_trace(root: _Span) -> None:
+    spans = list(root.trace.spans)
+    if root.duration_ms < _TRACE_SLOW_MS and not any(s.error for s in spans):
+        return
+    payload = ''.join(json.dumps(s.to_dict(), ensure_ascii=False, default=str) + '\n' for s in spans)
+    try:
+        with _TRACE_LOCK:
+            if _TRACE_FILE == '-':
+                sys.stderr.write(payload)
+                sys.stderr.flush()
+            else:
+                with open(_TRACE_FILE, 'a', encoding='utf-8') as f:
+                    f.write(payload)
+    except Exception:
+        pass
+
+
+class _Stage:
+    """1 bước bên trong request: vừa ghi histogram robo_stage_duration_seconds vừa tạo span."""
+
+    __slots__ = ('name', 'span', 'started')
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.span = _span(name, **attrs)
+
+    def __enter__(self):
+        self.span.__enter__()
+        self.started = time.perf_counter()
+        return self.span
+
+    def __exit__(self, *exc):
+        _STAGE_SECONDS.observe(time.perf_counter() - self.started, self.name)
+        return self.span.__exit__(*exc)
+
+
+def _stage(name: str, **attrs) -> _Stage:
+    return _Stage(name, attrs)
+
+
+# --- Outbound calls: timeout cứng + circuit breaker + số liệu theo từng dịch vụ ngoài ---
+class _CircuitOpenError(Exception):
+    pass
+
+
+class _OutboundDependency:
+    """Bọc các lần gọi ra dịch vụ ngoài (dịch, từ điển...).
+
+    - timeout: chạy fn trong pool riêng và chỉ chờ tối đa `timeout` giây (thread gọi không bị treo theo).
+    - circuit breaker: lỗi liên tiếp >= failure_threshold thì "mở mạch", từ chối ngay trong reset_timeout giây,
+      sau đó cho 1 lần thử (half-open); thành công thì đóng mạch lại.
+    """
+
+    def __init__(self, name: str, *, timeout: float | None, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.timeout = timeout
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def _allow(self) -> bool:
+        with self._lock:
+            if self._state == 'closed':
+                return True
+            if self._state == 'open' and (time.monotonic() - self._opened_at) >= self.reset_timeout:
+                self._state = 'half_open'
+                self._probe_in_flight = False
+            if self._state == 'half_open' and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def _record(self, elapsed_ms: float, ok: bool, timed_out: bool = False) -> None:
+        with self._lock:
+            self.calls += 1
+            self.total_ms += elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            if ok:
+                self._consecutive_failures = 0
+                self._state = 'closed'
+                self._probe_in_flight = False
+                return
+            self.errors += 1
+            if timed_out:
+                self.timeouts += 1
+            self._consecutive_failures += 1
+            if self._state == 'half_open' or self._consecutive_failures >= self.failure_threshold:
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def call(self, fn, *args, **kwargs):
+        if not self._allow():
+            raise _CircuitOpenError(self.name)
+        started = time.perf_counter()
+        try:
+            if self.timeout:
+                result = _OUTBOUND_POOL.submit(fn, *args, **kwargs).result(timeout=self.timeout)
+            else:
+                result = fn(*args, **kwargs)
+        except FutureTimeoutError:
+            self._record((time.perf_counter() - started) * 1000, False, timed_out=True)
+            raise TimeoutError(f"{self.name}: quá {self.timeout}s")
+        except Exception:
+            self._record((time.perf_counter() - started) * 1000, False)
+            raise
+        self._record((time.perf_counter() - started) * 1000, True)
+        return result
+
+    async def acall(self, fn, *args, **kwargs):
+        """Như call() nhưng fn là coroutine function (chế độ ASGI); timeout bằng asyncio.wait_for."""
+        import asyncio
+
+        if not self._allow():
+            raise _CircuitOpenError(self.name)
+        started = time.perf_counter()
+        try:
+            coro = fn(*args, **kwargs)
+            result = await (asyncio.wait_for(coro, self.timeout) if self.timeout else coro)
+        except asyncio.TimeoutError:
+            self._record((time.perf_counter() - started) * 1000, False, timed_out=True)
+            raise TimeoutError(f"{self.name}: quá {self.timeout}s")
+        except Exception:
+            self._record((time.perf_counter() - started) * 1000, False)
+            raise
+        self._record((time.perf_counter() - started) * 1000, True)
+        return result
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._state == 'open' and (time.monotonic() - self._opened_at) < self.reset_timeout
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'state': self._state,
+                'calls': self.calls,
+                'errors': self.errors,
+                'timeouts': self.timeouts,
+                'rejected': self.rejected,
+                'error_rate': round(self.errors / self.calls, 4) if self.calls else 0.0,
+                'avg_ms': round(self.total_ms / self.calls, 2) if self.calls else 0.0,
+                'max_ms': round(self.max_ms, 2),
+            }
+
+
+_OUTBOUND_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv('ROBO_OUTBOUND_WORKERS', '16')),
+    thread_name_prefix='outbound',
+)
+_TRANSLATOR_DEP = _OutboundDependency(
+    'translator',
+    timeout=float(os.getenv('ROBO_TRANSLATION_TIMEOUT', '4')),
+    failure_threshold=int(os.getenv('ROBO_TRANSLATION_BREAKER_FAILURES', '3')),
+    reset_timeout=float(os.getenv('ROBO_TRANSLATION_BREAKER_RESET', '30')),
+)
+# dictionaryapi.dev đã có timeout ở socket -> chỉ cần breaker
+_DICTIONARY_DEP = _OutboundDependency(
+    'dictionary_api',
+    timeout=None,
+    failure_threshold=int(os.getenv('ROBO_PHONETIC_BREAKER_FAILURES', '5')),
+    reset_timeout=float(os.getenv('ROBO_PHONETIC_BREAKER_RESET', '30')),
+)
+_OUTBOUND_DEPENDENCIES = [_TRANSLATOR_DEP, _DICTIONARY_DEP]
+
+
+# --- Admission control: giới hạn việc nặng chạy đồng thời, hàng đợi có giới hạn, bỏ sớm theo deadline ---
+# Cả lớp bấm "Kiểm tra" cùng lúc: thay vì nhận hết rồi mọi request cùng chậm, chỉ cho N request chạy,
+# tối đa Q request xếp hàng; request không thể xong trước deadline thì trả ngay phản hồi rút gọn.
+class _Overloaded(Exception):
+    def __init__(self, name: str, reason: str, retry_after: int):
+        super().__init__(f"{name}: {reason}")
+        self.name = name
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _AdmissionGate:
+    def __init__(self, name: str, *, max_concurrent: int, max_queue: int, deadline: float):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.deadline = deadline
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_deadline = 0
+        self.queued = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        # Thời gian xử lý trung bình (EWMA) -> ước lượng request đang chờ còn kịp deadline không
+        self.service_ewma = 0.0
+
+    def _retry_after(self) -> int:
+        backlog = (self.waiting + self.active) / self.max_concurrent
+        return max(1, int(backlog * self.service_ewma + 0.999))
+
+    def _enter(self, deadline: float | None) -> float:
+        arrived = time.monotonic()
+        budget = self.deadline if deadline is None else min(self.deadline, deadline)
+        with self._cond:
+            # Còn slot và không ai đang xếp hàng -> chạy ngay (không chen lên trước người đang chờ)
+            if self.active < self.max_concurrent and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+                return 0.0
+            if self.waiting >= self.max_queue:
+                self.shed_queue_full += 1
+                raise _Overloaded(self.name, 'queue_full', self._retry_after())
+            self.waiting += 1
+            try:
+                while self.active >= self.max_concurrent:
+                    remaining = arrived + budget - self.service_ewma - time.monotonic()
+                    if remaining <= 0:
+                        self.shed_deadline += 1
+                        # notify() của _exit có thể vừa đánh thức đúng request này: chuyển tiếp cho người
+                        # đang chờ kế tiếp, nếu không slot trống bị bỏ phí tới khi họ tự hết hạn
+                        self._cond.notify()
+                        raise _Overloaded(self.name, 'deadline', self._retry_after())
+                    self._cond.wait(remaining)
+                self.active += 1
+                self.admitted += 1
+            finally:
+                self.waiting -= 1
+            waited = time.monotonic() - arrived
+            self.queued += 1
+            self.queue_wait_total += waited
+            self.queue_wait_max = max(self.queue_wait_max, waited)
+            return waited
+
+    def _exit(self, service_seconds: float) -> None:
+        with self._cond:
+            self.active -= 1
+            if self.service_ewma:
+                self.service_ewma = 0.8 * self.service_ewma + 0.2 * service_seconds
+            else:
+                self.service_ewma = service_seconds
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self, deadline: float | None = None):
+        """Giữ 1 slot trong lúc chạy khối lệnh; hết chỗ/quá deadline thì raise _Overloaded."""
+        waited = self._enter(deadline)
+        started = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self._exit(time.monotonic() - started)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'active': self.active,
+                'waiting': self.waiting,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'deadline_s': self.deadline,
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'shed_queue_full': self.shed_queue_full,
+                'shed_deadline': self.shed_deadline,
+                'avg_queue_ms': round(self.queue_wait_total / self.queued * 1000, 2) if self.queued else 0.0,
+                'max_queue_ms': round(self.queue_wait_max * 1000, 2),
+                'service_ewma_ms': round(self.service_ewma * 1000, 2),
+            }
+
+
+_CHECK_GATE = _AdmissionGate(
+    'check',
+    max_concurrent=int(os.getenv('ROBO_CHECK_MAX_CONCURRENT', str(os.cpu_count() or 4))),
+    max_queue=int(os.getenv('ROBO_CHECK_MAX_QUEUE', '32')),
+    deadline=float(os.getenv('ROBO_CHECK_DEADLINE', '3')),
+)
+_TTS_GATE = _AdmissionGate(
+    'tts',
+    max_concurrent=int(os.getenv('ROBO_TTS_MAX_CONCURRENT', '8')),
+    max_queue=int(os.getenv('ROBO_TTS_MAX_QUEUE', '32')),
+    deadline=float(os.getenv('ROBO_TTS_DEADLINE', '8')),
+)
+_ADMISSION_GATES = [_CHECK_GATE, _TTS_GATE]
+
+
+def _parse_deadline_ms(value) -> float | None:
+    try:
+        ms = float(value)
+    except (TypeError, ValueError):
+        return None
+    return ms / 1000 if ms > 0 else None
+
+
+def _request_deadline() -> float | None:
+    """Deadline client gửi kèm (header X-Deadline-Ms), tính bằng giây; None nếu không có."""
+    return _parse_deadline_ms(request.headers.get('X-Deadline-Ms', ''))
+
+
+@app.route('/api/admission')
+def admission_api():
+    return jsonify({gate.name: gate.stats() for gate in _ADMISSION_GATES})
+
+
 # --- Translation (deep-translator) ---
 # googletrans hay bị lỗi/limit theo thời điểm; deep-translator ổn định hơn.
 # Cache nhỏ để tránh gọi dịch vụ liên tục.
@@ -34,18 +653,69 @@ def _escape_html(text: str) -> str:
     )
 
 
+# Tầng 2: cache dịch lưu trong SQLite (WAL) -> còn sau khi restart và dùng chung giữa các worker.
+_TRANSLATION_DB_FILE = os.getenv(
+    'ROBO_TRANSLATION_CACHE_FILE',
+    os.path.join(os.path.dirname(__file__), 'translation_cache.sqlite'),
+)
+_TRANSLATION_DB_LOCAL = threading.local()
+_TRANSLATION_DB_DISABLED = not _TRANSLATION_DB_FILE
+
+
+def _translation_db():
+    """Kết nối SQLite riêng cho mỗi thread (tạo bảng ở lần đầu). None nếu không dùng được."""
+    global _TRANSLATION_DB_DISABLED
+    if _TRANSLATION_DB_DISABLED:
+        return None
+    conn = getattr(_TRANSLATION_DB_LOCAL, 'conn', None)
+    if conn is not None:
+        return conn
+    try:
+        folder = os.path.dirname(_TRANSLATION_DB_FILE) or '.'
+        os.makedirs(folder, exist_ok=True)
+        conn = sqlite3.connect(_TRANSLATION_DB_FILE, timeout=2, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS translations ('
+            ' text TEXT NOT NULL, dest TEXT NOT NULL, value TEXT NOT NULL, updated_at REAL NOT NULL,'
+            ' PRIMARY KEY (text, dest)) WITHOUT ROWID'
+        )
+        conn.commit()
+    except Exception:
+        _TRANSLATION_DB_DISABLED = True
+        return None
+    _TRANSLATION_DB_LOCAL.conn = conn
+    return conn
+
+
 def _translation_cache_get(key: tuple[str, str]) -> str | None:
     try:
-        if key not in _TRANSLATION_CACHE:
+        if key in _TRANSLATION_CACHE:
+            val = _TRANSLATION_CACHE.pop(key)
+            _TRANSLATION_CACHE[key] = val
+            _CACHE_LOOKUPS.inc('translation', 'hit')
+            return val
+    except Exception:
+        pass
+
+    try:
+        conn = _translation_db()
+        if conn is None:
+            _CACHE_LOOKUPS.inc('translation', 'miss')
+            return None
+        row = conn.execute('SELECT value FROM translations WHERE text = ? AND dest = ?', key).fetchone()
+        if not row:
+            _CACHE_LOOKUPS.inc('translation', 'miss')
             return None
-        val = _TRANSLATION_CACHE.pop(key)
-        _TRANSLATION_CACHE[key] = val
-        return val
+        _translation_cache_put(key, row[0], persist=False)
+        _CACHE_LOOKUPS.inc('translation', 'db_hit')
+        return row[0]
     except Exception:
         return None
 
 
-def _translation_cache_put(key: tuple[str, str], value: str) -> None:
+def _translation_cache_put(key: tuple[str, str], value: str, *, persist: bool = True) -> None:
     try:
         if key in _TRANSLATION_CACHE:
             _TRANSLATION_CACHE.pop(key, None)
@@ -55,6 +725,120 @@ def _translation_cache_put(key: tuple[str, str], value: str) -> None:
     except Exception:
         pass
 
+    if not persist:
+        return
+    try:
+        conn = _translation_db()
+        if conn is None:
+            return
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO translations (text, dest, value, updated_at) VALUES (?, ?, ?, ?)',
+                (key[0], key[1], value, time.time()),
+            )
+    except Exception:
+        pass
+
+
+# Lần dịch qua mạng vừa thất bại (lỗi/timeout/rỗng): nhớ ngắn hạn thông báo lỗi để request kế tiếp
+# cho cùng câu (vd. Flask xử lý /api/chat ngay sau prefetch ở ASGI) trả lời ngay, không gọi lại và chờ thêm
+_TRANSLATION_FAILURE_TTL = float(os.getenv('ROBO_TRANSLATION_FAILURE_TTL', '30'))
+_TRANSLATION_FAILURES: "OrderedDict[tuple[str, str], tuple[str, float]]" = OrderedDict()
+_TRANSLATION_FAILURES_LOCK = threading.Lock()
+
+
+def _translation_failure_get(key: tuple[str, str]) -> str | None:
+    with _TRANSLATION_FAILURES_LOCK:
+        item = _TRANSLATION_FAILURES.get(key)
+        if item is None:
+            return None
+        if item[1] <= time.monotonic():
+            del _TRANSLATION_FAILURES[key]
+            return None
+        return item[0]
+
+
+def _translation_failure_put(key: tuple[str, str], message: str) -> None:
+    if _TRANSLATION_FAILURE_TTL <= 0:
+        return
+    with _TRANSLATION_FAILURES_LOCK:
+        _TRANSLATION_FAILURES.pop(key, None)
+        _TRANSLATION_FAILURES[key] = (message, time.monotonic() + _TRANSLATION_FAILURE_TTL)
+        while len(_TRANSLATION_FAILURES) > max(10, _TRANSLATION_CACHE_MAX):
+            _TRANSLATION_FAILURES.popitem(last=False)
+
+
+# --- Từ điển song ngữ cục bộ (dựng từ CURRICULUM + FIXED_TRANSLATIONS, lưu trên bản chụp giáo trình) ---
+_BILINGUAL_LEXICON_LOCK = threading.Lock()
+
+
+def _lexicon_key(text: str) -> str:
+    """Chuẩn hoá để tra từ điển: chữ thường, gộp khoảng trắng, bỏ dấu câu ở hai đầu."""
+    t = re.sub(r'\s+', ' ', _normalize_key(text))
+    return re.sub(r'^[\W_]+|[\W_]+$', '', t)
+
+
+def _build_bilingual_lexicon(curriculum: dict | None = None) -> dict[tuple[str, str], str]:
+    """Khoá (text_chuẩn_hoá, ngôn_ngữ_đích) -> bản dịch, lấy từ vocab (vi/en) và grammar (prompt_vi/answer)."""
+    curriculum = _CURRICULUM_COMPILED.data if curriculum is None else curriculum
+    lexicon: dict[tuple[str, str], str] = {}
+
+    def add(src_text, dest, value):
+        key = _lexicon_key(src_text)
+        value = '' if value is None else str(value).strip()
+        if key and value and (key, dest) not in lexicon:
+            lexicon[(key, dest)] = value
+
+    for grade in curriculum.values():
+        topics = grade.get('topics') if isinstance(grade, dict) else None
+        if not isinstance(topics, dict):
+            continue
+        for topic in topics.values():
+            if not isinstance(topic, dict):
+                continue
+            for it in topic.get('vocab') or []:
+                if isinstance(it, dict) and it.get('en') and it.get('vi'):
+                    add(it['vi'], 'en', it['en'])
+                    add(it['en'], 'vi', it['vi'])
+            for it in topic.get('grammar') or []:
+                if isinstance(it, dict) and it.get('prompt_vi') and it.get('answer'):
+                    add(it['prompt_vi'], 'en', it['answer'])
+                    add(it['answer'], 'vi', it['prompt_vi'])
+
+    for vi, en in FIXED_TRANSLATIONS.items():
+        lexicon[(_lexicon_key(vi), 'en')] = en
+    return lexicon
+
+
+def _get_bilingual_lexicon() -> dict[tuple[str, str], str]:
+    snapshot = _CURRICULUM_COMPILED
+    if snapshot.lexicon is None:
+        with _BILINGUAL_LEXICON_LOCK:
+            if snapshot.lexicon is None:
+                snapshot.lexicon = _build_bilingual_lexicon(snapshot.data)
+    return snapshot.lexicon
+
+
+def _lexicon_translate(text: str, dest: str) -> str | None:
+    return _get_bilingual_lexicon().get((_lexicon_key(text), dest))
+
+
+def _translate_without_network(t: str, dest: str) -> str | None:
+    """Dịch bằng từ điển cứng, từ điển giáo trình hoặc cache; None nếu phải gọi dịch vụ ngoài."""
+    # Từ điển cứng cho vài câu ngắn hay gặp
+    if dest == 'en' and t.lower() in FIXED_TRANSLATIONS:
+        return FIXED_TRANSLATIONS[t.lower()]
+
+    # Từ/câu đã có trong giáo trình: dịch ngay, không cần gọi mạng
+    local = _lexicon_translate(t, dest)
+    if local:
+        return local
+
+    cached = _translation_cache_get((t.lower(), dest))
+    if isinstance(cached, str) and cached:
+        return cached
+    return None
+
 
 def perform_translation(text, dest_lang):
     """Dịch text sang ngôn ngữ đích (vi/en) bằng deep-translator.
@@ -67,25 +851,81 @@ def perform_translation(text, dest_lang):
         return ''
     if dest not in ['vi', 'en']:
         dest = 'vi'
-
-    # Từ điển cứng cho vài câu ngắn hay gặp
-    if dest == 'en' and t.lower() in FIXED_TRANSLATIONS:
-        return FIXED_TRANSLATIONS[t.lower()]
-
-    cache_key = (t.lower(), dest)
+    return _translate_prepared(t, dest, _translate_without_network(t, dest))
+
+
+def _translate_prepared(t: str, dest: str, local: str | None) -> str:
+    """Phần còn lại của perform_translation khi người gọi đã chuẩn hoá t/dest và đã tra
+    _translate_without_network(t, dest) (local; None nếu phải gọi dịch vụ ngoài) -> không tra lại lần 2."""
+    with _span('perform_translation', dest=dest) as span:
+        if local:
+            span.set(source='local')
+            return local
+
+        cache_key = (t.lower(), dest)
+        # Dịch vụ dịch đang lỗi liên tục -> báo ngay, không để thread chat phải chờ
+        if _TRANSLATOR_DEP.is_open():
+            span.set(source='circuit_open')
+            return "Robo tạm thời chưa dịch được câu mới, bé thử lại sau ít phút nhé."
+        failed = _translation_failure_get(cache_key)
+        if failed is not None:
+            span.set(source='recent_failure')
+            return failed
+
+        span.set(source='remote')
+        try:
+            translated = _TRANSLATION_FLIGHT.do(cache_key, _translate_remote, t, dest)
+            if not translated:
+                failed = "Robo chưa dịch được câu này, bé thử lại nhé."
+                _translation_failure_put(cache_key, failed)
+                return failed
+            return translated
+        except _CircuitOpenError:
+            span.set(source='circuit_open')
+            return "Robo tạm thời chưa dịch được câu mới, bé thử lại sau ít phút nhé."
+        except Exception as e:
+            _mark_span_error(e)
+            failed = "Lỗi kết nối server dịch."
+            _translation_failure_put(cache_key, failed)
+            return failed
+
+
+_TRANSLATORS: dict[str, object] = {}
+_TRANSLATORS_LOCK = threading.Lock()
+
+
+def _get_translator(dest: str):
+    """Tái sử dụng 1 đối tượng GoogleTranslator cho mỗi ngôn ngữ đích."""
+    translator = _TRANSLATORS.get(dest)
+    if translator is not None:
+        return translator
+    with _TRANSLATORS_LOCK:
+        translator = _TRANSLATORS.get(dest)
+        if translator is None:
+            from deep_translator import GoogleTranslator  # type: ignore
+
+            translator = GoogleTranslator(source='auto', target=dest)
+            _TRANSLATORS[dest] = translator
+        return translator
+
+
+def _translate_remote(text: str, dest: str) -> str:
+    """Gọi GoogleTranslator (qua singleflight + breaker/timeout) và ghi cache nếu dịch được."""
+    cache_key = (text.lower(), dest)
     cached = _translation_cache_get(cache_key)
     if isinstance(cached, str) and cached:
         return cached
-
-    try:
-        translated = GoogleTranslator(source='auto', target=dest).translate(t)
-        translated = '' if translated is None else str(translated).strip()
-        if not translated:
-            return "Robo chưa dịch được câu này, bé thử lại nhé."
+    with _stage('translation', dest=dest, chars=len(text)):
+        translated = _TRANSLATOR_DEP.call(_get_translator(dest).translate, text)
+    translated = '' if translated is None else str(translated).strip()
+    if translated:
         _translation_cache_put(cache_key, translated)
-        return translated
-    except Exception:
-        return "Lỗi kết nối server dịch."
+    return translated
+
+
+@app.route('/api/dependencies')
+def dependencies_api():
+    return jsonify({dep.name: dep.stats() for dep in _OUTBOUND_DEPENDENCIES})
 
 
 def _normalize_key(value):
@@ -103,9 +943,10 @@ def _load_history():
     try:
         if not os.path.exists(_HISTORY_FILE):
             return []
-        with _HISTORY_LOCK:
+        with _HISTORY_LOCK, _stage('history_load') as span:
             with open(_HISTORY_FILE, 'r', encoding='utf-8') as f:
                 data = json.load(f)
+            span.set(records=len(data) if isinstance(data, list) else 0)
         return data if isinstance(data, list) else []
     except Exception:
         return []
@@ -118,7 +959,7 @@ def _write_history(history):
         folder = os.path.dirname(_HISTORY_FILE) or '.'
         os.makedirs(folder, exist_ok=True)
         tmp_path = _HISTORY_FILE + '.tmp'
-        with _HISTORY_LOCK:
+        with _HISTORY_LOCK, _stage('history_write', records=len(history)):
             with open(tmp_path, 'w', encoding='utf-8') as f:
                 json.dump(history, f, ensure_ascii=False, indent=2)
             os.replace(tmp_path, _HISTORY_FILE)
@@ -127,7 +968,168 @@ def _write_history(history):
 
 
 # --- Caches / lazy-loaded tools ---
-PHONETIC_CACHE: dict[str, str] = {}
+class _PhoneticCache:
+    """Cache phiên âm có giới hạn kích thước (LRU), TTL và lưu xuống đĩa (JSON snapshot).
+
+    - Tra được IPA: giữ lâu (ttl).
+    - Tra thất bại (''): chỉ giữ ngắn (negative_ttl) để lỗi mạng tạm thời không che mất IPA mãi mãi.
+    - put() không ghi đĩa: thread nền ghi mỗi save_interval giây (và lúc thoát), gộp với file
+      hiện có để các worker prefork dùng chung 1 file không ghi đè mục của nhau.
+    """
+
+    def __init__(self, path: str, max_size: int, ttl: float, negative_ttl: float, save_interval: float):
+        self.path = path
+        self.max_size = max(10, max_size)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.save_interval = save_interval
+        self._data: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saver: threading.Thread | None = None
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> str | None:
+        """Trả về phiên âm ('' nếu đã biết là không có), hoặc None nếu chưa có/hết hạn."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expires_at = item
+            if expires_at <= time.time():
+                del self._data[key]
+                self._dirty = True
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            if value:
+                self.hits += 1
+            else:
+                self.negative_hits += 1
+            return value
+
+    def peek(self, key: str) -> str | None:
+        """Như get() nhưng không tính vào hits/misses và không đổi thứ tự LRU (dùng cho prefetch)."""
+        with self._lock:
+            item = self._data.get(key)
+        if item is None or item[1] <= time.time():
+            return None
+        return item[0]
+
+    def put(self, key: str, value: str) -> None:
+        value = '' if value is None else str(value)
+        ttl = self.ttl if value else self.negative_ttl
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            self._dirty = True
+
+    def _read_file(self) -> list[tuple[str, str, float]]:
+        """Các mục còn hạn trong file snapshot (file thiếu/hỏng -> [])."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+        except (OSError, ValueError):
+            return []
+        entries = raw.get('entries') if isinstance(raw, dict) else None
+        if not isinstance(entries, list):
+            return []
+        now = time.time()
+        out = []
+        for it in entries:
+            if not isinstance(it, list) or len(it) != 3:
+                continue
+            key, value, expires_at = it
+            if not isinstance(key, str) or not isinstance(value, str):
+                continue
+            if not isinstance(expires_at, (int, float)) or expires_at <= now:
+                continue
+            out.append((key, value, float(expires_at)))
+        return out
+
+    def load(self) -> None:
+        entries = self._read_file()
+        with self._lock:
+            for key, value, expires_at in entries:
+                self._data[key] = (value, expires_at)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            mine = list(self._data.items())
+            self._dirty = False
+        try:
+            # Gộp với file hiện có (có thể do worker khác vừa ghi): cùng key -> giữ mục hết hạn muộn hơn
+            merged: "OrderedDict[str, tuple[str, float]]" = OrderedDict(
+                (key, (value, expires_at)) for key, value, expires_at in self._read_file()
+            )
+            for key, item in mine:
+                other = merged.pop(key, None)
+                merged[key] = item if other is None or item[1] >= other[1] else other
+            while len(merged) > self.max_size:
+                merged.popitem(last=False)
+            entries = [[k, v, exp] for k, (v, exp) in merged.items()]
+            folder = os.path.dirname(self.path) or '.'
+            os.makedirs(folder, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': 1, 'entries': entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            with self._lock:
+                self._dirty = True
+
+    def start_saver(self) -> None:
+        if self.save_interval <= 0 or (self._saver is not None and self._saver.is_alive()):
+            return
+
+        def run():
+            while True:
+                time.sleep(self.save_interval)
+                self.save()
+
+        self._saver = threading.Thread(target=run, name='phonetic-cache-saver', daemon=True)
+        self._saver.start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'evictions': self.evictions,
+                'hit_ratio': round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+PHONETIC_CACHE = _PhoneticCache(
+    os.getenv('ROBO_PHONETIC_CACHE_FILE', os.path.join(os.path.dirname(__file__), 'phonetic_cache.json')),
+    max_size=int(os.getenv('ROBO_PHONETIC_CACHE_MAX', '5000')),
+    ttl=float(os.getenv('ROBO_PHONETIC_TTL', str(30 * 24 * 3600))),
+    negative_ttl=float(os.getenv('ROBO_PHONETIC_NEGATIVE_TTL', '600')),
+    save_interval=float(os.getenv('ROBO_PHONETIC_SAVE_INTERVAL', '30')),
+)
+PHONETIC_CACHE.load()
+atexit.register(PHONETIC_CACHE.save)
 
 _AI_MODEL = None
 _AI_UTIL = None
@@ -160,17 +1162,21 @@ def _get_ai_model_and_util():
     with _AI_LOCK:
         if _AI_MODEL is not None and _AI_UTIL is not None:
             return _AI_MODEL, _AI_UTIL
-        try:
-            from sentence_transformers import SentenceTransformer, util as st_util  # type: ignore
+        with _span('model_load') as span:
+            try:
+                from sentence_transformers import SentenceTransformer, util as st_util  # type: ignore
 
-            model_name = os.getenv('ROBO_ST_MODEL', 'all-MiniLM-L6-v2')
-            _AI_MODEL = SentenceTransformer(model_name)
-            _AI_UTIL = st_util
-            return _AI_MODEL, _AI_UTIL
-        except Exception:
-            _AI_MODEL = _FallbackSTModel()
-            _AI_UTIL = _FallbackSTUtil()
-            return _AI_MODEL, _AI_UTIL
+                model_name = os.getenv('ROBO_ST_MODEL', 'all-MiniLM-L6-v2')
+                _AI_MODEL = SentenceTransformer(model_name)
+                _AI_UTIL = st_util
+                span.set(model=model_name)
+                return _AI_MODEL, _AI_UTIL
+            except Exception as e:
+                _mark_span_error(e)
+                _AI_MODEL = _FallbackSTModel()
+                _AI_UTIL = _FallbackSTUtil()
+                span.set(model='fallback')
+                return _AI_MODEL, _AI_UTIL
 
 
 _GRAMMAR_TOOL = None
@@ -185,15 +1191,17 @@ def _get_grammar_tool():
     with _GRAMMAR_LOCK:
         if _GRAMMAR_TOOL is not None:
             return _GRAMMAR_TOOL
-        try:
-            import language_tool_python  # type: ignore
+        with _span('languagetool_load'):
+            try:
+                import language_tool_python  # type: ignore
 
-            lang = os.getenv('ROBO_LANGUAGETOOL_LANG', 'en-US')
-            _GRAMMAR_TOOL = language_tool_python.LanguageTool(lang)
-            return _GRAMMAR_TOOL
-        except Exception:
-            _GRAMMAR_TOOL = None
-            return None
+                lang = os.getenv('ROBO_LANGUAGETOOL_LANG', 'en-US')
+                _GRAMMAR_TOOL = language_tool_python.LanguageTool(lang)
+                return _GRAMMAR_TOOL
+            except Exception as e:
+                _mark_span_error(e)
+                _GRAMMAR_TOOL = None
+                return None
 
 
 def _has_been_correct_before(question_id=None, mode=None, question=None):
@@ -207,7 +1215,7 @@ def _has_been_correct_before(question_id=None, mode=None, question=None):
             continue
 
         rec_result = rec.get('result')
-        if rec_result != 'Đúng':
+        if rec_result != 'Đúng' or rec.get('degraded'):
             continue
 
         rec_qid = _normalize_key(rec.get('question_id'))
@@ -226,16 +1234,7 @@ def _has_been_correct_before(question_id=None, mode=None, question=None):
     return False
 
 
-def save_to_history(mode, question, user_ans, score, is_correct, *, question_id=None, base_score=None, counted=None, context=None):
-    """Hàm lưu kết quả học tập vào file JSON
-
-    Quy ước mới:
-    - score: điểm được TÍNH (0 nếu câu đã đúng trước đó)
-    - base_score: điểm thô/AI chấm (để hiển thị, không nhất thiết được tính)
-    - counted: True/False nếu lần này có tính điểm
-    - question_id: khóa định danh ổn định cho 1 câu hỏi
-    - context: thông tin ngữ cảnh (grade/topic/category/item)
-    """
+def _history_record(mode, question, user_ans, score, is_correct, *, question_id=None, base_score=None, counted=None, context=None, degraded=False):
     record = {
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "mode": mode,
@@ -248,49 +1247,148 @@ def save_to_history(mode, question, user_ans, score, is_correct, *, question_id=
         "counted": counted,
         "result": "Đúng" if is_correct else "Sai",
     }
+    if degraded:
+        # Chấm nhanh theo chữ lúc quá tải: không dùng để tính "đã đúng trước đó" / so điểm
+        record["degraded"] = True
+    return record
+
+
+def save_to_history(mode, question, user_ans, score, is_correct, *, question_id=None, base_score=None, counted=None, context=None):
+    """Hàm lưu kết quả học tập vào file JSON
+
+    Quy ước mới:
+    - score: điểm được TÍNH (0 nếu câu đã đúng trước đó)
+    - base_score: điểm thô/AI chấm (để hiển thị, không nhất thiết được tính)
+    - counted: True/False nếu lần này có tính điểm
+    - question_id: khóa định danh ổn định cho 1 câu hỏi
+    - context: thông tin ngữ cảnh (grade/topic/category/item)
+    """
+    record = _history_record(
+        mode, question, user_ans, score, is_correct,
+        question_id=question_id, base_score=base_score, counted=counted, context=context,
+    )
 
     history = _load_history()
     history.append(record)
     _write_history(history)
 
 
+# Bản ghi của request bị chấm nhanh (quá tải) không ghi ngay trong request:
+# gom lại, 1 thread riêng ghi theo lô (1 lần đọc + 1 lần ghi file cho cả lô).
+_DEFERRED_HISTORY: list[dict] = []
+_DEFERRED_HISTORY_LOCK = threading.Lock()
+_HISTORY_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history-writer')
+
+
+def _flush_deferred_history() -> None:
+    with _DEFERRED_HISTORY_LOCK:
+        batch = _DEFERRED_HISTORY[:]
+        _DEFERRED_HISTORY.clear()
+    if not batch:
+        return
+    history = _load_history()
+    history.extend(batch)
+    _write_history(history)
+
+
+def save_to_history_deferred(mode, question, user_ans, is_correct, *, question_id=None, base_score=None, context=None):
+    """Ghi lịch sử cho lần chấm nhanh: không tính điểm, đánh dấu degraded, ghi ở thread nền."""
+    record = _history_record(
+        mode, question, user_ans, 0, is_correct,
+        question_id=question_id, base_score=base_score, counted=False, context=context, degraded=True,
+    )
+    with _DEFERRED_HISTORY_LOCK:
+        _DEFERRED_HISTORY.append(record)
+        schedule = len(_DEFERRED_HISTORY) == 1
+    if schedule:
+        _HISTORY_WRITER.submit(_flush_deferred_history)
+
+
+# Kết nối HTTPS keep-alive tới dictionaryapi.dev, mỗi thread giữ 1 kết nối riêng
+# (không phải bắt tay TLS lại cho từng từ).
+_DICTIONARY_API_HOST = 'api.dictionaryapi.dev'
+_DICTIONARY_API_TIMEOUT = float(os.getenv('ROBO_PHONETIC_TIMEOUT', '5'))
+_DICTIONARY_API_LOCAL = threading.local()
+
+
+def _dictionary_api_get(path: str) -> tuple[int, bytes]:
+    """GET qua kết nối được tái sử dụng của thread hiện tại. Trả về (status, body)."""
+    import http.client
+
+    for attempt in range(2):
+        conn = getattr(_DICTIONARY_API_LOCAL, 'conn', None)
+        if conn is None:
+            conn = http.client.HTTPSConnection(_DICTIONARY_API_HOST, timeout=_DICTIONARY_API_TIMEOUT)
+            _DICTIONARY_API_LOCAL.conn = conn
+        try:
+            conn.request('GET', path, headers={'Accept': 'application/json', 'Connection': 'keep-alive'})
+            resp = conn.getresponse()
+            body = resp.read()
+            if resp.will_close:
+                conn.close()
+                _DICTIONARY_API_LOCAL.conn = None
+            return resp.status, body
+        except (http.client.HTTPException, OSError):
+            # Kết nối cũ bị server đóng -> mở lại 1 lần
+            conn.close()
+            _DICTIONARY_API_LOCAL.conn = None
+            if attempt:
+                raise
+    return 0, b''
+
+
+def _phonetic_candidates(word: str) -> list[str]:
+    # API này thường không hỗ trợ cụm từ; thử nguyên cụm trước, nếu fail thì thử từ đầu
+    out = []
+    for w in (word.strip(), word.strip().split(' ')[0]):
+        w = w.strip()
+        if w:
+            out.append(w)
+    return out
+
+
+def _parse_dictionary_phonetic(body: bytes) -> str | None:
+    """Lấy phiên âm từ JSON trả về của dictionaryapi.dev (None nếu không có)."""
+    data = json.loads(body.decode('utf-8', errors='ignore'))
+    if not isinstance(data, list) or not data:
+        return None
+
+    entry = data[0] if isinstance(data[0], dict) else None
+    if not entry:
+        return None
+
+    # Ưu tiên field 'phonetic'
+    phonetic = entry.get('phonetic')
+    if isinstance(phonetic, str) and phonetic.strip():
+        return phonetic.strip()
+
+    # Nếu không có, thử trong phonetics[]
+    phonetics = entry.get('phonetics')
+    if isinstance(phonetics, list):
+        for p in phonetics:
+            if not isinstance(p, dict):
+                continue
+            text = p.get('text')
+            if isinstance(text, str) and text.strip():
+                return text.strip()
+    return None
+
+
 def _fetch_phonetic_from_dictionary_api(word: str):
     """Lấy phiên âm/IPA từ dictionaryapi.dev. Trả về chuỗi hoặc '' nếu không có."""
     if not word:
         return ''
 
-    # API này thường không hỗ trợ cụm từ; thử nguyên cụm trước, nếu fail thì thử từ đầu
-    candidates = [word.strip(), word.strip().split(' ')[0]]
-    for w in candidates:
-        w = w.strip()
-        if not w:
-            continue
+    for w in _phonetic_candidates(word):
         try:
-            url = f"https://api.dictionaryapi.dev/api/v2/entries/en/{urllib.parse.quote(w)}"
-            with urllib.request.urlopen(url, timeout=5) as resp:
-                raw = resp.read().decode('utf-8', errors='ignore')
-            data = json.loads(raw)
-            if not isinstance(data, list) or not data:
+            with _stage('phonetic_fetch', word=w) as span:
+                status, body = _DICTIONARY_DEP.call(_dictionary_api_get, f"/api/v2/entries/en/{urllib.parse.quote(w)}")
+                span.set(status=status)
+            if status != 200:
                 continue
-
-            entry = data[0] if isinstance(data[0], dict) else None
-            if not entry:
-                continue
-
-            # Ưu tiên field 'phonetic'
-            phonetic = entry.get('phonetic')
-            if isinstance(phonetic, str) and phonetic.strip():
-                return phonetic.strip()
-
-            # Nếu không có, thử trong phonetics[]
-            phonetics = entry.get('phonetics')
-            if isinstance(phonetics, list):
-                for p in phonetics:
-                    if not isinstance(p, dict):
-                        continue
-                    text = p.get('text')
-                    if isinstance(text, str) and text.strip():
-                        return text.strip()
+            phonetic = _parse_dictionary_phonetic(body)
+            if phonetic:
+                return phonetic
         except Exception:
             continue
 
@@ -304,562 +1402,478 @@ def phonetic_api():
     if not word:
         return jsonify({"phonetic": ""})
 
+    return jsonify({"phonetic": _get_phonetic(word)})
+
+
+class _IPADictionary:
+    """Từ điển IPA offline (SQLite, tạo bằng tools/build_ipa_dict.py), mở lười ở chế độ chỉ đọc.
+
+    Thiếu file hoặc lỗi khi tra thì available() = False và mọi lần tra trả về None, nhưng chỉ trong
+    retry_interval giây: sau đó kiểm tra lại (file được build/chép vào sau, lỗi I/O tạm thời).
+    """
+
+    def __init__(self, path: str, retry_interval: float = 60.0):
+        self.path = path
+        self.retry_interval = retry_interval
+        self._local = threading.local()
+        self._available = False
+        self._retry_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def available(self) -> bool:
+        if self._available:
+            return True
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        self._available = os.path.exists(self.path)
+        if not self._available:
+            self._retry_at = now + self.retry_interval
+        return self._available
+
+    def _disable(self) -> None:
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._available = False
+        self._retry_at = time.monotonic() + self.retry_interval
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            uri = 'file:' + urllib.parse.quote(os.path.abspath(self.path)) + '?mode=ro&immutable=1'
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, text: str) -> str | None:
+        """Trả về '/ipa/' cho từ hoặc cụm từ (mọi từ phải có trong từ điển), ngược lại None."""
+        if not self.available():
+            return None
+        words = re.findall(r"[a-z']+", _normalize_key(text))
+        if not words:
+            return None
+        try:
+            cur = self._conn()
+            parts = []
+            for w in words:
+                row = cur.execute('SELECT ipa FROM ipa WHERE word = ?', (w,)).fetchone()
+                if not row:
+                    self.misses += 1
+                    return None
+                parts.append(row[0])
+        except Exception:
+            self._disable()
+            return None
+        self.hits += 1
+        return '/' + ' '.join(parts) + '/'
+
+    def stats(self) -> dict:
+        return {'available': self.available(), 'hits': self.hits, 'misses': self.misses}
+
+
+_IPA_DICT = _IPADictionary(
+    os.getenv('ROBO_IPA_DICT_FILE', os.path.join(os.path.dirname(__file__), 'data', 'ipa_dict.sqlite')),
+    retry_interval=float(os.getenv('ROBO_IPA_DICT_RETRY', '60')),
+)
+
+
+def _get_phonetic(word: str) -> str:
+    """Tra phiên âm: từ điển offline trước, sau đó cache, cuối cùng mới gọi dictionaryapi.dev.
+
+    Các lần gọi API trùng nhau đang chạy sẽ dùng chung 1 lần gọi.
+    """
     key = _normalize_key(word)
-    if key in PHONETIC_CACHE:
-        return jsonify({"phonetic": PHONETIC_CACHE[key]})
+    if not key:
+        return ''
+    local = _IPA_DICT.lookup(key)
+    if local:
+        return local
+    cached = PHONETIC_CACHE.get(key)
+    if cached is not None:
+        return cached
+    return _PHONETIC_FLIGHT.do(key, _fetch_and_cache_phonetic, key, word)
 
+
+def _get_phonetic_uncached(key: str, word: str) -> str:
+    """Phần sau bước tra cache của _get_phonetic, cho từ mà người gọi đã tra (và đã đếm miss) rồi.
+
+    Chỉ peek() lại cache (không đếm thêm) phòng khi request khác vừa tra xong từ này.
+    """
+    cached = PHONETIC_CACHE.peek(key)
+    if cached is not None:
+        return cached
+    return _PHONETIC_FLIGHT.do(key, _fetch_and_cache_phonetic, key, word)
+
+
+def _fetch_and_cache_phonetic(key: str, word: str) -> str:
     phonetic = _fetch_phonetic_from_dictionary_api(word)
-    PHONETIC_CACHE[key] = phonetic
-    return jsonify({"phonetic": phonetic})
-# --- 1. CƠ SỞ DỮ LIỆU GIÁO TRÌNH (ĐÃ CẬP NHẬT ĐỦ 5 LỚP) ---
-CURRICULUM = {
-    "lop1": {
-        "title": "Lớp 1",
-        "topics": {
-            "playground": {
-                "title": "Sân chơi (School playground)",
-                "vocab": [
-                    {"en": "Slide", "vi": "Cầu trượt", "img": "🛝"},
-                    {"en": "Swing", "vi": "Xích đu", "img": "🎠"},
-                    {"en": "Ball", "vi": "Quả bóng", "img": "⚽"},
-                    {"en": "Run", "vi": "Chạy", "img": "🏃"},
-                    {"en": "Seesaw", "vi": "Bập bênh", "img": "🪀"},
-                    {"en": "Play", "vi": "Chơi", "img": "🎮"},
-                ],
-                "quiz": [
-                    {"question": "Cái gì dùng để trượt xuống?", "options": ["Swing", "Slide", "Ball"], "answer": "Slide"},
-                    {"question": "Hành động chạy tiếng Anh là?", "options": ["Run", "Sit", "Stand"], "answer": "Run"},
-                    {"question": "Cái gì dùng để đu đưa?", "options": ["Swing", "Slide", "Ball"], "answer": "Swing"},
-                    {"question": "'Play' nghĩa là gì?", "options": ["Chạy", "Chơi", "Ngủ"], "answer": "Chơi"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Đây là cầu trượt.", "answer": "This is a slide."},
-                    {"prompt_vi": "Đây là quả bóng.", "answer": "This is a ball."},
-                    {"prompt_vi": "Em chạy ở sân chơi.", "answer": "I run in the playground."},
-                ],
-            },
-            "dining_room": {
-                "title": "Phòng ăn (Dining room)",
-                "vocab": [
-                    {"en": "Table", "vi": "Cái bàn", "img": "🪑"},
-                    {"en": "Spoon", "vi": "Cái thìa", "img": "🥄"},
-                    {"en": "Plate", "vi": "Cái đĩa", "img": "🍽️"},
-                    {"en": "Eat", "vi": "Ăn", "img": "😋"},
-                    {"en": "Fork", "vi": "Cái nĩa", "img": "🍴"},
-                    {"en": "Cup", "vi": "Cái cốc", "img": "🥤"},
-                ],
-                "quiz": [
-                    {"question": "Vật dùng để xúc thức ăn?", "options": ["Table", "Spoon", "Plate"], "answer": "Spoon"},
-                    {"question": "Cái cốc tiếng Anh là gì?", "options": ["Cup", "Plate", "Fork"], "answer": "Cup"},
-                    {"question": "Vật dùng để xiên thức ăn?", "options": ["Fork", "Spoon", "Table"], "answer": "Fork"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Đây là cái thìa.", "answer": "This is a spoon."},
-                    {"prompt_vi": "Đây là cái đĩa.", "answer": "This is a plate."},
-                    {"prompt_vi": "Em ăn.", "answer": "I eat."},
-                ],
-            },
-            "market": {
-                "title": "Chợ (Street market)",
-                "vocab": [
-                    {"en": "Apple", "vi": "Quả táo", "img": "🍎"},
-                    {"en": "Banana", "vi": "Quả chuối", "img": "🍌"},
-                    {"en": "Market", "vi": "Chợ", "img": "🏪"},
-                    {"en": "Buy", "vi": "Mua", "img": "🛍️"},
-                    {"en": "Orange", "vi": "Quả cam", "img": "🍊"},
-                    {"en": "Sell", "vi": "Bán", "img": "💰"},
-                ],
-                "quiz": [
-                    {"question": "Quả gì màu vàng và cong?", "options": ["Apple", "Banana", "Market"], "answer": "Banana"},
-                    {"question": "Quả cam tiếng Anh là gì?", "options": ["Orange", "Apple", "Banana"], "answer": "Orange"},
-                    {"question": "'Buy' nghĩa là gì?", "options": ["Mua", "Bán", "Chạy"], "answer": "Mua"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Đây là chợ.", "answer": "This is a market."},
-                    {"prompt_vi": "Tớ mua một quả táo.", "answer": "I buy an apple."},
-                    {"prompt_vi": "Quả chuối màu vàng.", "answer": "The banana is yellow."},
-                ],
-            },
-            "bedroom": {
-                "title": "Phòng ngủ (Bedroom)",
-                "vocab": [
-                    {"en": "Bed", "vi": "Cái giường", "img": "🛌"},
-                    {"en": "Lamp", "vi": "Đèn ngủ", "img": "💡"},
-                    {"en": "Pillow", "vi": "Cái gối", "img": "🛌"},
-                    {"en": "Sleep", "vi": "Ngủ", "img": "😴"},
-                    {"en": "Blanket", "vi": "Cái chăn", "img": "🛏️"},
-                    {"en": "Wake up", "vi": "Thức dậy", "img": "⏰"},
-                ],
-                "quiz": [
-                    {"question": "Chúng ta ngủ ở đâu?", "options": ["Table", "Bed", "Lamp"], "answer": "Bed"},
-                    {"question": "'Sleep' nghĩa là gì?", "options": ["Ngủ", "Ăn", "Chạy"], "answer": "Ngủ"},
-                    {"question": "Cái chăn tiếng Anh là gì?", "options": ["Blanket", "Lamp", "Pillow"], "answer": "Blanket"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Đây là cái gối.", "answer": "This is a pillow."},
-                    {"prompt_vi": "Tớ ngủ trên giường.", "answer": "I sleep on the bed."},
-                    {"prompt_vi": "Tớ thức dậy.", "answer": "I wake up."},
-                ],
-            },
-            "fish_shop": {
-                "title": "Cửa hàng cá & khoai (Fish & Chip shop)",
-                "vocab": [
-                    {"en": "Fish", "vi": "Con cá", "img": "🐟"},
-                    {"en": "Chips", "vi": "Khoai tây chiên", "img": "🍟"},
-                    {"en": "Chicken", "vi": "Thịt gà", "img": "🍗"},
-                    {"en": "Shop", "vi": "Cửa hàng", "img": "🏠"},
-                    {"en": "Salt", "vi": "Muối", "img": "🧂"},
-                    {"en": "Menu", "vi": "Thực đơn", "img": "📋"},
-                ],
-                "quiz": [
-                    {"question": "Món khoai tây chiên tiếng Anh là?", "options": ["Fish", "Chips", "Chicken"], "answer": "Chips"},
-                    {"question": "Muối tiếng Anh là gì?", "options": ["Salt", "Shop", "Fish"], "answer": "Salt"},
-                    {"question": "'Shop' nghĩa là gì?", "options": ["Cửa hàng", "Con cá", "Khoai tây"], "answer": "Cửa hàng"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Tớ muốn cá và khoai tây chiên.", "answer": "I want fish and chips."},
-                    {"prompt_vi": "Đây là cửa hàng.", "answer": "This is a shop."},
-                    {"prompt_vi": "Gà ngon.", "answer": "The chicken is tasty."},
-                ],
-            }
-        }
-    },
-    "lop2": {
-        "title": " Lớp 2 ",
-        "topics": {
-            "birthday": {
-                "title": "Tiệc sinh nhật (Birthday party)",
-                "vocab": [
-                    {"en": "Cake", "vi": "Bánh kem", "img": "🎂"},
-                    {"en": "Balloon", "vi": "Bóng bay", "img": "🎈"},
-                    {"en": "Gift", "vi": "Quà tặng", "img": "🎁"},
-                    {"en": "Candle", "vi": "Nến", "img": "🕯️"},
-                    {"en": "Party", "vi": "Bữa tiệc", "img": "🥳"},
-                    {"en": "Sing", "vi": "Hát", "img": "🎶"},
-                ],
-                "quiz": [
-                    {"question": "Thứ gì thắp sáng trên bánh kem?", "options": ["Balloon", "Candle", "Gift"], "answer": "Candle"},
-                    {"question": "Tiệc sinh nhật tiếng Anh là?", "options": ["Birthday party", "Backyard", "Farm"], "answer": "Birthday party"},
-                    {"question": "'Gift' nghĩa là gì?", "options": ["Quà tặng", "Bóng bay", "Ngọn nến"], "answer": "Quà tặng"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Hôm nay là sinh nhật của tớ.", "answer": "Today is my birthday."},
-                    {"prompt_vi": "Tớ có một cái bánh.", "answer": "I have a cake."},
-                    {"prompt_vi": "Chúng ta hát chúc mừng sinh nhật.", "answer": "We sing Happy Birthday."},
-                ],
-            },
-            "backyard": {
-                "title": "Sân sau (Backyard)",
-                "vocab": [
-                    {"en": "Tree", "vi": "Cái cây", "img": "🌳"},
-                    {"en": "Grass", "vi": "Cỏ", "img": "🌿"},
-                    {"en": "Flower", "vi": "Bông hoa", "img": "🌸"},
-                    {"en": "Kite", "vi": "Cái diều", "img": "🪁"},
-                    {"en": "Bird", "vi": "Con chim", "img": "🐦"},
-                    {"en": "Garden", "vi": "Khu vườn", "img": "🪴"},
-                ],
-                "quiz": [
-                    {"question": "Cái gì mọc xanh trên mặt đất?", "options": ["Tree", "Grass", "Kite"], "answer": "Grass"},
-                    {"question": "Cái diều tiếng Anh là gì?", "options": ["Kite", "Tree", "Flower"], "answer": "Kite"},
-                    {"question": "'Grass' nghĩa là gì?", "options": ["Cỏ", "Cây", "Con chim"], "answer": "Cỏ"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Có một cái cây trong sân.", "answer": "There is a tree in the backyard."},
-                    {"prompt_vi": "Đây là bông hoa.", "answer": "This is a flower."},
-                    {"prompt_vi": "Con chim ở trong vườn.", "answer": "The bird is in the garden."},
-                ],
-            },
-            "countryside": {
-                "title": "Vùng quê (Countryside)",
-                "vocab": [
-                    {"en": "River", "vi": "Dòng sông", "img": "🌊"},
-                    {"en": "Mountain", "vi": "Núi", "img": "⛰️"},
-                    {"en": "Field", "vi": "Cánh đồng", "img": "🌾"},
-                    {"en": "Road", "vi": "Con đường", "img": "🛣️"},
-                    {"en": "Village", "vi": "Ngôi làng", "img": "🏘️"},
-                    {"en": "Bridge", "vi": "Cây cầu", "img": "🌉"},
-                ],
-                "quiz": [
-                    {"question": "Nơi nào rất cao?", "options": ["River", "Mountain", "Field"], "answer": "Mountain"},
-                    {"question": "'River' nghĩa là gì?", "options": ["Dòng sông", "Núi", "Con đường"], "answer": "Dòng sông"},
-                    {"question": "Cánh đồng tiếng Anh là gì?", "options": ["Field", "Road", "Village"], "answer": "Field"}, 
-                ],
-                "grammar": [
-                    {"prompt_vi": "Ngôi làng rất yên bình.", "answer": "The village is peaceful."},
-                    {"prompt_vi": "Có một con sông.", "answer": "There is a river."},
-                    {"prompt_vi": "Cây cầu ở gần con đường.", "answer": "The bridge is near the road."},
-                ],
-            },
-            "farm": {
-                "title": "Nông trại (On the farm)",
-                "vocab": [
-                    {"en": "Cow", "vi": "Con bò", "img": "🐄"},
-                    {"en": "Duck", "vi": "Con vịt", "img": "🦆"},
-                    {"en": "Sheep", "vi": "Con cừu", "img": "🐑"},
-                    {"en": "Horse", "vi": "Con ngựa", "img": "🐎"},
-                    {"en": "Pig", "vi": "Con heo", "img": "🐖"},
-                    {"en": "Goat", "vi": "Con dê", "img": "🐐"},
-                ],
-                "quiz": [
-                    {"question": "Con vật nào kêu 'Quác quác'?", "options": ["Cow", "Duck", "Sheep"], "answer": "Duck"},
-                    {"question": "Con bò tiếng Anh là?", "options": ["Cow", "Pig", "Goat"], "answer": "Cow"},
-                    {"question": "Con dê tiếng Anh là?", "options": ["Sheep", "Goat", "Horse"], "answer": "Goat"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Đây là con bò.", "answer": "This is a cow."},
-                    {"prompt_vi": "Con vịt ở trên nông trại.", "answer": "The duck is on the farm."},
-                    {"prompt_vi": "Tớ thấy một con heo.", "answer": "I see a pig."},
-                ],
-            },
-            "home": {
-                "title": "Ở nhà (At home)",
-                "vocab": [
-                    {"en": "Kitchen", "vi": "Nhà bếp", "img": "🍳"},
-                    {"en": "Living room", "vi": "Phòng khách", "img": "🛋️"},
-                    {"en": "Door", "vi": "Cửa ra vào", "img": "🚪"},
-                    {"en": "Window", "vi": "Cửa sổ", "img": "🪟"},
-                    {"en": "Bathroom", "vi": "Phòng tắm", "img": "🚿"},
-                    {"en": "Bedroom", "vi": "Phòng ngủ", "img": "🛏️"},
-                ],
-                "quiz": [
-                    {"question": "Nơi để nấu ăn gọi là gì?", "options": ["Kitchen", "Living room", "Door"], "answer": "Kitchen"},
-                    {"question": "Phòng khách tiếng Anh là gì?", "options": ["Living room", "Bathroom", "Bedroom"], "answer": "Living room"},
-                    {"question": "Cửa sổ tiếng Anh là gì?", "options": ["Window", "Door", "Kitchen"], "answer": "Window"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Phòng tắm sạch sẽ.", "answer": "The bathroom is clean."},
-                    {"prompt_vi": "Phòng ngủ của tôi rộng rãi.", "answer": "My bedroom is spacious."},
-                    {"prompt_vi": "Cửa ra vào mở rộng.", "answer": "The door is wide open."},
-                ],
-            }
-        }
-    },
-    "lop3": {
-        "title": "Lớp 3",
-        "topics": {
-            "hobbies": {
-                "title": "Sở thích (My hobbies)",
-                "vocab": [
-                    {"en": "Singing", "vi": "Ca hát", "img": "🎤"},
-                    {"en": "Dancing", "vi": "Nhảy múa", "img": "💃"},
-                    {"en": "Drawing", "vi": "Vẽ tranh", "img": "🎨"},
-                    {"en": "Swimming", "vi": "Bơi lội", "img": "🏊"},
-                    {"en": "Reading", "vi": "Đọc sách", "img": "📖"},
-                    {"en": "Cooking", "vi": "Nấu ăn", "img": "👩‍🍳"},
-                ],
-                "quiz": [
-                    {"question": "Hành động cầm mic hát là?", "options": ["Dancing", "Singing", "Drawing"], "answer": "Singing"},
-                    {"question": "Hành động di chuyển theo nhạc là?", "options": ["Dancing", "Cooking", "Reading"], "answer": "Dancing"},
-                    {"question": "'Drawing' nghĩa là gì?", "options": ["Vẽ tranh", "Bơi lội", "Ca hát"], "answer": "Vẽ tranh"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Tớ thích ca hát.", "answer": "I like singing."},
-                    {"prompt_vi": "Cô ấy đang nhảy múa.", "answer": "She is dancing."},
-                    {"prompt_vi": "Chúng ta cùng vẽ tranh nhé.", "answer": "Let's draw together."},
-                ]
-            },
-            "colours": {
-                "title": "Màu sắc (Colours)",
-                "vocab": [
-                    {"en": "Red", "vi": "Màu đỏ", "img": "🔴"},
-                    {"en": "Blue", "vi": "Màu xanh dương", "img": "🔵"},
-                    {"en": "Green", "vi": "Màu xanh lá", "img": "🟢"},
-                    {"en": "Yellow", "vi": "Màu vàng", "img": "🟡"},
-                    {"en": "Black", "vi": "Màu đen", "img": "⚫"},
-                    {"en": "White", "vi": "Màu trắng", "img": "⚪"},
-                ],
-                "quiz": [
-                    {"question": "Màu của bầu trời là?", "options": ["Red", "Blue", "Green"], "answer": "Blue"},
-                    {"question": "'Yellow' nghĩa là gì?", "options": ["Màu vàng", "Màu đen", "Màu trắng"], "answer": "Màu vàng"},
-                    {"question": "Màu của lá cây là?", "options": ["Green", "Red", "Blue"], "answer": "Green"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Màu đỏ là màu của quả táo.", "answer": "Red is the color of an apple."},
-                    {"prompt_vi": "Bầu trời có màu xanh dương.", "answer": "The sky is blue."},
-                    {"prompt_vi": "Lá cây có màu xanh lá.", "answer": "Leaves are green."},
-                ],
-            },
-            "break_time": {
-                "title": "Giờ ra chơi (Break time)",
-                "vocab": [
-                    {"en": "Football", "vi": "Bóng đá", "img": "⚽"},
-                    {"en": "Chess", "vi": "Cờ vua", "img": "♟️"},
-                    {"en": "Basketball", "vi": "Bóng rổ", "img": "🏀"},
-                    {"en": "Chatting", "vi": "Trò chuyện", "img": "🗣️"},
-                    {"en": "Reading", "vi": "Đọc sách", "img": "📚"},
-                    {"en": "Drawing", "vi": "Vẽ tranh", "img": "🎨"},
-                ],
-                "quiz": [
-                    {"question": "Trò chơi trí tuệ với các quân cờ?", "options": ["Football", "Chess", "Basketball"], "answer": "Chess"},
-                    {"question": "'Chatting' nghĩa là gì?", "options": ["Trò chuyện", "Đọc sách", "Vẽ tranh"], "answer": "Trò chuyện"},
-                    {"question": "Trò chơi với quả bóng tròn lớn?", "options": ["Football", "Chess", "Basketball"], "answer": "Basketball"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Tớ thích ca hát.", "answer": "I like singing."},
-                    {"prompt_vi": "Cô ấy đang nhảy múa.", "answer": "She is dancing."},
-                    {"prompt_vi": "Chúng ta cùng vẽ tranh nhé.", "answer": "Let's draw together."},
-                ],
-            },
-            "family": {
-                "title": "Gia đình (Family)",
-                "vocab": [
-                    {"en": "Father", "vi": "Bố", "img": "👨"},
-                    {"en": "Mother", "vi": "Mẹ", "img": "👩"},
-                    {"en": "Brother", "vi": "Anh/Em trai", "img": "👦"},
-                    {"en": "Sister", "vi": "Chị/Em gái", "img": "👧"},
-                    {"en": "Grandmother", "vi": "Bà", "img": "👵"},
-                    {"en": "Grandfather", "vi": "Ông", "img": "👴"},
-                ],
-                "quiz": [
-                    {"question": "Ai là người sinh ra bố hoặc mẹ?", "options": ["Sister", "Grandmother", "Brother"], "answer": "Grandmother"},
-                    {"question": "'Mother' nghĩa là gì?", "options": ["Bố", "Mẹ", "Bà"], "answer": "Mẹ"},
-                    {"question": "Điền từ còn thiếu: F_ther", "options": ["a", "o", "e"], "answer": "a"}
-                ],
-                "grammar": [
-                    {"prompt_vi": "Bố là người chăm sóc gia đình.", "answer": "Father is the one who takes care of the family."},
-                    {"prompt_vi": "Mẹ nấu ăn rất ngon.", "answer": "Mother cooks very well."},
-                    {"prompt_vi": "Anh trai đang chơi bóng đá.", "answer": "Brother is playing football."},
-                ],
-            },
-            "school": {
-                "title": "Trường học (School)",
-                "vocab": [
-                    {"en": "Teacher", "vi": "Giáo viên", "img": "👩‍🏫"},
-                    {"en": "Student", "vi": "Học sinh", "img": "🎒"},
-                    {"en": "Pencil", "vi": "Bút chì", "img": "✏️"},
-                    {"en": "Book", "vi": "Quyển sách", "img": "📚"},
-                    {"en": "Desk", "vi": "Cái bàn học", "img": "🪑"},
-                    {"en": "Classroom", "vi": "Phòng học", "img": "🏫"},
-                ],
-                "quiz": [
-                    {"question": "Vật dùng để viết là gì?", "options": ["Book", "Pencil", "Teacher"], "answer": "Pencil"},
-                    {"question": "Người dạy học gọi là?", "options": ["Student", "Teacher", "Mother"], "answer": "Teacher"},
-                    {"question": "'Desk' nghĩa là gì?", "options": ["Cái bàn học", "Quyển sách", "Phòng học"], "answer": "Cái bàn học"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Cô giáo rất tốt bụng.", "answer": "The teacher is very kind."},
-                    {"prompt_vi": "Học sinh đang học bài.", "answer": "The student is studying."},
-                    {"prompt_vi": "Tớ thích viết bằng bút chì.", "answer": "I like writing with a pencil."},
-                ],
-            }
-        }
-    },
-    "lop4": {
-        "title": "Lớp 4",
-        "topics": {
-            "food": {
-                "title": "Thức ăn (Food)",
-                "vocab": [
-                    {"en": "Rice", "vi": "Cơm", "img": "🍚"},
-                    {"en": "Noodles", "vi": "Mì", "img": "🍜"},
-                    {"en": "Vegetables", "vi": "Rau củ", "img": "🥦"},
-                    {"en": "Fruits", "vi": "Trái cây", "img": "🍎"},
-                    {"en": "Meat", "vi": "Thịt", "img": "🍖"},
-                    {"en": "Fish", "vi": "Cá", "img": "🐟"},
-                ],
-                "quiz": [
-                    {"question": "Thức ăn làm từ hạt lúa?", "options": ["Rice", "Noodles", "Fruits"], "answer": "Rice"},
-                    {"question": "'Vegetables' nghĩa là gì?", "options": ["Rau củ", "Trái cây", "Thịt"], "answer": "Rau củ"},
-                    {"question": "Thức ăn làm từ bột mì?", "options": ["Rice", "Noodles", "Fish"], "answer": "Noodles"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Tớ thích ăn cơm.", "answer": "I like eating rice."},
-                    {"prompt_vi": "Mì rất ngon.", "answer": "Noodles are delicious."},
-                    {"prompt_vi": "Rau củ tốt cho sức khỏe.", "answer": "Vegetables are good for health."},
-                ],
-            },
-            "bodies": {
-                "title": "Cơ thể (Our bodies)",
-                "vocab": [
-                    {"en": "Head", "vi": "Đầu", "img": "🙆"},
-                    {"en": "Arm", "vi": "Cánh tay", "img": "💪"},
-                    {"en": "Leg", "vi": "Chân", "img": "🦵"},
-                    {"en": "Hand", "vi": "Bàn tay", "img": "✋"},
-                    {"en": "Eye", "vi": "Mắt", "img": "👁️"},
-                    {"en": "Mouth", "vi": "Miệng", "img": "👄"},
-                ],
-                "quiz": [
-                    {"question": "Bộ phận dùng để cầm nắm?", "options": ["Head", "Leg", "Hand"], "answer": "Hand"},
-                    {"question": "'Eye' nghĩa là gì?", "options": ["Mắt", "Miệng", "Đầu"], "answer": "Mắt"},
-                    {"question": "Bộ phận dùng để đi lại?", "options": ["Arm", "Leg", "Hand"], "answer": "Leg"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Đây là cái đầu.", "answer": "This is a head."},
-                    {"prompt_vi": "Cánh tay của tôi dài.", "answer": "My arm is long."},
-                    {"prompt_vi": "Tôi dùng chân để đi bộ.", "answer": "I use my legs to walk."},
-                ],
-            },
-            "animals": {
-                "title": "Động vật (Animals)",
-                "vocab": [
-                    {"en": "Tiger", "vi": "Con hổ", "img": "🐯"},
-                    {"en": "Monkey", "vi": "Con khỉ", "img": "🐵"},
-                    {"en": "Elephant", "vi": "Con voi", "img": "🐘"},
-                    {"en": "Lion", "vi": "Sư tử", "img": "🦁"},
-                    {"en": "Giraffe", "vi": "Hươu cao cổ", "img": "🦒"},
-                    {"en": "Zebra", "vi": "Ngựa vằn", "img": "🦓"},
-                ],
-                "quiz": [
-                    {"question": "Con vật nào có vòi dài?", "options": ["Tiger", "Elephant", "Monkey"], "answer": "Elephant"},
-                    {"question": "'Lion' nghĩa là gì?", "options": ["Sư tử", "Hươu cao cổ", "Ngựa vằn"], "answer": "Sư tử"},
-                    {"question": "Con vật nào có sọc đen trắng?", "options": ["Zebra", "Tiger", "Giraffe"], "answer": "Zebra"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Con hổ sống trong rừng.", "answer": "The tiger lives in the forest."},
-                    {"prompt_vi": "Con khỉ thích ăn chuối.", "answer": "The monkey likes to eat bananas."},
-                    {"prompt_vi": "Con voi rất lớn.", "answer": "The elephant is very big."},
-                ],
-            },
-            "weather": {
-                "title": "Thời tiết (Weather)",
-                "vocab": [
-                    {"en": "Sunny", "vi": "Nắng", "img": "☀️"},
-                    {"en": "Rainy", "vi": "Mưa", "img": "🌧️"},
-                    {"en": "Windy", "vi": "Có gió", "img": "🌬️"},
-                    {"en": "Cloudy", "vi": "Nhiều mây", "img": "☁️"},
-                    {"en": "Stormy", "vi": "Bão", "img": "🌩️"},
-                    {"en": "Snowy", "vi": "Có tuyết", "img": "❄️"},
-                ],
-                "quiz": [
-                    {"question": "Khi trời có nước rơi xuống?", "options": ["Sunny", "Rainy", "Windy"], "answer": "Rainy"},
-                    {"question": "'Cloudy' nghĩa là gì?", "options": ["Nhiều mây", "Nắng", "Bão"], "answer": "Nhiều mây"},
-                    {"question": "Khi trời có tuyết rơi?", "options": ["Snowy", "Stormy", "Sunny"], "answer": "Snowy"},
-                ],
-            },
-            "sports_day": {
-                "title": "Ngày hội thể thao (Sports day)",
-                "vocab": [
-                    {"en": "Running", "vi": "Chạy đua", "img": "🏃"},
-                    {"en": "Badminton", "vi": "Cầu lông", "img": "🏸"},
-                    {"en": "Win", "vi": "Chiến thắng", "img": "🏆"},
-                    {"en": "Team", "vi": "Đội", "img": "🤝"},
-                    {"en": "Jump", "vi": "Nhảy", "img": "🤸"},
-                    {"en": "Throw", "vi": "Ném", "img": "🏋️"},
-                ],
-                "quiz": [
-                    {"question": "Môn thể thao dùng vợt và quả cầu?", "options": ["Running", "Badminton", "Team"], "answer": "Badminton"},
-                    {"question": "'Win' nghĩa là gì?", "options": ["Chiến thắng", "Nhảy", "Ném"], "answer": "Chiến thắng"},
-                    {"question": "Hành động di chuyển nhanh bằng chân?", "options": ["Jump", "Throw", "Running"], "answer": "Running"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Tớ thích chạy đua.", "answer": "I like running."},
-                    {"prompt_vi": "Chúng ta là một đội.", "answer": "We are a team."},
-                    {"prompt_vi": "Cô ấy nhảy rất cao.", "answer": "She jumps very high."},
-                ],
-            }
-        }
-    },
-    "lop5": {
-        "title": "Lớp 5",
-        "topics": {
-            "about_me": {
-                "title": "Về bản thân (All about me)",
-                "vocab": [
-                    {"en": "Name", "vi": "Tên", "img": "🏷️"},
-                    {"en": "Age", "vi": "Tuổi", "img": "🎂"},
-                    {"en": "Address", "vi": "Địa chỉ", "img": "🏠"},
-                    {"en": "Class", "vi": "Lớp học", "img": "🏫"},
-                    {"en": "Hobby", "vi": "Sở thích", "img": "🎨"},
-                    {"en": "Favorite", "vi": "Yêu thích", "img": "❤️"},
-                ],
-                "quiz": [
-                    {"question": "Từ dùng để hỏi bạn bao nhiêu tuổi?", "options": ["Name", "Age", "Address"], "answer": "Age"},
-                    {"question": "'Hobby' nghĩa là gì?", "options": ["Sở thích", "Địa chỉ", "Lớp học"], "answer": "Sở thích"},
-                    {"question": "Từ dùng để hỏi tên bạn là gì?", "options": ["Name", "Favorite", "Class"], "answer": "Name"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Tớ tên là An.", "answer": "My name is An."},
-                    {"prompt_vi": "Tớ 10 tuổi.", "answer": "I am 10 years old."},
-                    {"prompt_vi": "Sở thích của tớ là vẽ tranh.", "answer": "My hobby is drawing."},
-                ],
-            },
-            "future_job": {
-                "title": "Nghề nghiệp tương lai",
-                "vocab": [
-                    {"en": "Doctor", "vi": "Bác sĩ", "img": "👨‍⚕️"},
-                    {"en": "Pilot", "vi": "Phi công", "img": "👨‍✈️"},
-                    {"en": "Teacher", "vi": "Giáo viên", "img": "👩‍🏫"},
-                    {"en": "Farmer", "vi": "Nông dân", "img": "🧑‍🌾"},
-                    {"en": "Engineer", "vi": "Kỹ sư", "img": "👷"},
-                    {"en": "Artist", "vi": "Nghệ sĩ", "img": "🎨"},
-                ],
-                "quiz": [
-                    {"question": "Ai là người chữa bệnh?", "options": ["Pilot", "Doctor", "Teacher"], "answer": "Doctor"},
-                    {"question": "'Engineer' nghĩa là gì?", "options": ["Kỹ sư", "Nông dân", "Nghệ sĩ"], "answer": "Kỹ sư"},
-                    {"question": "Ai là người lái máy bay?", "options": ["Farmer", "Pilot", "Artist"], "answer": "Pilot"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Tớ muốn trở thành bác sĩ.", "answer": "I want to be a doctor."},
-                    {"prompt_vi": "Cô ấy là một giáo viên.", "answer": "She is a teacher."},
-                    {"prompt_vi": "Anh ấy làm kỹ sư.", "answer": "He works as an engineer."},
-                ],
-            },
-            "school_trip": {
-                "title": "Chuyến đi chơi (School trip)",
-                "vocab": [
-                    {"en": "Zoo", "vi": "Sở thú", "img": "🦁"},
-                    {"en": "Museum", "vi": "Bảo tàng", "img": "🏛️"},
-                    {"en": "Beach", "vi": "Bãi biển", "img": "🏖️"},
-                    {"en": "Bus", "vi": "Xe buýt", "img": "🚌"},
-                    {"en": "Guide", "vi": "Hướng dẫn viên", "img": "🧑‍✈️"},
-                    {"en": "Ticket", "vi": "Vé", "img": "🎟️"},
-                ],
-                "quiz": [
-                    {"question": "Nơi trưng bày các vật cổ xưa?", "options": ["Zoo", "Museum", "Beach"], "answer": "Museum"},
-                    {"question": "'Guide' nghĩa là gì?", "options": ["Hướng dẫn viên", "Vé", "Xe buýt"], "answer": "Hướng dẫn viên"},
-                    {"question": "Phương tiện di chuyển đến trường?", "options": ["Bus", "Zoo", "Ticket"], "answer": "Bus"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Chúng tớ đi đến sở thú bằng xe buýt.", "answer": "We go to the zoo by bus."},
-                    {"prompt_vi": "Hướng dẫn viên rất thân thiện.", "answer": "The guide is very friendly."},
-                    {"prompt_vi": "Tớ có một vé vào bảo tàng.", "answer": "I have a ticket to the museum."},
-                ],
-            },
-            "school_activities": {
-                "title": "Hoạt động trường học",
-                "vocab": [
-                    {"en": "Music club", "vi": "CLB Âm nhạc", "img": "🎵"},
-                    {"en": "Art club", "vi": "CLB Mỹ thuật", "img": "🎨"},
-                    {"en": "Science", "vi": "Khoa học", "img": "🧪"},
-                    {"en": "English", "vi": "Tiếng Anh", "img": "📘"},
-                    {"en": "Sports", "vi": "Thể thao", "img": "🏅"},
-                    {"en": "Drama club", "vi": "CLB Kịch nghệ", "img": "🎭"},
-                ],
-                "quiz": [
-                    {"question": "Môn học vẽ tranh?", "options": ["Music club", "Art club", "Science"], "answer": "Art club"},
-                    {"question": "'Drama club' nghĩa là gì?", "options": ["CLB Kịch nghệ", "CLB Âm nhạc", "Thể thao"], "answer": "CLB Kịch nghệ"},
-                    {"question": "Môn học về thí nghiệm và khám phá?", "options": ["Science", "English", "Sports"], "answer": "Science"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Tớ tham gia CLB Âm nhạc.", "answer": "I join the Music club."},
-                    {"prompt_vi": "Cô ấy thích môn Khoa học.", "answer": "She likes Science."},
-                    {"prompt_vi": "Chúng ta chơi thể thao vào cuối tuần.", "answer": "We play sports on weekends."},
-                ]
-            },
-            "foreign_friends": {
-                "title": "Bạn bè quốc tế",
-                "vocab": [
-                    {"en": "Friend", "vi": "Bạn bè", "img": "👫"},
-                    {"en": "Pen pal", "vi": "Bạn qua thư", "img": "✉️"},
-                    {"en": "Country", "vi": "Đất nước", "img": "🌍"},
-                    {"en": "Hello", "vi": "Xin chào", "img": "👋"},
-                    {"en": "Goodbye", "vi": "Tạm biệt", "img": "👋"},
-                    {"en": "Thank you", "vi": "Cảm ơn", "img": "🙏"},
-                ],
-                "quiz": [
-                    {"question": "Người bạn trao đổi thư từ gọi là?", "options": ["Friend", "Pen pal", "Country"], "answer": "Pen pal"},
-                    {"question": "'Goodbye' nghĩa là gì?", "options": ["Xin chào", "Cảm ơn", "Tạm biệt"], "answer": "Tạm biệt"},
-                    {"question": "Từ dùng để bày tỏ lòng biết ơn?", "options": ["Hello", "Thank you", "Friend"], "answer": "Thank you"},
-                ],
-                "grammar": [
-                    {"prompt_vi": "Bạn của tôi rất thân thiện.", "answer": "My friend is very friendly."},
-                    {"prompt_vi": "Tôi có một người bạn qua thư.", "answer": "I have a pen pal."},
-                    {"prompt_vi": "Chúng tôi đến từ các đất nước khác nhau.", "answer": "We come from different countries."},
-                ],
-            }
+    PHONETIC_CACHE.put(key, phonetic)
+    return phonetic
+
+
+_PHONETIC_BATCH_MAX = int(os.getenv('ROBO_PHONETIC_BATCH_MAX', '50'))
+_PHONETIC_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv('ROBO_PHONETIC_WORKERS', '8')),
+    thread_name_prefix='phonetic',
+)
+
+
+def _get_phonetics_batch(words: list[str]) -> dict[str, str]:
+    """Tra phiên âm cho nhiều từ; các từ chưa có trong cache được tra song song."""
+    result: dict[str, str] = {}
+    missing: dict[str, str] = {}
+    for w in words:
+        key = _normalize_key(w)
+        if not key or w in result:
+            continue
+        cached = _IPA_DICT.lookup(key) or PHONETIC_CACHE.get(key)
+        if cached is not None:
+            result[w] = cached
+        else:
+            result[w] = ''
+            missing[w] = key
+
+    # Từ điển offline và cache đã tra (và đã đếm miss) ở trên -> worker chỉ còn gọi API
+    futures = {w: _PHONETIC_POOL.submit(_get_phonetic_uncached, key, w) for w, key in missing.items()}
+    for w, fut in futures.items():
+        try:
+            result[w] = fut.result()
+        except Exception:
+            result[w] = ''
+    return result
+
+
+def _prefetch_topic_phonetics(topic: dict) -> None:
+    """Tra trước (không chờ) phiên âm các từ vựng của topic để lần gọi sau trúng cache."""
+    vocab = topic.get('vocab') if isinstance(topic, dict) else None
+    if not isinstance(vocab, list):
+        return
+    for it in vocab:
+        if not isinstance(it, dict) or not it.get('en'):
+            continue
+        word = str(it.get('en')).strip()
+        if _IPA_DICT.lookup(word):
+            continue
+        if PHONETIC_CACHE.peek(_normalize_key(word)) is None:
+            _PHONETIC_POOL.submit(_get_phonetic, word)
+
+
+@app.route('/api/phonetic/batch')
+def phonetic_batch_api():
+    raw_words: list[str] = []
+    for value in request.args.getlist('words'):
+        raw_words.extend(str(value).split(','))
+    words = [w.strip() for w in raw_words if w.strip()][:_PHONETIC_BATCH_MAX]
+    return jsonify({"phonetics": _get_phonetics_batch(words)})
+
+
+@app.route('/api/phonetic/stats')
+def phonetic_stats_api():
+    stats = PHONETIC_CACHE.stats()
+    stats['offline_dict'] = _IPA_DICT.stats()
+    return jsonify(stats)
+
+
+# --- 1. CƠ SỞ DỮ LIỆU GIÁO TRÌNH ---
+# Giáo trình nằm trong data/curriculum/*.json (index.json liệt kê các lớp theo thứ tự + version).
+# Sửa nội dung không cần deploy code: app tự phát hiện file đổi và thay index mới mà không restart.
+_CURRICULUM_DIR = os.getenv('ROBO_CURRICULUM_DIR', os.path.join(os.path.dirname(__file__), 'data', 'curriculum'))
+_CURRICULUM_SCHEMA_VERSION = 1
+_CURRICULUM_POLL_SECONDS = float(os.getenv('ROBO_CURRICULUM_POLL', '2'))
+
+
+def _normalize_en_answer(text: str) -> str:
+    text = '' if text is None else str(text)
+    text = text.strip().lower()
+    # Giữ chữ cái, số và khoảng trắng; loại ký tự lạ
+    text = re.sub(r"[^a-z0-9\s']", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+
+def _normalize_choice_text(text: str) -> str:
+    text = '' if text is None else str(text)
+    text = text.strip().lower()
+    text = re.sub(r"\s+", " ", text)
+    return text
+
+
+def _mask_word_missing_letters(word: str) -> str:
+    """Return a masked word where some inner letters are replaced with '_' (stable-ish per word)."""
+    w = '' if word is None else str(word)
+    chars = list(w)
+    letter_positions = [i for i, c in enumerate(chars) if re.match(r"[A-Za-z]", c)]
+    if len(letter_positions) <= 2:
+        return w
+
+    allowed = letter_positions[1:-1]
+    if not allowed:
+        return w
+
+    target = max(1, min(3, len(letter_positions) // 3))
+    seed = 0
+    for ch in w:
+        seed = (seed + ord(ch)) % 997
+
+    picked = set()
+    tries = 0
+    while len(picked) < target and tries < 50:
+        pos = allowed[(seed + tries * 17) % len(allowed)]
+        picked.add(pos)
+        tries += 1
+
+    for i in picked:
+        chars[i] = '_'
+    # Add spaces between characters to make blanks easier to see in chat
+    return ' '.join(chars)
+
+
+class _CompiledTopic:
+    """Bảng tra dựng sẵn cho 1 topic, dùng ở các nhánh nóng của chatbot.
+
+    Mỗi phần (vocab/quiz/grammar) là tuple các câu hỏi đã chuẩn hoá (strip, options đã lọc,
+    vị trí đáp án đúng, từ đã che chữ) + tuple chỉ số hợp lệ để bốc câu hỏi.
+    """
+
+    __slots__ = ('vocab', 'vocab_candidates', 'quiz', 'quiz_candidates', 'grammar', 'grammar_candidates')
+
+    def __init__(self, topic: dict):
+        vocab = []
+        for it in topic.get('vocab', []):
+            en = str(it.get('en')).strip()
+            vocab.append({'en': en, 'vi': str(it.get('vi')).strip(), 'masked': _mask_word_missing_letters(en)})
+        self.vocab = tuple(vocab)
+        self.vocab_candidates = tuple(range(len(vocab)))
+
+        quiz = []
+        for it in topic.get('quiz', []):
+            options = [str(o).strip() for o in it.get('options', []) if str(o).strip()]
+            options_norm = [_normalize_choice_text(o) for o in options]
+            answer = str(it.get('answer')).strip()
+            answer_norm = _normalize_choice_text(answer)
+            quiz.append({
+                'question': str(it.get('question')).strip(),
+                'options': options,
+                'options_norm': options_norm,
+                'answer': answer,
+                'answer_norm': answer_norm,
+                'correct_index': options_norm.index(answer_norm) if answer_norm in options_norm else None,
+            })
+        self.quiz = tuple(quiz)
+        self.quiz_candidates = tuple(i for i, q in enumerate(quiz) if len(q['options']) >= 2)
+
+        grammar = []
+        for it in topic.get('grammar', []):
+            grammar.append({'prompt_vi': str(it.get('prompt_vi')).strip(), 'answer': str(it.get('answer')).strip()})
+        self.grammar = tuple(grammar)
+        self.grammar_candidates = tuple(range(len(grammar)))
+
+
+def _question_id(*parts) -> str:
+    """question_id ghi vào lịch sử: các phần đã chuẩn hoá, bỏ phần rỗng, nối bằng '::'."""
+    return "::".join(p for p in map(_normalize_key, parts) if p)
+
+
+class _CompiledCurriculum:
+    """Bản chụp giáo trình đã kiểm tra + các bảng tra dựng từ chính bản đó.
+
+    reload_curriculum() thay cả bản chụp bằng 1 phép gán, nên 1 request luôn thấy data/topics/items/response/lexicon
+    cùng phiên bản. responses và lexicon dựng lười (1 lần) ngay trên bản chụp.
+    - data: dict CURRICULUM (lớp -> topics -> vocab/quiz/grammar)
+    - topics: (gradeId, topicId) -> _CompiledTopic
+    - items: question_id (đúng định dạng /api/check và chatbot ghi lịch sử) -> mục kèm đáp án đã chuẩn hoá
+    - vi_to_en: tiếng Việt (chuẩn hoá như _lexicon_key) -> tiếng Anh của vocab/grammar
+    - responses: key -> _PrecomputedJSON (xem _get_curriculum_response)
+    - lexicon: từ điển song ngữ (xem _get_bilingual_lexicon)
+    """
+
+    __slots__ = ('data', 'version', 'topics', 'items', 'vi_to_en', 'files', 'signature', 'responses', 'lexicon')
+
+    def __init__(self, data: dict, version: str, files: list[str], signature: tuple = ()):
+        self.data = data
+        self.version = version
+        self.files = files
+        # (path, mtime, size) của từng file lúc đọc -> watcher biết bản chụp này đã cũ chưa
+        self.signature = signature
+        self.topics: dict[tuple[str, str], _CompiledTopic] = {
+            (grade_id, topic_id): _CompiledTopic(topic)
+            for grade_id, grade in data.items()
+            for topic_id, topic in grade['topics'].items()
         }
-    }
-}
+        self.items: dict[str, dict] = {}
+        self.vi_to_en: dict[str, str] = {}
+        for (grade_id, topic_id), topic in self.topics.items():
+            def add(section, index, answer, answer_norm, *qids):
+                entry = {
+                    'gradeId': grade_id, 'topicId': topic_id, 'section': section, 'index': index,
+                    'answer': answer, 'answer_norm': answer_norm,
+                }
+                for qid in qids:
+                    self.items.setdefault(qid, entry)
+
+            for i, it in enumerate(topic.vocab):
+                en = it['en']
+                add('vocab', i, en, _normalize_en_answer(en),
+                    _question_id('speaking', grade_id, topic_id, 'speaking', i, en),
+                    _question_id('writing', grade_id, topic_id, 'writing', i, en),
+                    _question_id('writing', grade_id, topic_id, 'missing', i, en),
+                    _question_id('chat', 'vocab', grade_id, topic_id, i, en),
+                    _question_id('chat', 'missing', grade_id, topic_id, i, en))
+                self.vi_to_en.setdefault(_lexicon_key(it['vi']), en)
+            for i, it in enumerate(topic.quiz):
+                add('quiz', i, it['answer'], it['answer_norm'],
+                    _question_id('quiz', grade_id, topic_id, 'quiz', i, it['question']),
+                    _question_id('chat', 'quiz', grade_id, topic_id, i, it['question']))
+            for i, it in enumerate(topic.grammar):
+                add('grammar', i, it['answer'], _normalize_en_answer(it['answer']),
+                    _question_id('grammar', grade_id, topic_id, 'grammar', i, it['answer']),
+                    _question_id('chat', 'grammar', grade_id, topic_id, i))
+                self.vi_to_en.setdefault(_lexicon_key(it['prompt_vi']), it['answer'])
+        self.responses: dict | None = None
+        self.lexicon: dict | None = None
+
+
+def _require(cond, where: str, msg: str) -> None:
+    if not cond:
+        raise ValueError(f"{where}: {msg}")
+
+
+def _is_text(value) -> bool:
+    return isinstance(value, str) and bool(value.strip())
+
+
+def _validate_topic(topic, where: str) -> None:
+    _require(isinstance(topic, dict), where, 'topic phải là object')
+    _require(_is_text(topic.get('title')), where, 'thiếu title')
+    for section in ('vocab', 'quiz', 'grammar'):
+        _require(isinstance(topic.get(section, []), list), where, f"'{section}' phải là list")
+    for i, it in enumerate(topic.get('vocab', [])):
+        w = f"{where}.vocab[{i}]"
+        _require(isinstance(it, dict) and _is_text(it.get('en')) and _is_text(it.get('vi')), w, 'cần en và vi')
+    for i, it in enumerate(topic.get('quiz', [])):
+        w = f"{where}.quiz[{i}]"
+        _require(isinstance(it, dict) and _is_text(it.get('question')) and _is_text(it.get('answer')), w, 'cần question và answer')
+        opts = it.get('options')
+        _require(isinstance(opts, list) and len(opts) >= 2 and all(_is_text(o) for o in opts), w, 'options cần >= 2 lựa chọn')
+        _require(it['answer'] in opts, w, 'answer phải nằm trong options')
+    for i, it in enumerate(topic.get('grammar', [])):
+        w = f"{where}.grammar[{i}]"
+        _require(isinstance(it, dict) and _is_text(it.get('prompt_vi')) and _is_text(it.get('answer')), w, 'cần prompt_vi và answer')
+
+
+def _file_signature(path: str) -> tuple:
+    try:
+        st = os.stat(path)
+        return (path, st.st_mtime_ns, st.st_size)
+    except OSError:
+        return (path, None, None)
+
+
+def _load_curriculum_files(folder: str) -> _CompiledCurriculum:
+    """Đọc + kiểm tra toàn bộ file giáo trình. Lỗi dữ liệu -> ValueError (kèm vị trí lỗi)."""
+    manifest_path = os.path.join(folder, 'index.json')
+    signature = [_file_signature(manifest_path)]
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    _require(isinstance(manifest, dict), manifest_path, 'manifest phải là object')
+    _require(manifest.get('schema_version') == _CURRICULUM_SCHEMA_VERSION, manifest_path, 'schema_version không hỗ trợ')
+    grade_files = manifest.get('grades')
+    _require(isinstance(grade_files, list) and grade_files, manifest_path, "'grades' phải là list file")
+
+    data: dict = {}
+    digest = hashlib.sha256()
+    files = [manifest_path]
+    for name in grade_files:
+        path = os.path.join(folder, str(name))
+        signature.append(_file_signature(path))
+        with open(path, 'rb') as f:
+            raw = f.read()
+        digest.update(raw)
+        grade = json.loads(raw.decode('utf-8'))
+        _require(isinstance(grade, dict), path, 'file lớp phải là object')
+        _require(grade.get('schema_version') == _CURRICULUM_SCHEMA_VERSION, path, 'schema_version không hỗ trợ')
+        grade_id = grade.get('id')
+        _require(_is_text(grade_id) and grade_id not in data, path, 'id lớp thiếu hoặc bị trùng')
+        _require(_is_text(grade.get('title')), path, 'thiếu title')
+        topics = grade.get('topics')
+        _require(isinstance(topics, dict) and topics, path, "'topics' phải là object")
+        for topic_id, topic in topics.items():
+            _validate_topic(topic, f"{path}:{topic_id}")
+        data[grade_id] = {'title': grade['title'], 'topics': topics}
+        files.append(path)
+
+    version = f"{manifest.get('version', '')}+{digest.hexdigest()[:12]}"
+    return _CompiledCurriculum(data, version, files, tuple(signature))
+
+
+_CURRICULUM_COMPILED = _load_curriculum_files(_CURRICULUM_DIR)
+CURRICULUM = _CURRICULUM_COMPILED.data
+_CURRICULUM_SWAP_LOCK = threading.Lock()
+
+
+def reload_curriculum() -> bool:
+    """Nạp lại giáo trình từ file; dựng sẵn response/lexicon rồi mới thay vào (atomic).
+
+    Dữ liệu lỗi thì giữ nguyên bản đang chạy và trả về False. Không đụng tới model AI.
+    """
+    global CURRICULUM, _CURRICULUM_COMPILED
+    try:
+        compiled = _load_curriculum_files(_CURRICULUM_DIR)
+    except Exception as e:
+        app.logger.warning("[curriculum] Bỏ qua bản cập nhật lỗi: %s", e)
+        return False
+    if compiled.version == _CURRICULUM_COMPILED.version:
+        return False
+    compiled.responses = _build_curriculum_responses(compiled.data)
+    compiled.lexicon = _build_bilingual_lexicon(compiled.data)
+    with _CURRICULUM_SWAP_LOCK:
+        _CURRICULUM_COMPILED = compiled
+        # Tên cũ cho code/tool bên ngoài; trong app luôn đọc qua _CURRICULUM_COMPILED
+        CURRICULUM = compiled.data
+    app.logger.info("[curriculum] Đã nạp phiên bản %s", compiled.version)
+    return True
+
+
+def _curriculum_files_signature() -> tuple:
+    paths = [os.path.join(_CURRICULUM_DIR, 'index.json')] + list(_CURRICULUM_COMPILED.files[1:])
+    return tuple(_file_signature(path) for path in paths)
+
+
+_CURRICULUM_WATCHER: threading.Thread | None = None
+
+
+def _watch_curriculum_files(last: tuple) -> None:
+    while True:
+        time.sleep(_CURRICULUM_POLL_SECONDS)
+        current = _curriculum_files_signature()
+        if current != last:
+            reload_curriculum()
+            last = _curriculum_files_signature()
+
+
+def _start_curriculum_watcher() -> None:
+    """Bật thread theo dõi file giáo trình (tắt bằng ROBO_CURRICULUM_POLL=0)."""
+    global _CURRICULUM_WATCHER
+    if _CURRICULUM_POLL_SECONDS <= 0:
+        return
+    if _CURRICULUM_WATCHER is not None and _CURRICULUM_WATCHER.is_alive():
+        return
+    # So với lúc bản chụp hiện tại được đọc (không phải lúc bật watcher): worker fork muộn
+    # (sau HUP/max_requests) thấy file đã đổi ngay ở lần kiểm tra đầu và tự nạp lại ở thread nền
+    _CURRICULUM_WATCHER = threading.Thread(
+        target=_watch_curriculum_files,
+        args=(_CURRICULUM_COMPILED.signature,),
+        name='curriculum-watcher',
+        daemon=True,
+    )
+    _CURRICULUM_WATCHER.start()
+
 
 # --- 2. LOGIC HỌC TẬP (Giữ nguyên) ---
 # def check_similarity(a, b):
@@ -871,36 +1885,361 @@ def calculate_ai_score(user_text, correct_text):
     """
     if not user_text: return 0
 
-    model, st_util = _get_ai_model_and_util()
-    
-    # Mã hóa văn bản thành vector
-    embeddings1 = model.encode(user_text, convert_to_tensor=True)
-    embeddings2 = model.encode(correct_text, convert_to_tensor=True)
-    
-    # Tính độ tương đồng cosine
-    cosine_score = st_util.cos_sim(embeddings1, embeddings2)
-    
-    # Chuyển thành thang điểm 100
-    score = float(cosine_score[0][0]) * 100
-    return int(score) if score > 0 else 0
+    model, st_util = _get_ai_model_and_util()
+    
+    with _stage('model_encode'):
+        # Mã hóa văn bản thành vector
+        embeddings1 = model.encode(user_text, convert_to_tensor=True)
+        embeddings2 = model.encode(correct_text, convert_to_tensor=True)
+
+        # Tính độ tương đồng cosine
+        cosine_score = st_util.cos_sim(embeddings1, embeddings2)
+    
+    # Chuyển thành thang điểm 100
+    score = float(cosine_score[0][0]) * 100
+    return int(score) if score > 0 else 0
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+# --- Response giáo trình dựng sẵn (JSON + gzip/brotli + ETag) ---
+# Dữ liệu giáo trình không đổi khi chạy -> chỉ serialize/nén 1 lần, mỗi request chỉ việc trả bytes.
+_CURRICULUM_MAX_AGE = int(os.getenv('ROBO_CURRICULUM_MAX_AGE', '300'))
+
+
+class _PrecomputedJSON:
+    __slots__ = ('identity', 'gzip', 'br', 'etag')
+
+    def __init__(self, obj):
+        self.identity = (app.json.dumps(obj) + '\n').encode('utf-8')
+        self.etag = hashlib.sha256(self.identity).hexdigest()[:32]
+        self.gzip = gzip.compress(self.identity, compresslevel=9, mtime=0)
+        self.br = None
+        try:
+            import brotli  # type: ignore
+
+            self.br = brotli.compress(self.identity, quality=11)
+        except Exception:
+            self.br = None
+
+
+_CURRICULUM_RESPONSES_LOCK = threading.Lock()
+
+
+def _build_curriculum_index(curriculum: dict) -> dict:
+    """Bản rút gọn của CURRICULUM cho màn hình chọn bài: chỉ id, tiêu đề và số mục mỗi phần."""
+    index = {}
+    for grade_id, grade in curriculum.items():
+        if not isinstance(grade, dict):
+            continue
+        topics = grade.get('topics') if isinstance(grade.get('topics'), dict) else {}
+        index[grade_id] = {
+            "title": grade.get('title', ''),
+            "topics": {
+                topic_id: {
+                    "title": topic.get('title', ''),
+                    "counts": {
+                        section: len(topic.get(section) or [])
+                        for section in ('vocab', 'quiz', 'grammar')
+                    },
+                }
+                for topic_id, topic in topics.items()
+                if isinstance(topic, dict)
+            },
+        }
+    return index
+
+
+def _build_curriculum_responses(curriculum: dict | None = None) -> dict[tuple, _PrecomputedJSON]:
+    curriculum = _CURRICULUM_COMPILED.data if curriculum is None else curriculum
+    responses: dict[tuple, _PrecomputedJSON] = {
+        ('curriculum',): _PrecomputedJSON(curriculum),
+        ('curriculum', 'index'): _PrecomputedJSON(_build_curriculum_index(curriculum)),
+    }
+    for grade_id, grade in curriculum.items():
+        topics = grade.get('topics') if isinstance(grade, dict) else None
+        if not isinstance(topics, dict):
+            continue
+        for topic_id, topic in topics.items():
+            responses[('topic', grade_id, topic_id)] = _PrecomputedJSON(topic)
+    return responses
+
+
+def _get_curriculum_response(key: tuple) -> _PrecomputedJSON | None:
+    snapshot = _CURRICULUM_COMPILED
+    if snapshot.responses is None:
+        with _CURRICULUM_RESPONSES_LOCK:
+            if snapshot.responses is None:
+                snapshot.responses = _build_curriculum_responses(snapshot.data)
+    return snapshot.responses.get(key)
+
+
+_ETAG_SUFFIXES = {None: '', 'gzip': '-gz', 'br': '-br'}
+
+
+def _serve_precomputed(pre: _PrecomputedJSON):
+    """Trả response dựng sẵn: 304 nếu ETag khớp, ngược lại chọn br/gzip/identity theo Accept-Encoding.
+
+    Mỗi content-coding có ETag riêng ("<hash>", "<hash>-gz", "<hash>-br") vì strong validator phải khác
+    nhau theo từng biểu diễn; If-None-Match khớp bất kỳ biến thể nào của cùng nội dung đều trả 304.
+    """
+    accepted = request.accept_encodings
+    encoding = None
+    body = pre.identity
+    if pre.br is not None and accepted['br']:
+        encoding, body = 'br', pre.br
+    elif accepted['gzip']:
+        encoding, body = 'gzip', pre.gzip
+
+    headers = {
+        'ETag': f'"{pre.etag}{_ETAG_SUFFIXES[encoding]}"',
+        'Cache-Control': f'public, max-age={_CURRICULUM_MAX_AGE}',
+        'Vary': 'Accept-Encoding',
+    }
+    if any(f"{pre.etag}{suffix}" in request.if_none_match for suffix in _ETAG_SUFFIXES.values()):
+        return Response(status=304, headers=headers)
+    if encoding is not None:
+        headers['Content-Encoding'] = encoding
+    return Response(body, status=200, headers=headers, mimetype='application/json')
 
-@app.route('/')
-def index():
-    return render_template('index.html')
 
 @app.route('/api/curriculum')
 def get_curriculum():
-    return jsonify(CURRICULUM)
+    # ?fields=index: chỉ trả id/tiêu đề/số mục; nội dung topic lấy sau qua /api/topic
+    if request.args.get('fields', '').strip().lower() == 'index':
+        return _serve_precomputed(_get_curriculum_response(('curriculum', 'index')))
+    return _serve_precomputed(_get_curriculum_response(('curriculum',)))
 
 @app.route('/api/topic/<grade_id>/<topic_id>')
 def get_topic_data(grade_id, topic_id):
-    try:
-        data = CURRICULUM[grade_id]['topics'][topic_id]
-        return jsonify(data)
-    except KeyError:
+    pre = _get_curriculum_response(('topic', grade_id, topic_id))
+    if pre is None:
         return jsonify({"error": "Không tìm thấy dữ liệu"}), 404
+    resp = _serve_precomputed(pre)
+    # 304: client đã có topic (và đã prefetch phiên âm từ lần trước) -> không tra lại
+    if resp.status_code == 200:
+        _prefetch_topic_phonetics(_get_topic_safe(grade_id, topic_id))
+    return resp
+
+
+def _warm_up_curriculum_responses() -> None:
+    """Dựng sẵn JSON/gzip/brotli của giáo trình để request đầu tiên không phải chờ serialize/nén."""
+    try:
+        _get_curriculum_response(('curriculum',))
+    except Exception:
+        pass
+
+# --- TTS engines (gTTS / espeak-ng / Piper) ---
+# gTTS cần mạng; espeak-ng và Piper chạy hoàn toàn trên máy (subprocess).
+# Thứ tự engine lấy từ ROBO_TTS_ENGINES, engine lỗi sẽ tự chuyển sang engine kế tiếp.
+_TTS_ENGINE_ORDER = os.getenv('ROBO_TTS_ENGINES', 'gtts,espeak,piper')
+_TTS_FORMAT = os.getenv('ROBO_TTS_FORMAT', 'mp3').strip().lower()
+_TTS_TIMEOUT = float(os.getenv('ROBO_TTS_TIMEOUT', '10'))
+_TTS_MIMETYPES = {
+    'mp3': 'audio/mpeg',
+    'ogg': 'audio/ogg',
+    'wav': 'audio/wav',
+}
+
+
+class _TTSEngine:
+    """Giao diện chung cho các engine TTS: synthesize(text) -> (bytes, format)."""
+
+    name = 'base'
+
+    def available(self) -> bool:
+        return False
+
+    def synthesize(self, text: str) -> tuple[bytes, str]:
+        raise NotImplementedError
+
+
+class _GTTSEngine(_TTSEngine):
+    name = 'gtts'
+
+    def available(self) -> bool:
+        # Chỉ kiểm tra có cài gtts chưa, chưa import (gtts kéo theo requests/bs4...)
+        return importlib.util.find_spec('gtts') is not None
+
+    def synthesize(self, text: str) -> tuple[bytes, str]:
+        from gtts import gTTS  # type: ignore
+
+        # Lang='en' cho tiếng Anh chuẩn; timeout để mạng treo thì chuyển sớm sang engine cục bộ
+        tts = gTTS(text=text, lang='en', timeout=_TTS_TIMEOUT)
+        fp = io.BytesIO()
+        tts.write_to_fp(fp)
+        return fp.getvalue(), 'mp3'
+
+
+class _EspeakEngine(_TTSEngine):
+    name = 'espeak'
+
+    def __init__(self):
+        self.binary = os.getenv('ROBO_ESPEAK_BIN') or shutil.which('espeak-ng') or shutil.which('espeak')
+        self.voice = os.getenv('ROBO_ESPEAK_VOICE', 'en-us')
+        self.speed = os.getenv('ROBO_ESPEAK_SPEED', '140')
+
+    def available(self) -> bool:
+        return bool(self.binary)
+
+    def synthesize(self, text: str) -> tuple[bytes, str]:
+        proc = subprocess.run(
+            [self.binary, '-v', self.voice, '-s', self.speed, '--stdout', '--stdin'],
+            input=text.encode('utf-8'),
+            capture_output=True,
+            timeout=_TTS_TIMEOUT,
+            check=True,
+        )
+        if not proc.stdout:
+            raise RuntimeError('espeak không trả về audio')
+        return proc.stdout, 'wav'
+
+
+class _PiperEngine(_TTSEngine):
+    name = 'piper'
+
+    def __init__(self):
+        self.binary = os.getenv('ROBO_PIPER_BIN') or shutil.which('piper')
+        self.model = os.getenv('ROBO_PIPER_MODEL', '')
+        self.sample_rate = int(os.getenv('ROBO_PIPER_SAMPLE_RATE', '22050'))
+
+    def available(self) -> bool:
+        return bool(self.binary) and bool(self.model) and os.path.exists(self.model)
+
+    def synthesize(self, text: str) -> tuple[bytes, str]:
+        proc = subprocess.run(
+            [self.binary, '--model', self.model, '--output-raw'],
+            input=text.encode('utf-8'),
+            capture_output=True,
+            timeout=_TTS_TIMEOUT,
+            check=True,
+        )
+        if not proc.stdout:
+            raise RuntimeError('piper không trả về audio')
+        # Piper trả PCM 16-bit mono thô -> bọc header WAV ngay trong RAM
+        fp = io.BytesIO()
+        with wave.open(fp, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(self.sample_rate)
+            w.writeframes(proc.stdout)
+        return fp.getvalue(), 'wav'
+
+
+_TTS_ENGINE_TYPES = {
+    'gtts': _GTTSEngine,
+    'espeak': _EspeakEngine,
+    'piper': _PiperEngine,
+}
+_TTS_ENGINES: list[_TTSEngine] | None = None
+_TTS_ENGINES_LOCK = threading.Lock()
+_TTS_METRICS: dict[str, dict] = {}
+_TTS_METRICS_LOCK = threading.Lock()
+
+
+def _get_tts_engines() -> list[_TTSEngine]:
+    """Khởi tạo (1 lần) danh sách engine theo cấu hình, bỏ qua engine không khả dụng."""
+    global _TTS_ENGINES
+    if _TTS_ENGINES is not None:
+        return _TTS_ENGINES
+    with _TTS_ENGINES_LOCK:
+        if _TTS_ENGINES is not None:
+            return _TTS_ENGINES
+        engines: list[_TTSEngine] = []
+        for name in _TTS_ENGINE_ORDER.split(','):
+            cls = _TTS_ENGINE_TYPES.get(name.strip().lower())
+            if cls is None:
+                continue
+            try:
+                engine = cls()
+                if engine.available():
+                    engines.append(engine)
+            except Exception:
+                continue
+        _TTS_ENGINES = engines
+        return _TTS_ENGINES
+
+
+def _record_tts_metric(engine_name: str, elapsed_ms: float, ok: bool) -> None:
+    with _TTS_METRICS_LOCK:
+        m = _TTS_METRICS.get(engine_name)
+        if m is None:
+            m = {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_ms': 0.0}
+            _TTS_METRICS[engine_name] = m
+        m['calls'] += 1
+        if not ok:
+            m['errors'] += 1
+        m['total_ms'] += elapsed_ms
+        m['max_ms'] = max(m['max_ms'], elapsed_ms)
+        m['last_ms'] = elapsed_ms
+
+
+def _tts_metrics_snapshot() -> dict:
+    with _TTS_METRICS_LOCK:
+        out = {}
+        for name, m in _TTS_METRICS.items():
+            item = dict(m)
+            item['avg_ms'] = round(m['total_ms'] / m['calls'], 2) if m['calls'] else 0.0
+            out[name] = item
+        return out
+
+
+def _encode_audio(data: bytes, src_fmt: str, dest_fmt: str) -> tuple[bytes, str]:
+    """Chuyển định dạng audio trong RAM bằng ffmpeg (stdin -> stdout).
+
+    Nếu không có ffmpeg hoặc chuyển lỗi thì trả lại audio gốc.
+    """
+    if src_fmt == dest_fmt or dest_fmt not in _TTS_MIMETYPES:
+        return data, src_fmt
+    ffmpeg = os.getenv('ROBO_FFMPEG_BIN') or shutil.which('ffmpeg')
+    if not ffmpeg:
+        return data, src_fmt
+    codec = {'mp3': 'libmp3lame', 'ogg': 'libvorbis', 'wav': 'pcm_s16le'}[dest_fmt]
+    try:
+        proc = subprocess.run(
+            [ffmpeg, '-loglevel', 'error', '-f', src_fmt, '-i', 'pipe:0', '-c:a', codec, '-f', dest_fmt, 'pipe:1'],
+            input=data,
+            capture_output=True,
+            timeout=_TTS_TIMEOUT,
+            check=True,
+        )
+        if proc.stdout:
+            return proc.stdout, dest_fmt
+    except Exception:
+        pass
+    return data, src_fmt
+
+
+def _synthesize_speech(text: str) -> tuple[bytes, str, str]:
+    """Tổng hợp giọng nói, thử lần lượt các engine. Trả về (audio, mimetype, engine)."""
+    last_error = None
+    for engine in _get_tts_engines():
+        started = time.perf_counter()
+        try:
+            with _stage('tts_synthesis', engine=engine.name, chars=len(text)):
+                data, fmt = engine.synthesize(text)
+            _record_tts_metric(engine.name, (time.perf_counter() - started) * 1000, True)
+        except Exception as e:
+            _record_tts_metric(engine.name, (time.perf_counter() - started) * 1000, False)
+            last_error = e
+            continue
+        data, fmt = _encode_audio(data, fmt, _TTS_FORMAT)
+        return data, _TTS_MIMETYPES.get(fmt, 'application/octet-stream'), engine.name
+    raise RuntimeError(f"Không có engine TTS nào dùng được: {last_error}")
 
-# --- API MỚI: TEXT-TO-SPEECH (gTTS) ---
+
+def _synthesize_speech_admitted(text: str, deadline: float | None = None) -> tuple[bytes, str, str]:
+    # Chỉ request dẫn đầu của singleflight chiếm slot; các request trùng text chờ chung kết quả
+    with _TTS_GATE.slot(deadline):
+        return _synthesize_speech(text)
+
+
+def _overloaded_payload(e: '_Overloaded') -> dict:
+    return {"error": "Robo đang bận, bé thử lại sau giây lát nhé.", "reason": e.reason, "retry_after": e.retry_after}
+
+
+# --- API MỚI: TEXT-TO-SPEECH ---
 @app.route('/api/tts')
 def tts_api():
     text = request.args.get('text', '')
@@ -908,20 +2247,69 @@ def tts_api():
     
     # Tạo file audio trong RAM để không rác ổ cứng
     try:
-        # Lang='en' cho tiếng Anh chuẩn
-        tts = gTTS(text=text, lang='en')
-        fp = io.BytesIO()
-        tts.write_to_fp(fp)
-        fp.seek(0)
-        return send_file(fp, mimetype="audio/mpeg")
+        data, mimetype, engine_name = _TTS_FLIGHT.do(text, _synthesize_speech_admitted, text, _request_deadline())
+        resp = send_file(io.BytesIO(data), mimetype=mimetype)
+        resp.headers['X-TTS-Engine'] = engine_name
+        return resp
+    except _Overloaded as e:
+        return jsonify(_overloaded_payload(e)), 503, {'Retry-After': str(e.retry_after)}
     except Exception as e:
-        print(e)
+        _mark_span_error(e)
+        app.logger.warning("[tts] %s: %s", type(e).__name__, e)
         return "Error", 500
 
+
+@app.route('/api/tts/engines')
+def tts_engines_api():
+    return jsonify({
+        "engines": [e.name for e in _get_tts_engines()],
+        "format": _TTS_FORMAT,
+        "metrics": _tts_metrics_snapshot(),
+    })
+
 # --- API CHẤM ĐIỂM CHI TIẾT ---
+# Chế độ dùng model/LanguageTool -> phải qua cổng giới hạn tải; quiz chỉ so chuỗi nên không cần
+_CHECK_MODES = ('speaking', 'writing', 'grammar', 'quiz')
+_CHECK_GATED_MODES = ('speaking', 'writing', 'grammar')
+
+
+def _answer_score(user_ans: str, correct_ans: str, *, lexical_only: bool = False) -> int:
+    """Điểm 0..100 theo độ giống nghĩa (model); lexical_only=True thì chỉ so chữ (khi server quá tải)."""
+    if not user_ans:
+        return 0
+    if lexical_only:
+        return int(_similarity(user_ans, correct_ans) * 100)
+    model, st_util = _get_ai_model_and_util()
+    with _stage('model_encode'):
+        embeddings1 = model.encode(user_ans, convert_to_tensor=True)
+        embeddings2 = model.encode(correct_ans, convert_to_tensor=True)
+        cosine_score = st_util.cos_sim(embeddings1, embeddings2)
+    return int(float(cosine_score[0][0]) * 100)
+
+
 @app.route('/api/check', methods=['POST'])
 def check_answer():
     data = request.json
+    mode = data.get('mode') if isinstance(data, dict) else None
+    mode = mode if mode in _CHECK_MODES else 'other'
+    if mode not in _CHECK_GATED_MODES:
+        with _CHECK_LATENCY.time(mode, 'false'):
+            return jsonify(_grade_answer(data))
+    try:
+        with _CHECK_GATE.slot(_request_deadline()), _CHECK_LATENCY.time(mode, 'false'):
+            return jsonify(_grade_answer(data))
+    except _Overloaded as e:
+        # Quá tải: chấm nhanh theo chữ (không model, không LanguageTool) thay vì bắt bé chờ
+        with _CHECK_LATENCY.time(mode, 'true'):
+            result = _grade_answer(data, lexical_only=True)
+        result['degraded'] = True
+        result['message'] += "<br><small>Robo đang bận nên chấm nhanh theo chữ viết (lần này chưa cộng điểm).</small>"
+        resp = jsonify(result)
+        resp.headers['X-Degraded'] = e.reason
+        return resp
+
+
+def _grade_answer(data: dict, *, lexical_only: bool = False) -> dict:
     mode = data.get('mode')
     user_ans = data.get('user_answer', '').strip()
     correct_ans = data.get('correct_answer', '').strip()
@@ -935,21 +2323,37 @@ def check_answer():
     question_text = str(question_text).strip()
 
     def make_question_id(default_label: str):
-        grade_id = _normalize_key(context.get('gradeId'))
-        topic_id = _normalize_key(context.get('topicId'))
-        category = _normalize_key(context.get('category'))
-        item_id = _normalize_key(context.get('itemId'))
-        label = _normalize_key(default_label)
-
-        parts = [
-            _normalize_key(mode),
-            grade_id,
-            topic_id,
-            category,
-            item_id,
-            label,
-        ]
-        return "::".join([p for p in parts if p])
+        return _question_id(
+            mode,
+            context.get('gradeId'),
+            context.get('topicId'),
+            context.get('category'),
+            context.get('itemId'),
+            default_label,
+        )
+
+    def answer_matches(question_id: str, fallback: bool) -> bool:
+        # Câu thuộc giáo trình: so với đáp án đã chuẩn hoá; câu ngoài giáo trình (vd. chat) so như cũ
+        matched = _curriculum_answer_matches(question_id, user_ans)
+        return fallback if matched is None else matched
+
+    def correct_before(question_id: str) -> bool:
+        # Chấm nhanh lúc quá tải: không quét lịch sử (đọc cả file), lần này cũng không cộng điểm
+        if lexical_only:
+            return False
+        return _has_been_correct_before(question_id=question_id)
+
+    def record(mode_label, question_label, answer, awarded, is_correct, *, question_id, base_score, counted):
+        if lexical_only:
+            save_to_history_deferred(
+                mode_label, question_label, answer, is_correct,
+                question_id=question_id, base_score=base_score, context=context,
+            )
+            return
+        save_to_history(
+            mode_label, question_label, answer, awarded, is_correct,
+            question_id=question_id, base_score=base_score, counted=counted, context=context,
+        )
 
     result = {
         "is_correct": False, 
@@ -960,14 +2364,7 @@ def check_answer():
         "already_correct": False,
     }
     if mode == 'speaking':
-        if not user_ans:
-            score = 0
-        else:
-            model, st_util = _get_ai_model_and_util()
-            embeddings1 = model.encode(user_ans, convert_to_tensor=True)
-            embeddings2 = model.encode(correct_ans, convert_to_tensor=True)
-            cosine_score = st_util.cos_sim(embeddings1, embeddings2)
-            score = int(float(cosine_score[0][0]) * 100)
+        score = _answer_score(user_ans, correct_ans, lexical_only=lexical_only)
         
         result['score'] = score
         if score >= 85:
@@ -981,7 +2378,7 @@ def check_answer():
 
         question_label = f"Đọc từ: {correct_ans}"
         question_id = make_question_id(correct_ans)
-        already_correct = _has_been_correct_before(question_id=question_id)
+        already_correct = correct_before(question_id)
         result['already_correct'] = already_correct
 
         awarded_score = 0
@@ -992,7 +2389,7 @@ def check_answer():
         if result['is_correct'] and already_correct:
             result['message'] = f"Đúng rồi! (AI chấm: {score}/100) ✅<br><small>Nhưng câu này bé đã làm đúng trước đó nên không cộng điểm nữa.</small>"
 
-        save_to_history(
+        record(
             "Speaking",
             question_label,
             user_ans,
@@ -1001,19 +2398,18 @@ def check_answer():
             question_id=question_id,
             base_score=score,
             counted=(result['is_correct'] and not already_correct),
-            context=context,
         )
 
     # 2. CHẾ ĐỘ VIẾT (WRITING) - Dùng LanguageTool (Ngữ pháp nâng cao)
     elif mode == 'writing':
         # Kiểm tra chính xác 100% trước
-        if user_ans.lower() == correct_ans.lower():
+        question_id = make_question_id(correct_ans)
+        if answer_matches(question_id, user_ans.lower() == correct_ans.lower()):
             base_score = 100
             result.update({"is_correct": True, "score": base_score, "message": "Chính xác tuyệt đối! 💯"})
 
             question_label = f"Viết từ: {correct_ans}"
-            question_id = make_question_id(correct_ans)
-            already_correct = _has_been_correct_before(question_id=question_id)
+            already_correct = correct_before(question_id)
             result['already_correct'] = already_correct
 
             awarded_score = 0 if already_correct else base_score
@@ -1021,7 +2417,7 @@ def check_answer():
             if already_correct:
                 result['message'] = "Đúng rồi! ✅ Nhưng câu này bé đã đúng trước đó nên không cộng điểm nữa."
 
-            save_to_history(
+            record(
                 "Writing",
                 question_label,
                 user_ans,
@@ -1030,14 +2426,14 @@ def check_answer():
                 question_id=question_id,
                 base_score=base_score,
                 counted=(not already_correct),
-                context=context,
             )
         else:
             # Nếu sai, dùng LanguageTool kiểm tra lỗi ngữ pháp/chính tả
             matches = []
-            tool = _get_grammar_tool()
+            tool = None if lexical_only else _get_grammar_tool()
             if tool is not None:
-                matches = tool.check(user_ans)
+                with _stage('languagetool'):
+                    matches = tool.check(user_ans)
             
             if len(matches) > 0:
                 # Có lỗi ngữ pháp cụ thể
@@ -1053,11 +2449,10 @@ def check_answer():
                 result["score"] = 0
 
             question_label = f"Viết từ: {correct_ans}"
-            question_id = make_question_id(correct_ans)
             result['awarded_score'] = 0
-            result['already_correct'] = _has_been_correct_before(question_id=question_id)
+            result['already_correct'] = correct_before(question_id)
 
-            save_to_history(
+            record(
                 "Writing",
                 question_label,
                 user_ans,
@@ -1066,28 +2461,21 @@ def check_answer():
                 question_id=question_id,
                 base_score=0,
                 counted=False,
-                context=context,
             )
 
     # 2b. CHẾ ĐỘ VIẾT CÂU (GRAMMAR) - Dùng AI + (tuỳ chọn) LanguageTool
     elif mode == 'grammar':
         # Chấm theo mức độ giống nghĩa với câu mẫu (không bắt buộc giống từng ký tự)
-        if not user_ans:
-            score = 0
-        else:
-            model, st_util = _get_ai_model_and_util()
-            embeddings1 = model.encode(user_ans, convert_to_tensor=True)
-            embeddings2 = model.encode(correct_ans, convert_to_tensor=True)
-            cosine_score = st_util.cos_sim(embeddings1, embeddings2)
-            score = int(float(cosine_score[0][0]) * 100)
+        score = _answer_score(user_ans, correct_ans, lexical_only=lexical_only)
 
         result['score'] = score
 
         # Gợi ý lỗi ngữ pháp nếu có Java/LanguageTool
-        tool = _get_grammar_tool()
+        tool = None if lexical_only else _get_grammar_tool()
         if tool is not None and user_ans:
             try:
-                matches = tool.check(user_ans)
+                with _stage('languagetool'):
+                    matches = tool.check(user_ans)
                 if len(matches) > 0:
                     error_msg = matches[0].message
                     suggestion = matches[0].replacements[0] if matches[0].replacements else ""
@@ -1111,7 +2499,7 @@ def check_answer():
 
         question_label = f"Viết câu: {correct_ans}" if correct_ans else "Viết câu"
         question_id = make_question_id(correct_ans or question_text or "grammar")
-        already_correct = _has_been_correct_before(question_id=question_id)
+        already_correct = correct_before(question_id)
         result['already_correct'] = already_correct
 
         awarded_score = 0
@@ -1122,7 +2510,7 @@ def check_answer():
         if result['is_correct'] and already_correct:
             result['message'] = f"Đúng rồi! ({score}/100) ✅ Nhưng câu này bé đã làm đúng trước đó nên không cộng điểm nữa."
 
-        save_to_history(
+        record(
             "Grammar",
             question_label,
             user_ans,
@@ -1131,7 +2519,6 @@ def check_answer():
             question_id=question_id,
             base_score=score,
             counted=(result['is_correct'] and not already_correct),
-            context=context,
         )
 
     # 3. CHẾ ĐỘ TRẮC NGHIỆM (QUIZ)
@@ -1140,9 +2527,9 @@ def check_answer():
         question_id_seed = question_text or correct_ans or "quiz"
         question_id = make_question_id(question_id_seed)
 
-        if user_ans == correct_ans:
+        if answer_matches(question_id, user_ans == correct_ans):
             base_score = 100
-            already_correct = _has_been_correct_before(question_id=question_id)
+            already_correct = correct_before(question_id)
             result['already_correct'] = already_correct
 
             awarded_score = 0 if already_correct else base_score
@@ -1152,7 +2539,7 @@ def check_answer():
             else:
                 result['message'] = "Đúng rồi! 🎉"
 
-            save_to_history(
+            record(
                 "Quiz",
                 question_label,
                 user_ans,
@@ -1161,13 +2548,12 @@ def check_answer():
                 question_id=question_id,
                 base_score=base_score,
                 counted=(not already_correct),
-                context=context,
             )
         else:
             result["message"] = "Tiếc quá, sai mất rồi!"
             result['awarded_score'] = 0
-            result['already_correct'] = _has_been_correct_before(question_id=question_id)
-            save_to_history(
+            result['already_correct'] = correct_before(question_id)
+            record(
                 "Quiz",
                 question_label,
                 user_ans,
@@ -1176,10 +2562,11 @@ def check_answer():
                 question_id=question_id,
                 base_score=0,
                 counted=False,
-                context=context,
             )
 
-    return jsonify(result)
+    if lexical_only:
+        result['awarded_score'] = 0
+    return result
 
 # --- 3. CHATBOT THÔNG MINH (LOGIC ĐÃ SỬA) ---
 
@@ -1190,8 +2577,336 @@ BOT_MEMORY = {
     "xin chào": "Chào bé ngoan!"
 }
 
-# Lưu trạng thái hội thoại đơn giản theo client_id (frontend tạo và gửi lên)
-CHAT_SESSIONS = {}
+# Lưu trạng thái hội thoại theo client_id (frontend tạo và gửi lên)
+class _ChatSession:
+    """Trạng thái chat của 1 bé; dùng __slots__ để mỗi phiên chỉ tốn vài chục byte.
+
+    asked_quiz / asked_missing là bitset (int): bit i = 1 nghĩa là câu i đã hỏi trong vòng hiện tại.
+    """
+
+    __slots__ = ('pending', 'asked_quiz', 'asked_missing', 'grade_id', 'topic_id', 'touched', 'rev', 'loaded')
+
+    def __init__(self):
+        self.pending = None  # {'type': 'vocab'|'grammar'|'pronounce'|'quiz'|'missing', ...}
+        self.asked_quiz = 0
+        self.asked_missing = 0
+        self.grade_id = None
+        self.topic_id = None
+        self.touched = time.monotonic()
+        self.rev = 0  # phiên bản bản ghi lúc load (backend SQLite dùng để compare-and-set khi save)
+        self.loaded = None  # to_dict() lúc load (SQLite): biết lượt này đã đổi gì khi phải gộp
+
+    def to_dict(self) -> dict:
+        return {
+            'pending': self.pending,
+            'asked_quiz': self.asked_quiz,
+            'asked_missing': self.asked_missing,
+            'grade_id': self.grade_id,
+            'topic_id': self.topic_id,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> '_ChatSession':
+        sess = cls()
+        if isinstance(data, dict):
+            sess.pending = data.get('pending') if isinstance(data.get('pending'), dict) else None
+            sess.asked_quiz = int(data.get('asked_quiz') or 0)
+            sess.asked_missing = int(data.get('asked_missing') or 0)
+            sess.grade_id = data.get('grade_id')
+            sess.topic_id = data.get('topic_id')
+        return sess
+
+
+class _BaseChatSessionStore:
+    """Phần chung của các kho phiên chat: khoá theo client cho 1 lượt chat + thread dọn phiên hết hạn.
+
+    Lớp con cài load(key), save(key, sess) và sweep().
+    """
+
+    def __init__(self, turn_locks: int = 64):
+        # Lock theo key (chia sọc): 2 lượt chat song song của cùng client_id chạy lần lượt,
+        # lượt sau thấy trạng thái lượt trước đã ghi thay vì ghi đè lên nhau
+        self._turn_locks = [threading.Lock() for _ in range(max(1, turn_locks))]
+        self._sweeper: threading.Thread | None = None
+
+    @contextmanager
+    def turn(self, key: str):
+        """load -> sửa -> save của 1 lượt chat dưới lock của client."""
+        with self._turn_locks[hash(key) % len(self._turn_locks)]:
+            sess = self.load(key)
+            try:
+                yield sess
+            finally:
+                self.save(key, sess)
+
+    def start_sweeper(self, interval: float) -> None:
+        if interval <= 0 or (self._sweeper is not None and self._sweeper.is_alive()):
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except Exception:
+                    pass
+
+        self._sweeper = threading.Thread(target=run, name='chat-session-sweeper', daemon=True)
+        self._sweeper.start()
+
+
+class _ChatSessionStore(_BaseChatSessionStore):
+    """Kho phiên chat giới hạn kích thước, tự xoá phiên bỏ quên (idle TTL).
+
+    Chia thành nhiều shard, mỗi shard 1 lock + OrderedDict (LRU) để các request song song
+    ít tranh chấp lock. Thread nền dọn các phiên quá hạn định kỳ.
+    """
+
+    def __init__(self, max_size: int, ttl: float, shards: int = 16):
+        super().__init__()
+        self.ttl = ttl
+        self._shards = [OrderedDict() for _ in range(max(1, shards))]
+        self._locks = [threading.Lock() for _ in self._shards]
+        self._shard_max = max(1, max_size // len(self._shards))
+        self.evicted = 0
+        self.expired = 0
+
+    def _index(self, key: str) -> int:
+        return hash(key) % len(self._shards)
+
+    def get_or_create(self, key: str) -> _ChatSession:
+        i = self._index(key)
+        now = time.monotonic()
+        with self._locks[i]:
+            shard = self._shards[i]
+            sess = shard.get(key)
+            if sess is not None and now - sess.touched > self.ttl:
+                sess = None
+                self.expired += 1
+            if sess is None:
+                sess = _ChatSession()
+                shard[key] = sess
+                while len(shard) > self._shard_max:
+                    shard.popitem(last=False)
+                    self.evicted += 1
+            else:
+                shard.move_to_end(key)
+            sess.touched = now
+            return sess
+
+    def get(self, key: str) -> _ChatSession | None:
+        i = self._index(key)
+        with self._locks[i]:
+            return self._shards[i].get(key)
+
+    # Giao diện chung với _SQLiteChatSessionStore: phiên trong RAM được sửa trực tiếp nên save() không cần làm gì
+    load = get_or_create
+
+    def save(self, key: str, sess: _ChatSession) -> None:
+        pass
+
+    def __len__(self) -> int:
+        return sum(len(s) for s in self._shards)
+
+    def sweep(self) -> int:
+        """Xoá các phiên không hoạt động quá ttl giây. Trả về số phiên đã xoá."""
+        removed = 0
+        deadline = time.monotonic() - self.ttl
+        for lock, shard in zip(self._locks, self._shards):
+            with lock:
+                # OrderedDict theo thứ tự dùng gần nhất -> phiên cũ nằm đầu
+                while shard:
+                    key, sess = next(iter(shard.items()))
+                    if sess.touched > deadline:
+                        break
+                    del shard[key]
+                    removed += 1
+        self.expired += removed
+        return removed
+
+    def stats(self) -> dict:
+        return {
+            'backend': 'memory',
+            'sessions': len(self),
+            'max_size': self._shard_max * len(self._shards),
+            'ttl': self.ttl,
+            'evicted': self.evicted,
+            'expired': self.expired,
+        }
+
+
+class _SQLiteChatSessionStore(_BaseChatSessionStore):
+    """Kho phiên chat dùng chung giữa nhiều process (SQLite ở chế độ WAL).
+
+    Mỗi lượt chat: load() đọc snapshot JSON của phiên, save() ghi lại. Câu hỏi đang chờ
+    vì vậy không mất khi request kế tiếp rơi vào worker khác hoặc worker bị restart.
+    save() là compare-and-set theo cột rev: lượt chat song song ở worker khác đã ghi trước thì
+    đọc lại bản mới, áp các thay đổi của lượt này lên đó (bitset câu đã hỏi thì gộp) rồi ghi lại.
+    """
+
+    _SAVE_ATTEMPTS = 5
+
+    def __init__(self, path: str, max_size: int, ttl: float):
+        super().__init__()
+        self.path = path
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.expired = 0
+        self.evicted = 0
+        self.conflicts = 0
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            folder = os.path.dirname(self.path) or '.'
+            os.makedirs(folder, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS chat_sessions ('
+                ' key TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL,'
+                ' rev INTEGER NOT NULL DEFAULT 0)'
+            )
+            # File tạo bởi bản cũ chưa có cột rev
+            if 'rev' not in {row[1] for row in conn.execute('PRAGMA table_info(chat_sessions)')}:
+                conn.execute('ALTER TABLE chat_sessions ADD COLUMN rev INTEGER NOT NULL DEFAULT 0')
+            conn.execute('CREATE INDEX IF NOT EXISTS chat_sessions_updated ON chat_sessions (updated_at)')
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def load(self, key: str) -> _ChatSession:
+        try:
+            row = self._conn().execute(
+                'SELECT data, updated_at, rev FROM chat_sessions WHERE key = ?', (key,)
+            ).fetchone()
+        except Exception:
+            row = None
+        sess = _ChatSession()
+        if row and time.time() - row[1] <= self.ttl:
+            try:
+                sess = _ChatSession.from_dict(json.loads(row[0]))
+            except Exception:
+                pass
+        if row:
+            # Phiên hết hạn vẫn giữ rev của bản ghi cũ để save() ghi đè được
+            sess.rev = int(row[2] or 0)
+        sess.loaded = sess.to_dict()
+        return sess
+
+    get_or_create = load
+
+    def _try_save(self, key: str, sess: _ChatSession) -> bool:
+        """Ghi nếu bản ghi vẫn ở rev lúc load; False nếu lượt khác đã ghi trước."""
+        data = json.dumps(sess.to_dict(), ensure_ascii=False)
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(
+                'UPDATE chat_sessions SET data = ?, updated_at = ?, rev = rev + 1 WHERE key = ? AND rev = ?',
+                (data, time.time(), key, sess.rev),
+            )
+            if cur.rowcount == 0:
+                # Chưa có bản ghi (phiên mới hoặc vừa bị sweep); có rồi mà rev khác -> bị ignore
+                cur = conn.execute(
+                    'INSERT OR IGNORE INTO chat_sessions (key, data, updated_at, rev) VALUES (?, ?, ?, ?)',
+                    (key, data, time.time(), sess.rev + 1),
+                )
+        return cur.rowcount > 0
+
+    def _rebase(self, key: str, sess: _ChatSession) -> None:
+        """Đọc lại bản đã lưu và áp lên đó các trường lượt này đã đổi (so với lúc load)."""
+        fresh = self.load(key)
+        base = sess.loaded or _ChatSession().to_dict()
+        merged = fresh.to_dict()
+        for field, value in sess.to_dict().items():
+            if value == base.get(field):
+                continue  # lượt này không đổi -> giữ giá trị mới của lượt kia
+            if field in ('asked_quiz', 'asked_missing'):
+                old = int(base.get(field) or 0)
+                # Chỉ thêm câu đã hỏi -> gộp với câu lượt kia đã hỏi; reset vòng mới thì lấy của lượt này
+                if value & old == old:
+                    value |= int(merged.get(field) or 0)
+            merged[field] = value
+        sess.pending = merged['pending']
+        sess.asked_quiz = merged['asked_quiz']
+        sess.asked_missing = merged['asked_missing']
+        sess.grade_id = merged['grade_id']
+        sess.topic_id = merged['topic_id']
+        sess.rev = fresh.rev
+        sess.loaded = fresh.loaded
+
+    def save(self, key: str, sess: _ChatSession) -> None:
+        try:
+            for _ in range(self._SAVE_ATTEMPTS):
+                if self._try_save(key, sess):
+                    sess.rev += 1
+                    sess.loaded = sess.to_dict()
+                    return
+                self.conflicts += 1
+                self._rebase(key, sess)
+            app.logger.warning("[chat] phiên %s: ghi không được sau %d lần gộp", key, self._SAVE_ATTEMPTS)
+        except Exception:
+            pass
+
+    def __len__(self) -> int:
+        try:
+            return int(self._conn().execute('SELECT COUNT(*) FROM chat_sessions').fetchone()[0])
+        except Exception:
+            return 0
+
+    def sweep(self) -> int:
+        removed = 0
+        try:
+            conn = self._conn()
+            with conn:
+                cur = conn.execute('DELETE FROM chat_sessions WHERE updated_at < ?', (time.time() - self.ttl,))
+                removed = max(0, cur.rowcount)
+                self.expired += removed
+                cur = conn.execute(
+                    'DELETE FROM chat_sessions WHERE key IN ('
+                    ' SELECT key FROM chat_sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)',
+                    (self.max_size,),
+                )
+                self.evicted += max(0, cur.rowcount)
+                removed += max(0, cur.rowcount)
+        except Exception:
+            pass
+        return removed
+
+    def stats(self) -> dict:
+        return {
+            'backend': 'sqlite',
+            'sessions': len(self),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'evicted': self.evicted,
+            'expired': self.expired,
+            'conflicts': self.conflicts,
+        }
+
+
+def _create_chat_session_store():
+    """Chọn backend theo ROBO_CHAT_SESSION_BACKEND: 'memory' (mặc định, 1 process) hoặc 'sqlite' (nhiều worker)."""
+    max_size = int(os.getenv('ROBO_CHAT_SESSIONS_MAX', '10000'))
+    ttl = float(os.getenv('ROBO_CHAT_SESSION_TTL', '3600'))
+    backend = os.getenv('ROBO_CHAT_SESSION_BACKEND', 'memory').strip().lower()
+    if backend == 'sqlite':
+        path = os.getenv(
+            'ROBO_CHAT_SESSION_DB',
+            os.path.join(os.path.dirname(__file__), 'chat_sessions.sqlite'),
+        )
+        return _SQLiteChatSessionStore(path, max_size=max_size, ttl=ttl)
+    return _ChatSessionStore(
+        max_size=max_size,
+        ttl=ttl,
+        shards=int(os.getenv('ROBO_CHAT_SESSION_SHARDS', '16')),
+    )
+
+
+CHAT_SESSIONS = _create_chat_session_store()
+_CHAT_SWEEP_INTERVAL = float(os.getenv('ROBO_CHAT_SWEEP_INTERVAL', '60'))
 
 # Từ điển cứng để sửa lỗi ngữ pháp các câu ngắn
 FIXED_TRANSLATIONS = {
@@ -1201,15 +2916,108 @@ FIXED_TRANSLATIONS = {
 }
 
 def is_vietnamese(text):
-    return bool(re.search(r'[àáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđ]', text.lower()))
+    return bool(_VIETNAMESE_CHAR_RE.search(text.lower()))
+
+
+_VIETNAMESE_CHAR_RE = re.compile(r'[àáạảãâầấậẩẫăằắặẳẵèéẹẻẽêềếệểễìíịỉĩòóọỏõôồốộổỗơờớợởỡùúụủũưừứựửữỳýỵỷỹđ]')
+
+# --- Định tuyến ý định (intent) cho /api/chat ---
+# Bảng khai báo: (intent, kiểu khớp, từ khoá). Thứ tự dòng = độ ưu tiên khi tin nhắn khớp nhiều intent.
+#   exact: cả tin nhắn đúng bằng từ khoá; contains: từ khoá nằm trong tin nhắn; prefix: tin nhắn bắt đầu bằng từ khoá.
+# Thêm intent mới chỉ cần thêm dòng ở đây; tất cả được gộp thành 1 regex, quét tin nhắn 1 lần.
+_CHAT_INTENT_RULES = (
+    ('stop', 'exact', ('stop', 'dừng', 'thoát', 'reset')),
+    ('help', 'exact', ('help', 'giúp', 'giúp đỡ', 'hướng dẫn')),
+    ('translate', 'contains', ('dịch', 'nghĩa là', 'tiếng anh là', 'tiếng việt là')),
+    ('start_vocab', 'contains', ('từ vựng', 'vocab')),
+    ('start_grammar', 'contains', ('ngữ pháp', 'grammar')),
+    ('start_grammar', 'prefix', ('viết câu',)),
+    ('start_pronounce', 'contains', ('phát âm', 'luyện nói', 'pronounce')),
+    ('start_missing', 'contains', ('điền', 'missing', 'fill')),
+    ('start_quiz', 'contains', ('kiểm tra', 'quiz', 'test')),
+)
+
+# Cụm từ bỏ đi khỏi câu cần dịch (cụm dài đứng trước để khớp trọn cụm)
+_TRANSLATE_STRIP_KEYWORDS = (
+    "dịch sang tiếng anh", "dịch sang tiếng việt", "dịch câu", "dịch từ", "dịch",
+    "nghĩa là gì", "nghĩa là", "tiếng anh là gì", "tiếng việt là gì", "là gì",
+    "tiếng anh là", "tiếng việt là", "tiếng anh", "tiếng việt",
+)
+
+
+class _ChatIntent:
+    __slots__ = ('name', 'payload', 'target_lang')
+
+    def __init__(self, name: str | None, payload: str = '', target_lang: str | None = None):
+        self.name = name
+        self.payload = payload
+        self.target_lang = target_lang
+
+
+def _compile_chat_intents(rules):
+    exact: dict[str, str] = {}
+    alternatives: list[str] = []
+    group_intents: dict[str, tuple[int, str]] = {}
+    for priority, (intent, kind, keywords) in enumerate(rules):
+        if kind == 'exact':
+            for kw in keywords:
+                exact.setdefault(kw, intent)
+            continue
+        group = f"r{priority}"
+        words = '|'.join(re.escape(kw) for kw in sorted(keywords, key=len, reverse=True))
+        alternatives.append(f"(?P<{group}>{'^' if kind == 'prefix' else ''}(?:{words}))")
+        group_intents[group] = (priority, intent)
+    # Lookahead rỗng -> finditer thử ở mọi vị trí, bắt được cả các từ khoá chồng lên nhau
+    pattern = re.compile(f"(?=(?:{'|'.join(alternatives)}))") if alternatives else None
+    return exact, pattern, group_intents
+
+
+_CHAT_INTENT_EXACT, _CHAT_INTENT_RE, _CHAT_INTENT_GROUPS = _compile_chat_intents(_CHAT_INTENT_RULES)
+_TRANSLATE_STRIP_RE = re.compile('|'.join(re.escape(kw) for kw in _TRANSLATE_STRIP_KEYWORDS))
+_TRANSLATE_DIRECTION_RE = re.compile(r'(?P<vi>nghĩa là|tiếng việt)|(?P<en>tiếng anh)')
+
+
+def _match_chat_intent(raw_msg: str) -> _ChatIntent:
+    """Trả về intent có độ ưu tiên cao nhất của tin nhắn (name=None nếu không khớp).
+
+    Với intent 'translate', payload là phần cần dịch và target_lang là 'vi'/'en' nếu bé nói rõ.
+    """
+    msg_lower = raw_msg.lower().strip()
+    name = _CHAT_INTENT_EXACT.get(msg_lower)
+    if name is None and _CHAT_INTENT_RE is not None:
+        best = None
+        for m in _CHAT_INTENT_RE.finditer(msg_lower):
+            hit = _CHAT_INTENT_GROUPS[m.lastgroup]
+            if best is None or hit[0] < best[0]:
+                best = hit
+                if best[0] == 0:
+                    break
+        name = best[1] if best else None
+
+    if name != 'translate':
+        return _ChatIntent(name)
+
+    target_lang = None
+    has_vi = has_en = False
+    for m in _TRANSLATE_DIRECTION_RE.finditer(msg_lower):
+        has_vi = has_vi or m.lastgroup == 'vi'
+        has_en = has_en or m.lastgroup == 'en'
+    if has_vi:
+        target_lang = 'vi'
+    elif has_en:
+        target_lang = 'en'
+    return _ChatIntent(name, clean_input(raw_msg), target_lang)
+
+
+def _translation_target_lang(intent: _ChatIntent) -> str:
+    """Ngôn ngữ đích: theo lời bé nói rõ, nếu không thì đoán theo dấu tiếng Việt."""
+    if intent.target_lang is not None:
+        return intent.target_lang
+    return 'en' if is_vietnamese(intent.payload) else 'vi'
+
 
 def clean_input(text):
-    keywords = ["dịch câu", "dịch từ", "dịch sang tiếng anh", "dịch sang tiếng việt", 
-                "dịch", "nghĩa là gì", "nghĩa là", "là gì", "tiếng anh là", 
-                "tiếng việt là", "tiếng anh", "tiếng việt"]
-    text_lower = text.lower()
-    for kw in keywords:
-        text_lower = text_lower.replace(kw, "")
+    text_lower = _TRANSLATE_STRIP_RE.sub('', text.lower())
     cleaned = re.sub(r'^[\W_]+|[\W_]+$', '', text_lower)
     cleaned = cleaned.strip()
     # Các mẫu thường gặp: "tiếng Anh của ..." -> bỏ "của"
@@ -1219,7 +3027,7 @@ def clean_input(text):
 
 def _get_topic_safe(grade_id: str, topic_id: str):
     try:
-        grade = CURRICULUM.get(grade_id)
+        grade = _CURRICULUM_COMPILED.data.get(grade_id)
         if not isinstance(grade, dict):
             return None
         topics = grade.get('topics')
@@ -1233,15 +3041,6 @@ def _get_topic_safe(grade_id: str, topic_id: str):
         return None
 
 
-def _normalize_en_answer(text: str) -> str:
-    text = '' if text is None else str(text)
-    text = text.strip().lower()
-    # Giữ chữ cái, số và khoảng trắng; loại ký tự lạ
-    text = re.sub(r"[^a-z0-9\s']", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
-
-
 def _similarity(a: str, b: str) -> float:
     a = _normalize_en_answer(a)
     b = _normalize_en_answer(b)
@@ -1250,25 +3049,11 @@ def _similarity(a: str, b: str) -> float:
     return SequenceMatcher(None, a, b).ratio()
 
 
-def _get_or_create_chat_session(client_id: str) -> dict:
+def _chat_session_key(client_id: str) -> str:
     key = _normalize_key(client_id)
     if not key:
         key = 'anonymous'
-    sess = CHAT_SESSIONS.get(key)
-    if not isinstance(sess, dict):
-        sess = {
-            'pending': None,  # {'type': 'vocab'|'grammar'|'pronounce'|'quiz', ...}
-            'asked': {
-                'quiz': [],
-                'missing': [],
-            },
-            'gradeId': None,
-            'topicId': None,
-            'updated_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        }
-        CHAT_SESSIONS[key] = sess
-    sess['updated_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    return sess
+    return key
 
 
 def _default_chat_actions():
@@ -1282,249 +3067,152 @@ def _default_chat_actions():
     ]
 
 
-def _pick_nonrepeating_index(sess: dict | None, key: str, candidates: list[int]) -> int | None:
+def _pick_nonrepeating_index(sess: _ChatSession | None, key: str, candidates: tuple[int, ...]) -> int | None:
     """Pick an index from candidates avoiding repeats per session until cycle completes."""
     if not candidates:
         return None
 
-    used: list[int] = []
-    if isinstance(sess, dict):
-        asked = sess.get('asked')
-        if not isinstance(asked, dict):
-            asked = {}
-            sess['asked'] = asked
-        used = asked.get(key)
-        if not isinstance(used, list):
-            used = []
-            asked[key] = used
-
-    remaining = [i for i in candidates if i not in used]
+    attr = f"asked_{key}"
+    used = getattr(sess, attr, 0) if sess is not None else 0
+    remaining = [i for i in candidates if not (used >> i) & 1]
     if not remaining:
-        used.clear()
-        remaining = candidates[:]
+        used = 0
+        remaining = list(candidates)
 
     picked = random.choice(remaining)
-    used.append(picked)
+    if sess is not None:
+        setattr(sess, attr, used | (1 << picked))
     return picked
 
 
-def _mask_word_missing_letters(word: str) -> str:
-    """Return a masked word where some inner letters are replaced with '_' (stable-ish per word)."""
-    w = '' if word is None else str(word)
-    chars = list(w)
-    letter_positions = [i for i, c in enumerate(chars) if re.match(r"[A-Za-z]", c)]
-    if len(letter_positions) <= 2:
-        return w
-
-    allowed = letter_positions[1:-1]
-    if not allowed:
-        return w
-
-    target = max(1, min(3, len(letter_positions) // 3))
-    seed = 0
-    for ch in w:
-        seed = (seed + ord(ch)) % 997
+def _get_compiled_topic(grade_id: str, topic_id: str) -> _CompiledTopic | None:
+    return _CURRICULUM_COMPILED.topics.get((grade_id, topic_id))
 
-    picked = set()
-    tries = 0
-    while len(picked) < target and tries < 50:
-        pos = allowed[(seed + tries * 17) % len(allowed)]
-        picked.add(pos)
-        tries += 1
 
-    for i in picked:
-        chars[i] = '_'
-    # Add spaces between characters to make blanks easier to see in chat
-    return ' '.join(chars)
+def _curriculum_item(question_id: str) -> dict | None:
+    return _CURRICULUM_COMPILED.items.get(question_id)
 
 
-def _pick_missing_question(topic: dict, sess: dict | None = None):
-    vocab = topic.get('vocab') if isinstance(topic, dict) else None
-    if not isinstance(vocab, list) or not vocab:
+def _curriculum_answer_matches(question_id: str, user_ans: str) -> bool | None:
+    """So câu trả lời với đáp án đã chuẩn hoá của mục giáo trình; None nếu question_id không thuộc giáo trình."""
+    item = _curriculum_item(question_id)
+    if item is None:
         return None
+    normalize = _normalize_choice_text if item['section'] == 'quiz' else _normalize_en_answer
+    return normalize(user_ans) == item['answer_norm']
 
-    candidates: list[int] = []
-    for i, it in enumerate(vocab):
-        if not isinstance(it, dict):
-            continue
-        if not it.get('en') or not it.get('vi'):
-            continue
-        candidates.append(i)
-    if not candidates:
-        return None
 
-    idx = _pick_nonrepeating_index(sess, 'missing', candidates)
-    if idx is None:
+def _pick_missing_question(topic: _CompiledTopic, sess: _ChatSession | None = None):
+    if topic is None:
         return None
-    item = vocab[idx] if isinstance(vocab[idx], dict) else None
-    if not item:
+    idx = _pick_nonrepeating_index(sess, 'missing', topic.vocab_candidates)
+    if idx is None:
         return None
-
-    en = str(item.get('en')).strip()
-    vi = str(item.get('vi')).strip()
+    item = topic.vocab[idx]
     return {
         'type': 'missing',
         'vocabIndex': idx,
-        'en': en,
-        'vi': vi,
-        'masked': _mask_word_missing_letters(en),
+        'en': item['en'],
+        'vi': item['vi'],
+        'masked': item['masked'],
     }
 
 
-def _pick_vocab_question(topic: dict):
-    vocab = topic.get('vocab') if isinstance(topic, dict) else None
-    if not isinstance(vocab, list) or not vocab:
-        return None
-    idx = random.randint(0, len(vocab) - 1)
-    item = vocab[idx] if isinstance(vocab[idx], dict) else None
-    if not item or not item.get('en') or not item.get('vi'):
+def _pick_vocab_question(topic: _CompiledTopic):
+    if topic is None or not topic.vocab_candidates:
         return None
+    idx = random.choice(topic.vocab_candidates)
+    item = topic.vocab[idx]
     return {
         'type': 'vocab',
         'vocabIndex': idx,
-        'en': str(item.get('en')).strip(),
-        'vi': str(item.get('vi')).strip(),
+        'en': item['en'],
+        'vi': item['vi'],
     }
 
 
-def _pick_grammar_question(topic: dict):
-    grammar = topic.get('grammar') if isinstance(topic, dict) else None
-    if not isinstance(grammar, list) or not grammar:
-        return None
-    idx = random.randint(0, len(grammar) - 1)
-    item = grammar[idx] if isinstance(grammar[idx], dict) else None
-    if not item or not item.get('prompt_vi') or not item.get('answer'):
+def _pick_grammar_question(topic: _CompiledTopic):
+    if topic is None or not topic.grammar_candidates:
         return None
+    idx = random.choice(topic.grammar_candidates)
+    item = topic.grammar[idx]
     return {
         'type': 'grammar',
         'grammarIndex': idx,
-        'prompt_vi': str(item.get('prompt_vi')).strip(),
-        'answer': str(item.get('answer')).strip(),
+        'prompt_vi': item['prompt_vi'],
+        'answer': item['answer'],
     }
 
 
-def _pick_quiz_question(topic: dict, sess: dict | None = None):
-    quiz = topic.get('quiz') if isinstance(topic, dict) else None
-    if not isinstance(quiz, list) or not quiz:
-        return None
-
-    # Build candidate indices that are valid quiz items
-    candidates: list[int] = []
-    for i, it in enumerate(quiz):
-        if not isinstance(it, dict):
-            continue
-        if not it.get('question') or not it.get('options') or not it.get('answer'):
-            continue
-        opts = it.get('options')
-        if not isinstance(opts, list) or len(opts) < 2:
-            continue
-        options = [str(o).strip() for o in opts if str(o).strip()]
-        if len(options) < 2:
-            continue
-        candidates.append(i)
-
-    if not candidates:
+def _pick_quiz_question(topic: _CompiledTopic, sess: _ChatSession | None = None):
+    if topic is None:
         return None
-
     # Avoid repeating the same question over and over for the same client.
-    used: list[int] = []
-    if isinstance(sess, dict):
-        asked = sess.get('asked')
-        if not isinstance(asked, dict):
-            asked = {}
-            sess['asked'] = asked
-        used = asked.get('quiz')
-        if not isinstance(used, list):
-            used = []
-            asked['quiz'] = used
-
-    remaining = [i for i in candidates if i not in used]
-    if not remaining:
-        # Completed a full cycle -> reset so user can practice again.
-        if used is not None:
-            used.clear()
-        remaining = candidates[:]
-
-    idx = random.choice(remaining)
-    if used is not None:
-        used.append(idx)
-
-    item = quiz[idx] if isinstance(quiz[idx], dict) else None
-    if not item:
+    idx = _pick_nonrepeating_index(sess, 'quiz', topic.quiz_candidates)
+    if idx is None:
         return None
-
-    opts = item.get('options')
-    options = [str(o).strip() for o in (opts if isinstance(opts, list) else []) if str(o).strip()]
+    item = topic.quiz[idx]
     return {
         'type': 'quiz',
         'quizIndex': idx,
-        'question': str(item.get('question')).strip(),
-        'options': options,
-        'answer': str(item.get('answer')).strip(),
+        'question': item['question'],
+        'options': list(item['options']),
+        'answer': item['answer'],
     }
 
 
-def _normalize_choice_text(text: str) -> str:
-    text = '' if text is None else str(text)
-    text = text.strip().lower()
-    text = re.sub(r"\s+", " ", text)
-    return text
+_QUIZ_LETTER_RE = re.compile(r"^\s*([abcd])\s*[\)\.\:\-]?\s*$")
+_QUIZ_NUMBER_RE = re.compile(r"^\s*([1-4])\s*$")
 
 
-def _quiz_parse_user_choice(raw_msg: str, options: list[str]):
-    """Return (choice_index, choice_text). choice_index may be None if free-text."""
+def _quiz_parse_user_choice(raw_msg: str, options: list[str], options_norm: list[str] | None = None):
+    """Return (choice_index, choice_text). choice_index may be None if free-text.
+
+    options_norm: options already passed through _normalize_choice_text (from _CompiledTopic).
+    """
     msg = _normalize_choice_text(raw_msg)
     if not msg:
         return None, ''
 
     # Accept A/B/C/D or 1/2/3/4 (and forms like "A)" "b." etc)
-    m = re.match(r"^\s*([abcd])\s*[\)\.\:\-]?\s*$", msg)
+    m = _QUIZ_LETTER_RE.match(msg)
     if m:
         idx = ord(m.group(1)) - ord('a')
         if 0 <= idx < len(options):
             return idx, options[idx]
-    m2 = re.match(r"^\s*([1-4])\s*$", msg)
-    if m2:
-        idx = int(m2.group(1)) - 1
-        if 0 <= idx < len(options):
-            return idx, options[idx]
-
-    # If user typed option text, match it
-    for i, opt in enumerate(options):
-        if _normalize_choice_text(opt) == msg:
-            return i, opt
-    return None, raw_msg
-
-
-def _score_grammar_like_check_api(user_ans: str, correct_ans: str):
-    user_ans = (user_ans or '').strip()
-    correct_ans = (correct_ans or '').strip()
-    if not user_ans or not correct_ans:
-        return {
-            'score': 0,
-            'is_correct': False,
-            'message': 'Bé thử viết câu tiếng Anh nhé!',
-            'suggestion': f"Gợi ý mẫu: <b>{correct_ans}</b>" if correct_ans else ''
-        }
+    m2 = _QUIZ_NUMBER_RE.match(msg)
+    if m2:
+        idx = int(m2.group(1)) - 1
+        if 0 <= idx < len(options):
+            return idx, options[idx]
 
-    model, st_util = _get_ai_model_and_util()
-    embeddings1 = model.encode(user_ans, convert_to_tensor=True)
-    embeddings2 = model.encode(correct_ans, convert_to_tensor=True)
-    cosine_score = st_util.cos_sim(embeddings1, embeddings2)
-    score = int(float(cosine_score[0][0]) * 100)
+    # If user typed option text, match it
+    if options_norm is None:
+        options_norm = [_normalize_choice_text(opt) for opt in options]
+    for i, opt_norm in enumerate(options_norm):
+        if opt_norm == msg:
+            return i, options[i]
+    return None, raw_msg
 
-    suggestion = ''
+
+def _grammar_tool_suggestion(user_ans: str) -> str:
+    """Gợi ý lỗi đầu tiên của LanguageTool (chuỗi rỗng nếu không có tool/không có lỗi)."""
     tool = _get_grammar_tool()
-    if tool is not None:
-        try:
+    if tool is None:
+        return ''
+    try:
+        with _stage('languagetool'):
             matches = tool.check(user_ans)
-            if matches:
-                m = matches[0]
-                repl = (m.replacements[0] if m.replacements else '')
-                suggestion = f"Lỗi gợi ý: {m.message}." + (f" <br>Gợi ý sửa: <b>{repl}</b>" if repl else '')
-        except Exception:
-            pass
+        if matches:
+            m = matches[0]
+            repl = (m.replacements[0] if m.replacements else '')
+            return f"Lỗi gợi ý: {m.message}." + (f" <br>Gợi ý sửa: <b>{repl}</b>" if repl else '')
+    except Exception:
+        pass
+    return ''
+
 
+def _grammar_result(score: int, correct_ans: str, suggestion: str) -> dict:
     if score >= 85:
         return {'score': score, 'is_correct': True, 'message': f"Rất tốt! ({score}/100) ✅", 'suggestion': suggestion}
     if score >= 60:
@@ -1541,6 +3229,30 @@ def _score_grammar_like_check_api(user_ans: str, correct_ans: str):
         'suggestion': (suggestion + ("<br>" if suggestion else "") + f"Mẫu đúng: <b>{correct_ans}</b>")
     }
 
+
+def _score_grammar_like_check_api(user_ans: str, correct_ans: str, *, with_grammar_tool: bool = True):
+    """Chấm câu theo độ giống nghĩa; with_grammar_tool=False để bỏ qua LanguageTool (chạy sau khi stream)."""
+    user_ans = (user_ans or '').strip()
+    correct_ans = (correct_ans or '').strip()
+    if not user_ans or not correct_ans:
+        return {
+            'score': 0,
+            'is_correct': False,
+            'message': 'Bé thử viết câu tiếng Anh nhé!',
+            'suggestion': f"Gợi ý mẫu: <b>{correct_ans}</b>" if correct_ans else ''
+        }
+
+    model, st_util = _get_ai_model_and_util()
+    with _stage('model_encode'):
+        embeddings1 = model.encode(user_ans, convert_to_tensor=True)
+        embeddings2 = model.encode(correct_ans, convert_to_tensor=True)
+        cosine_score = st_util.cos_sim(embeddings1, embeddings2)
+    score = int(float(cosine_score[0][0]) * 100)
+
+    suggestion = _grammar_tool_suggestion(user_ans) if with_grammar_tool else ''
+    return _grammar_result(score, correct_ans, suggestion)
+
+
 @app.route('/api/chat', methods=['POST'])
 def chat_bot():
     data = request.json if isinstance(request.json, dict) else {}
@@ -1550,85 +3262,149 @@ def chat_bot():
     if not isinstance(context, dict):
         context = {}
 
-    sess = _get_or_create_chat_session(client_id)
+    # Backend dùng chung (SQLite) cần ghi lại snapshot sau mỗi lượt chat: turn() load/save dưới lock của client
+    with CHAT_SESSIONS.turn(_chat_session_key(client_id)) as sess:
+        reply = _chat_reply(sess, raw_msg, context)
+    return jsonify(reply)
+
+
+_CHAT_ENRICH_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv('ROBO_CHAT_ENRICH_WORKERS', '8')),
+    thread_name_prefix='chat-enrich',
+)
+
+
+def _sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Giống /api/chat nhưng trả về Server-Sent Events.
+
+    - event 'reply': phản hồi ngay (đúng/sai, câu hỏi, nút bấm) - cùng dạng JSON với /api/chat
+    - event 'update': {kind, reply} khi phần chậm (dịch, IPA, gợi ý ngữ pháp) xong -> thay nội dung reply
+    - event 'done': kết thúc stream
+    """
+    data = request.json if isinstance(request.json, dict) else {}
+    raw_msg = str(data.get('message', '')).strip()
+    client_id = str(data.get('client_id', '')).strip()
+    context = data.get('context') if isinstance(data, dict) else None
+    if not isinstance(context, dict):
+        context = {}
+
+    deferred: list = []
+    with CHAT_SESSIONS.turn(_chat_session_key(client_id)) as sess:
+        first = _chat_reply(sess, raw_msg, context, deferred)
+
+    def generate():
+        yield _sse_event('reply', first)
+        futures = [_CHAT_ENRICH_POOL.submit(fn) for fn in deferred]
+        for fut in as_completed(futures):
+            try:
+                update = fut.result()
+            except Exception:
+                update = None
+            if update:
+                yield _sse_event('update', update)
+        yield _sse_event('done', {})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
 
+def _chat_reply(sess: _ChatSession, raw_msg: str, context: dict, deferred: list | None = None):
+    """Xử lý 1 lượt chat, trả về dict phản hồi.
+
+    deferred: nếu truyền list (chế độ stream), các phần chậm (dịch qua mạng, IPA, LanguageTool)
+    không chạy ngay mà được thêm vào list dưới dạng hàm không tham số trả về dict cập nhật.
+    """
     # Cập nhật grade/topic nếu frontend đang chọn bài
     ctx_grade = _normalize_key(context.get('gradeId'))
     ctx_topic = _normalize_key(context.get('topicId'))
     if ctx_grade:
-        sess['gradeId'] = ctx_grade
+        sess.grade_id = ctx_grade
     if ctx_topic:
-        sess['topicId'] = ctx_topic
+        sess.topic_id = ctx_topic
 
     # Xác định topic hiện hành
-    grade_id = sess.get('gradeId')
-    topic_id = sess.get('topicId')
-    topic = _get_topic_safe(grade_id, topic_id) if grade_id and topic_id else None
-    pending = sess.get('pending') if isinstance(sess, dict) else None
+    grade_id = sess.grade_id
+    topic_id = sess.topic_id
+    topic = _get_compiled_topic(grade_id, topic_id) if grade_id and topic_id else None
+    pending = sess.pending
 
     msg_lower = raw_msg.lower().strip()
     if msg_lower in BOT_MEMORY:
-        return jsonify({
+        return {
             "reply": BOT_MEMORY[msg_lower],
             "actions": _default_chat_actions(),
-        })
+        }
 
     # Nếu không có message thì trả về hướng dẫn
     if not msg_lower:
-        return jsonify({
+        return {
             "reply": "Chào bé! Robo có thể luyện <b>từ vựng</b>, <b>ngữ pháp</b>, và <b>phát âm</b>. Bé gõ: 'từ vựng' / 'ngữ pháp' / 'phát âm' nhé!",
             "actions": _default_chat_actions(),
-        })
+        }
+
+    intent = _match_chat_intent(raw_msg)
 
     # Lệnh dừng/reset
-    if msg_lower in ['stop', 'dừng', 'thoát', 'reset']:
-        sess['pending'] = None
-        return jsonify({
+    if intent.name == 'stop':
+        sess.pending = None
+        return {
             "reply": "Ok bé! Robo đã dừng bài luyện. Bé muốn luyện gì tiếp?",
             "actions": _default_chat_actions(),
-        })
+        }
 
     # Ưu tiên chế độ dịch nếu bé hỏi rõ "dịch"
-    if 'dịch' in msg_lower or 'nghĩa là' in msg_lower or 'tiếng anh là' in msg_lower or 'tiếng việt là' in msg_lower:
-        clean_text = clean_input(raw_msg)
+    if intent.name == 'translate':
+        clean_text = intent.payload
         if not clean_text:
-            return jsonify({
+            return {
                 "reply": "Bé muốn dịch từ/câu gì? Gõ: Dịch ...",
                 "actions": _default_chat_actions(),
-            })
-
-        is_content_vietnamese = is_vietnamese(clean_text)
-        target_lang = 'en'
-        if "nghĩa là" in msg_lower or "tiếng việt" in msg_lower:
-            target_lang = 'vi'
-        elif "tiếng anh" in msg_lower:
-            target_lang = 'en'
-        else:
-            if not is_content_vietnamese:
-                target_lang = 'vi'
+            }
 
-        trans = perform_translation(clean_text, target_lang)
+        target_lang = _translation_target_lang(intent)
         clean_safe = _escape_html(clean_text)
-        trans_safe = _escape_html(trans)
-        if target_lang == 'en':
-            response = f"📖 '{clean_safe}' tiếng Anh là: <b>{trans_safe}</b>"
-        else:
-            response = f"📖 '{clean_safe}' nghĩa là: <b>{trans_safe}</b>"
-        return jsonify({
-            "reply": response,
+
+        def translation_reply(trans):
+            trans_safe = _escape_html(trans)
+            if target_lang == 'en':
+                return f"📖 '{clean_safe}' tiếng Anh là: <b>{trans_safe}</b>"
+            return f"📖 '{clean_safe}' nghĩa là: <b>{trans_safe}</b>"
+
+        local = _translate_without_network(clean_text, target_lang)
+        if deferred is not None and local is None:
+            deferred.append(lambda: {
+                "kind": "translation",
+                "reply": translation_reply(_translate_prepared(clean_text, target_lang, None)),
+            })
+            return {
+                "reply": f"📖 Robo đang dịch '{clean_safe}'...",
+                "actions": _default_chat_actions(),
+            }
+
+        trans = _translate_prepared(clean_text, target_lang, local)
+        return {
+            "reply": translation_reply(trans),
             "actions": _default_chat_actions(),
-        })
+        }
 
     # Lệnh bắt đầu luyện
-    start_vocab = ('từ vựng' in msg_lower) or ('vocab' in msg_lower)
-    start_grammar = ('ngữ pháp' in msg_lower) or ('grammar' in msg_lower) or (msg_lower.startswith('viết câu'))
-    start_pronounce = ('phát âm' in msg_lower) or ('luyện nói' in msg_lower) or ('pronounce' in msg_lower)
-    start_missing = ('điền' in msg_lower) or ('missing' in msg_lower) or ('fill' in msg_lower)
-    start_quiz = ('kiểm tra' in msg_lower) or ('quiz' in msg_lower) or ('test' in msg_lower)
-    start_help = msg_lower in ['help', 'giúp', 'giúp đỡ', 'hướng dẫn']
+    start_vocab = intent.name == 'start_vocab'
+    start_grammar = intent.name == 'start_grammar'
+    start_pronounce = intent.name == 'start_pronounce'
+    start_missing = intent.name == 'start_missing'
+    start_quiz = intent.name == 'start_quiz'
+    start_help = intent.name == 'help'
 
     if start_help:
-        return jsonify({
+        return {
             "reply": (
                 "Bé có thể:\n"
                 "<br>- Gõ <b>từ vựng</b>: Robo hỏi nghĩa → bé trả lời tiếng Anh"
@@ -1639,102 +3415,111 @@ def chat_bot():
                 "<br><small>Mẹo: Hãy chọn 1 chủ đề (Lớp/Topic) ở màn hình chính để Robo hỏi đúng bài đang học.</small>"
             ),
             "actions": _default_chat_actions(),
-        })
+        }
 
     if start_vocab:
         if not topic:
-            return jsonify({
+            return {
                 "reply": "Bé hãy chọn 1 chủ đề ở màn hình chính trước nhé (Lớp → Topic). Sau đó gõ lại 'từ vựng'.",
                 "actions": _default_chat_actions(),
-            })
+            }
         q = _pick_vocab_question(topic)
         if not q:
-            return jsonify({
+            return {
                 "reply": "Chủ đề này chưa có từ vựng để luyện.",
                 "actions": _default_chat_actions(),
-            })
-        sess['pending'] = q
-        return jsonify({
+            }
+        sess.pending = q
+        return {
             "reply": f"🧩 <b>Từ vựng</b>: Tiếng Anh của '<b>{_escape_html(q['vi'])}</b>' là gì?",
             "actions": [
                 {'action': 'start_vocab', 'label': 'Câu khác'},
                 {'action': 'start_pronounce', 'label': 'Luyện phát âm'},
                 {'action': 'stop', 'label': 'Dừng'},
             ],
-        })
+        }
 
     if start_grammar:
         if not topic:
-            return jsonify({
+            return {
                 "reply": "Bé hãy chọn 1 chủ đề ở màn hình chính trước nhé (Lớp → Topic). Sau đó gõ lại 'ngữ pháp'.",
                 "actions": _default_chat_actions(),
-            })
+            }
         q = _pick_grammar_question(topic)
         if not q:
-            return jsonify({
+            return {
                 "reply": "Chủ đề này chưa có bài ngữ pháp để luyện.",
                 "actions": _default_chat_actions(),
-            })
-        sess['pending'] = q
-        return jsonify({
+            }
+        sess.pending = q
+        return {
             "reply": f"📝 <b>Ngữ pháp</b>: Viết câu tiếng Anh cho: '<b>{_escape_html(q['prompt_vi'])}</b>'",
             "actions": [
                 {'action': 'start_grammar', 'label': 'Câu khác'},
                 {'action': 'stop', 'label': 'Dừng'},
             ],
-        })
+        }
 
     if start_pronounce:
         if not topic:
-            return jsonify({
+            return {
                 "reply": "Bé hãy chọn 1 chủ đề ở màn hình chính trước nhé (Lớp → Topic). Sau đó gõ lại 'phát âm'.",
                 "actions": _default_chat_actions(),
-            })
+            }
         q = _pick_vocab_question(topic)
         if not q:
-            return jsonify({
+            return {
                 "reply": "Chủ đề này chưa có từ để luyện phát âm.",
                 "actions": _default_chat_actions(),
-            })
-        phon = ''
-        try:
-            phon = PHONETIC_CACHE.get(_normalize_key(q['en']), '')
-            if not phon:
-                phon = _fetch_phonetic_from_dictionary_api(q['en'])
-                PHONETIC_CACHE[_normalize_key(q['en'])] = phon
-        except Exception:
-            phon = ''
-
-        sess['pending'] = {
+            }
+        sess.pending = {
             'type': 'pronounce',
             'vocabIndex': q['vocabIndex'],
             'en': q['en'],
             'vi': q['vi'],
         }
-        ipa = f" <span class='text-slate-500'>({phon})</span>" if phon else ''
-        return jsonify({
-            "reply": f"🎤 <b>Phát âm</b>: Bé hãy đọc từ <b>{_escape_html(q['en'])}</b>{ipa}. Bấm nút micro bên dưới để đọc nhé!",
+
+        def pronounce_reply(phon):
+            ipa = f" <span class='text-slate-500'>({phon})</span>" if phon else ''
+            return f"🎤 <b>Phát âm</b>: Bé hãy đọc từ <b>{_escape_html(q['en'])}</b>{ipa}. Bấm nút micro bên dưới để đọc nhé!"
+
+        phon = ''
+        try:
+            if deferred is None:
+                phon = _get_phonetic(q['en'])
+            else:
+                word_key = _normalize_key(q['en'])
+                phon = _IPA_DICT.lookup(word_key) or PHONETIC_CACHE.get(word_key)
+                if phon is None:
+                    word = q['en']
+                    deferred.append(lambda: {"kind": "ipa", "reply": pronounce_reply(_get_phonetic(word))})
+                    phon = ''
+        except Exception:
+            phon = ''
+
+        return {
+            "reply": pronounce_reply(phon),
             "actions": [
                 {'action': 'pronounce_mic', 'label': '🎤 Bấm để nói', 'target': q['en']},
                 {'action': 'tts', 'label': '🔊 Nghe mẫu', 'target': q['en']},
                 {'action': 'start_pronounce', 'label': 'Từ khác'},
                 {'action': 'stop', 'label': 'Dừng'},
             ],
-        })
+        }
 
     if start_missing:
         if not topic:
-            return jsonify({
+            return {
                 "reply": "Bé hãy chọn 1 chủ đề ở màn hình chính trước nhé (Lớp → Topic). Sau đó gõ lại 'điền chữ'.",
                 "actions": _default_chat_actions(),
-            })
+            }
         q = _pick_missing_question(topic, sess)
         if not q:
-            return jsonify({
+            return {
                 "reply": "Chủ đề này chưa có từ vựng để điền chữ.",
                 "actions": _default_chat_actions(),
-            })
-        sess['pending'] = q
+            }
+        sess.pending = q
         base = (
             "🔤 <b>Điền chữ còn thiếu</b>:"
             "<br><small>Bé điền vào các ô còn thiếu rồi bấm <b>Kiểm tra</b> nhé.</small>"
@@ -1753,26 +3538,26 @@ def chat_bot():
             "vi": q.get('vi'),
             "vocabIndex": q.get('vocabIndex'),
         }
-        return jsonify(enriched)
+        return enriched
 
     if start_quiz:
         if not topic:
-            return jsonify({
+            return {
                 "reply": "Bé hãy chọn 1 chủ đề ở màn hình chính trước nhé (Lớp → Topic). Sau đó gõ lại 'kiểm tra'.",
                 "actions": _default_chat_actions(),
-            })
+            }
         q = _pick_quiz_question(topic, sess)
         if not q:
-            return jsonify({
+            return {
                 "reply": "Chủ đề này chưa có câu hỏi kiểm tra.",
                 "actions": _default_chat_actions(),
-            })
-        sess['pending'] = q
+            }
+        sess.pending = q
         letters = 'ABCD'
         opts_html = "".join([
             f"<br><b>{letters[i]}.</b> {opt}" for i, opt in enumerate(q['options'][:4])
         ])
-        return jsonify({
+        return {
             "reply": (
                 f"🧪 <b>Kiểm tra</b>: {_escape_html(q['question'])}"
                 f"{opts_html}"
@@ -1782,15 +3567,19 @@ def chat_bot():
                 {'action': 'start_quiz', 'label': 'Câu khác'},
                 {'action': 'stop', 'label': 'Dừng'},
             ],
-        })
+        }
 
     # Nếu đang có câu hỏi chờ trả lời
-    pending = sess.get('pending') if isinstance(sess, dict) else None
+    pending = sess.pending
     if isinstance(pending, dict) and pending.get('type') == 'vocab':
+        qid = _question_id('chat', 'vocab', grade_id, topic_id, pending.get('vocabIndex'), pending.get('en'))
+        item = _curriculum_item(qid)
         user = _normalize_en_answer(raw_msg)
-        correct = _normalize_en_answer(pending.get('en', ''))
+        correct = item['answer_norm'] if item else _normalize_en_answer(pending.get('en', ''))
+        # Từ tiếng Việt trùng ở nhiều topic: chấp nhận cả từ tiếng Anh gốc của nghĩa đó
+        alt = _CURRICULUM_COMPILED.vi_to_en.get(_lexicon_key(pending.get('vi', '')))
         sim = _similarity(user, correct)
-        is_correct = (user == correct) or (sim >= 0.88)
+        is_correct = (user == correct) or (sim >= 0.88) or (alt is not None and user == _normalize_en_answer(alt))
         if is_correct:
             reply = f"✅ Đúng rồi! Đáp án: <b>{pending.get('en')}</b>"
         else:
@@ -1801,7 +3590,6 @@ def chat_bot():
 
         # Ghi lịch sử (không cộng điểm theo localStorage; chỉ lưu log)
         try:
-            qid = f"chat::vocab::{grade_id}::{topic_id}::{pending.get('vocabIndex')}::{_normalize_key(pending.get('en'))}"
             save_to_history(
                 "Chat Vocab",
                 f"Tiếng Anh của '{pending.get('vi')}'",
@@ -1817,20 +3605,20 @@ def chat_bot():
             pass
 
         # Tự ra câu tiếp theo
-        sess['pending'] = None
-        return jsonify({
+        sess.pending = None
+        return {
             "reply": reply + "<br><small>Muốn làm tiếp: bấm 'Câu khác' hoặc gõ 'từ vựng'.</small>",
             "actions": [
                 {'action': 'start_vocab', 'label': 'Câu khác'},
                 {'action': 'start_pronounce', 'label': 'Luyện phát âm'},
                 {'action': 'stop', 'label': 'Dừng'},
             ],
-        })
+        }
 
     if isinstance(pending, dict) and pending.get('type') == 'grammar':
-        scored = _score_grammar_like_check_api(raw_msg, pending.get('answer', ''))
+        scored = _score_grammar_like_check_api(raw_msg, pending.get('answer', ''), with_grammar_tool=deferred is None)
         try:
-            qid = f"chat::grammar::{grade_id}::{topic_id}::{pending.get('grammarIndex')}"
+            qid = _question_id('chat', 'grammar', grade_id, topic_id, pending.get('grammarIndex'))
             save_to_history(
                 "Chat Grammar",
                 f"Viết câu: {pending.get('prompt_vi')}",
@@ -1844,29 +3632,56 @@ def chat_bot():
             )
         except Exception:
             pass
-        sess['pending'] = None
-        reply = f"{scored.get('message','')}" + (f"<br>{scored.get('suggestion','')}" if scored.get('suggestion') else '')
-        return jsonify({
-            "reply": reply + "<br><small>Muốn làm tiếp: bấm 'Câu khác' hoặc gõ 'ngữ pháp'.</small>",
+        sess.pending = None
+        tail = "<br><small>Muốn làm tiếp: bấm 'Câu khác' hoặc gõ 'ngữ pháp'.</small>"
+
+        def grammar_reply(result):
+            return f"{result.get('message','')}" + (f"<br>{result.get('suggestion','')}" if result.get('suggestion') else '') + tail
+
+        if deferred is not None and raw_msg.strip() and str(pending.get('answer', '')).strip():
+            user_ans = raw_msg.strip()
+            correct_ans = str(pending.get('answer', '')).strip()
+            score = int(scored.get('score') or 0)
+
+            def grammar_update():
+                suggestion = _grammar_tool_suggestion(user_ans)
+                if not suggestion:
+                    return None
+                return {"kind": "grammar", "reply": grammar_reply(_grammar_result(score, correct_ans, suggestion))}
+
+            deferred.append(grammar_update)
+        return {
+            "reply": grammar_reply(scored),
             "actions": [
                 {'action': 'start_grammar', 'label': 'Câu khác'},
                 {'action': 'stop', 'label': 'Dừng'},
             ],
-        })
+        }
 
     if isinstance(pending, dict) and pending.get('type') == 'quiz':
         options = pending.get('options') if isinstance(pending.get('options'), list) else []
-        options = [str(o).strip() for o in options if str(o).strip()]
         correct_ans = str(pending.get('answer', '')).strip()
-
-        choice_idx, choice_text = _quiz_parse_user_choice(raw_msg, options)
         correct_norm = _normalize_choice_text(correct_ans)
 
-        correct_idx = None
-        for i, opt in enumerate(options):
-            if _normalize_choice_text(opt) == correct_norm:
-                correct_idx = i
-                break
+        # Câu hỏi từ _CompiledTopic đã có sẵn options chuẩn hoá + vị trí đáp án đúng
+        compiled_quiz = None
+        quiz_idx = pending.get('quizIndex')
+        if topic is not None and isinstance(quiz_idx, int) and 0 <= quiz_idx < len(topic.quiz):
+            compiled_quiz = topic.quiz[quiz_idx]
+            if compiled_quiz['options'] != options:
+                compiled_quiz = None
+
+        if compiled_quiz is not None:
+            choice_idx, choice_text = _quiz_parse_user_choice(raw_msg, options, compiled_quiz['options_norm'])
+            correct_idx = compiled_quiz['correct_index']
+        else:
+            options = [str(o).strip() for o in options if str(o).strip()]
+            choice_idx, choice_text = _quiz_parse_user_choice(raw_msg, options)
+            correct_idx = None
+            for i, opt in enumerate(options):
+                if _normalize_choice_text(opt) == correct_norm:
+                    correct_idx = i
+                    break
 
         is_correct = False
         if correct_idx is not None and choice_idx is not None:
@@ -1885,7 +3700,7 @@ def chat_bot():
             reply = f"❌ Chưa đúng. Đáp án đúng: <b>{correct_label}</b>"
 
         try:
-            qid = f"chat::quiz::{grade_id}::{topic_id}::{pending.get('quizIndex')}::{_normalize_key(pending.get('question'))}"
+            qid = _question_id('chat', 'quiz', grade_id, topic_id, pending.get('quizIndex'), pending.get('question'))
             save_to_history(
                 "Chat Quiz",
                 f"Quiz: {pending.get('question')}",
@@ -1900,19 +3715,19 @@ def chat_bot():
         except Exception:
             pass
 
-        sess['pending'] = None
-        return jsonify({
+        sess.pending = None
+        return {
             "reply": reply + "<br><small>Muốn làm tiếp: bấm 'Câu khác' hoặc gõ 'kiểm tra'.</small>",
             "actions": [
                 {'action': 'start_quiz', 'label': 'Câu khác'},
                 {'action': 'stop', 'label': 'Dừng'},
             ],
-        })
+        }
 
     if isinstance(pending, dict) and pending.get('type') == 'missing':
-        correct = _normalize_en_answer(pending.get('en', ''))
-        user = _normalize_en_answer(raw_msg)
-        is_correct = (user == correct)
+        qid = _question_id('chat', 'missing', grade_id, topic_id, pending.get('vocabIndex'), pending.get('en'))
+        matched = _curriculum_answer_matches(qid, raw_msg)
+        is_correct = matched if matched is not None else _normalize_en_answer(raw_msg) == _normalize_en_answer(pending.get('en', ''))
         if is_correct:
             reply = f"✅ Đúng rồi! Từ đúng là: <b>{pending.get('en')}</b>"
         else:
@@ -1922,7 +3737,6 @@ def chat_bot():
             )
 
         try:
-            qid = f"chat::missing::{grade_id}::{topic_id}::{pending.get('vocabIndex')}::{_normalize_key(pending.get('en'))}"
             save_to_history(
                 "Chat Missing",
                 f"Điền chữ: {pending.get('masked')}",
@@ -1937,21 +3751,758 @@ def chat_bot():
         except Exception:
             pass
 
-        sess['pending'] = None
-        return jsonify({
+        sess.pending = None
+        return {
             "reply": reply + "<br><small>Muốn làm tiếp: bấm 'Từ khác' hoặc gõ 'điền chữ'.</small>",
             "actions": [
                 {'action': 'start_missing', 'label': 'Từ khác'},
                 {'action': 'tts', 'label': '🔊 Nghe mẫu', 'target': pending.get('en')},
                 {'action': 'stop', 'label': 'Dừng'},
             ],
-        })
+        }
 
     # Mặc định: nhắc hướng dẫn
-    return jsonify({
+    return {
         "reply": "Robo có thể luyện <b>từ vựng</b>, <b>ngữ pháp</b>, <b>phát âm</b>. Bé muốn luyện phần nào?",
         "actions": _default_chat_actions(),
-    })
+    }
+
+# --- ASGI: chạy bất đồng bộ (uvicorn app:create_asgi_app --factory) ---
+# Các endpoint chờ mạng (/api/phonetic, /api/phonetic/batch, /api/tts, phần dịch của /api/chat)
+# chạy trên event loop nên không giữ thread khi chờ dịch vụ ngoài; các route còn lại (chấm điểm dùng CPU...)
+# vẫn là Flask và được chạy trong thread pool riêng. 1 process giữ được hàng trăm kết nối của cả lớp.
+_ASGI_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv('ROBO_ASGI_WORKERS', '32')),
+    thread_name_prefix='asgi',
+)
+_ASYNC_HTTP_MAX_CONNECTIONS = int(os.getenv('ROBO_ASYNC_HTTP_MAX_CONNECTIONS', '50'))
+_ASYNC_HTTP = None
+
+
+class _AsyncSingleFlight:
+    """Singleflight cho coroutine trong 1 event loop: các lần gọi trùng key chờ chung 1 task."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tasks: dict = {}
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key, fn, *args):
+        import asyncio
+
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args))
+            self._tasks[key] = task
+            task.add_done_callback(lambda _t: self._tasks.pop(key, None))
+            self.executed += 1
+        else:
+            self.shared += 1
+        # shield: 1 client ngắt kết nối không huỷ kết quả của các client đang chờ chung
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {'in_flight': len(self._tasks), 'executed': self.executed, 'shared': self.shared}
+
+
+_ASYNC_PHONETIC_FLIGHT = _AsyncSingleFlight('phonetic_async')
+_SINGLE_FLIGHTS.append(_ASYNC_PHONETIC_FLIGHT)
+
+
+def _create_async_http_client():
+    """httpx.AsyncClient dùng chung (pool kết nối keep-alive). Không cài httpx thì trả về None."""
+    try:
+        import httpx
+    except Exception:
+        return None
+    return httpx.AsyncClient(
+        timeout=_DICTIONARY_API_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=_ASYNC_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=_ASYNC_HTTP_MAX_CONNECTIONS,
+        ),
+        headers={'Accept': 'application/json'},
+    )
+
+
+def _async_http_client():
+    global _ASYNC_HTTP
+    if _ASYNC_HTTP is None:
+        _ASYNC_HTTP = _create_async_http_client() or False
+    return _ASYNC_HTTP or None
+
+
+async def _run_blocking(fn, *args, **kwargs):
+    """Chạy hàm đồng bộ (gTTS, deep-translator, model...) trong pool mà không chặn event loop."""
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    # Chép context hiện tại sang thread của pool để span con vẫn gắn vào trace của request
+    ctx = copy_context()
+    return await loop.run_in_executor(_ASGI_POOL, functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+async def _dictionary_api_get_async(client, path: str) -> tuple[int, bytes]:
+    resp = await client.get(f"https://{_DICTIONARY_API_HOST}{path}")
+    return resp.status_code, resp.content
+
+
+async def _fetch_phonetic_from_dictionary_api_async(client, word: str) -> str:
+    for w in _phonetic_candidates(word):
+        try:
+            with _stage('phonetic_fetch', word=w) as span:
+                status, body = await _DICTIONARY_DEP.acall(
+                    _dictionary_api_get_async, client, f"/api/v2/entries/en/{urllib.parse.quote(w)}"
+                )
+                span.set(status=status)
+            if status != 200:
+                continue
+            phonetic = _parse_dictionary_phonetic(body)
+            if phonetic:
+                return phonetic
+        except Exception:
+            continue
+    return ''
+
+
+async def _fetch_and_cache_phonetic_async(key: str, word: str) -> str:
+    client = _async_http_client()
+    if client is None:
+        return await _run_blocking(_get_phonetic, word)
+    phonetic = await _fetch_phonetic_from_dictionary_api_async(client, word)
+    PHONETIC_CACHE.put(key, phonetic)
+    return phonetic
+
+
+async def _get_phonetic_async(word: str) -> str:
+    """Bản async của _get_phonetic: từ điển offline -> cache -> dictionaryapi.dev qua httpx."""
+    key = _normalize_key(word)
+    if not key:
+        return ''
+    local = _IPA_DICT.lookup(key)
+    if local:
+        return local
+    cached = PHONETIC_CACHE.get(key)
+    if cached is not None:
+        return cached
+    return await _ASYNC_PHONETIC_FLIGHT.do(key, _fetch_and_cache_phonetic_async, key, word)
+
+
+async def _prefetch_chat_translation(body: bytes) -> None:
+    """Nếu tin nhắn /api/chat là lệnh dịch cần gọi mạng: dịch trước trong pool (kết quả hoặc lỗi vào cache),
+    để lúc Flask xử lý request thì phần dịch trúng cache và không gọi lại lần nữa.
+
+    Không dùng cho /api/chat/stream: stream trả 'reply' ngay rồi mới dịch ở nền."""
+    try:
+        data = json.loads(body.decode('utf-8')) if body else {}
+        raw_msg = str(data.get('message', '')).strip() if isinstance(data, dict) else ''
+    except Exception:
+        return
+    if not raw_msg:
+        return
+    intent = _match_chat_intent(raw_msg)
+    if intent.name != 'translate' or not intent.payload:
+        return
+    dest = _translation_target_lang(intent)
+    if _translate_without_network(intent.payload, dest) is not None or _TRANSLATOR_DEP.is_open():
+        return
+    if _translation_failure_get((intent.payload.strip().lower(), dest)) is not None:
+        return
+    try:
+        await _run_blocking(_translate_prepared, intent.payload, dest, None)
+    except Exception:
+        pass
+
+
+async def _asgi_read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+async def _asgi_respond(send, status: int, body: bytes, content_type: str, headers: dict | None = None) -> None:
+    raw_headers = [(b'content-type', content_type.encode('latin-1')), (b'content-length', str(len(body)).encode())]
+    for name, value in (headers or {}).items():
+        raw_headers.append((name.lower().encode('latin-1'), str(value).encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _asgi_json(send, obj, status: int = 200) -> None:
+    await _asgi_respond(send, status, app.json.dumps(obj).encode('utf-8'), 'application/json')
+
+
+def _asgi_query(scope) -> dict[str, list[str]]:
+    return urllib.parse.parse_qs(scope.get('query_string', b'').decode('latin-1'))
+
+
+def _asgi_header(scope, name: bytes) -> str:
+    for key, value in scope.get('headers', []):
+        if key.lower() == name:
+            return value.decode('latin-1')
+    return ''
+
+
+def _wsgi_environ(scope, body: bytes) -> dict:
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': str(client[0]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        key = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if key == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif key != 'CONTENT_LENGTH':
+            key = f"HTTP_{key}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _asgi_call_wsgi(wsgi_app, scope, body: bytes, send) -> None:
+    """Chạy route Flask trong _ASGI_POOL; body trả về được gửi theo từng chunk (giữ được SSE /api/chat/stream).
+
+    Gọi app, đọc từng chunk và close() chạy trong CÙNG 1 job (1 thread, 1 context): generator bọc
+    stream_with_context cần request context của lần gọi đầu. Chunk được đẩy sang event loop qua queue.
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+    started: dict = {}
+    environ = _wsgi_environ(scope, body)
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+        return lambda _data: None
+
+    def drain():
+        try:
+            result = wsgi_app(environ, start_response)
+            try:
+                for chunk in result:
+                    if chunk:
+                        loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            finally:
+                close = getattr(result, 'close', None)
+                if close is not None:
+                    close()
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+        except BaseException as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+
+    job = asyncio.ensure_future(_run_blocking(drain))
+    header_sent = False
+    try:
+        while True:
+            item = await queue.get()
+            if isinstance(item, BaseException):
+                raise item
+            if not header_sent:
+                await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+                header_sent = True
+            if item is done:
+                break
+            await send({'type': 'http.response.body', 'body': item, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        await job
+
+
+async def _asgi_phonetic(scope, send) -> None:
+    word = (_asgi_query(scope).get('word') or [''])[0].strip()
+    await _asgi_json(send, {"phonetic": await _get_phonetic_async(word) if word else ''})
+
+
+async def _asgi_phonetic_batch(scope, send) -> None:
+    import asyncio
+
+    raw_words: list[str] = []
+    for value in _asgi_query(scope).get('words', []):
+        raw_words.extend(value.split(','))
+    words = list(dict.fromkeys(w.strip() for w in raw_words if w.strip()))[:_PHONETIC_BATCH_MAX]
+    results = await asyncio.gather(*(_get_phonetic_async(w) for w in words), return_exceptions=True)
+    await _asgi_json(send, {"phonetics": {w: (r if isinstance(r, str) else '') for w, r in zip(words, results)}})
+
+
+async def _asgi_tts(scope, send) -> None:
+    text = (_asgi_query(scope).get('text') or [''])[0]
+    if not text:
+        await _asgi_respond(send, 400, b'No text', 'text/plain; charset=utf-8')
+        return
+    try:
+        deadline = _parse_deadline_ms(_asgi_header(scope, b'x-deadline-ms'))
+        data, mimetype, engine_name = await _run_blocking(_TTS_FLIGHT.do, text, _synthesize_speech_admitted, text, deadline)
+    except _Overloaded as e:
+        await _asgi_respond(
+            send, 503, app.json.dumps(_overloaded_payload(e)).encode('utf-8'), 'application/json',
+            {'Retry-After': e.retry_after},
+        )
+        return
+    except Exception as e:
+        _mark_span_error(e)
+        app.logger.warning("[tts] %s: %s", type(e).__name__, e)
+        await _asgi_respond(send, 500, b'Error', 'text/plain; charset=utf-8')
+        return
+    await _asgi_respond(send, 200, data, mimetype, {'X-TTS-Engine': engine_name})
+
+
+_ASGI_ROUTES = {
+    ('GET', '/api/phonetic'): _asgi_phonetic,
+    ('GET', '/api/phonetic/batch'): _asgi_phonetic_batch,
+    ('GET', '/api/tts'): _asgi_tts,
+}
+# Chỉ /api/chat: /api/chat/stream phải gửi event 'reply' trước khi dịch xong
+_ASGI_CHAT_PATHS = ('/api/chat',)
+
+
+async def _asgi_lifespan(receive, send) -> None:
+    global _ASYNC_HTTP
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            _async_http_client()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            client = _ASYNC_HTTP
+            _ASYNC_HTTP = None
+            if client:
+                await client.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def create_asgi_app(wsgi_app=None):
+    """App factory cho ASGI server (uvicorn/hypercorn).
+
+    Route chờ mạng được xử lý async; mọi route khác chuyển cho Flask chạy trong thread pool.
+    """
+    wsgi_app = wsgi_app or app
+
+    async def asgi_app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await _asgi_lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        handler = _ASGI_ROUTES.get((scope['method'], scope['path']))
+        if handler is not None:
+            status = {}
+
+            async def send_with_status(message):
+                if message['type'] == 'http.response.start':
+                    status['code'] = message['status']
+                await send(message)
+
+            started = time.perf_counter()
+            root = _start_trace('http.request', method=scope['method'], route=scope['path'], path=scope['path']) if _TRACE_FILE else _NOOP_SPAN
+            try:
+                with root:
+                    await handler(scope, send_with_status)
+            finally:
+                _HTTP_LATENCY.observe(time.perf_counter() - started, scope['method'], scope['path'])
+                _HTTP_REQUESTS.inc(scope['method'], scope['path'], str(status.get('code', 500)))
+                if root is not _NOOP_SPAN:
+                    root.set(status=status.get('code', 500))
+                    _emit_trace(root)
+            return
+        body = await _asgi_read_body(receive)
+        if scope['method'] == 'POST' and scope['path'] in _ASGI_CHAT_PATHS:
+            await _prefetch_chat_translation(body)
+        await _asgi_call_wsgi(wsgi_app, scope, body, send)
+
+    return asgi_app
+
+
+# --- /metrics (Prometheus text format) ---
+@app.before_request
+def _metrics_start_timer():
+    g.metrics_started = time.perf_counter()
+
+
+@app.after_request
+def _metrics_record_request(response):
+    started = g.get('metrics_started')
+    if started is not None:
+        # Dùng mẫu route (/api/topic/<grade_id>/<topic_id>) làm label để số series không tăng theo URL
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        _HTTP_LATENCY.observe(time.perf_counter() - started, request.method, route)
+        _HTTP_REQUESTS.inc(request.method, route, str(response.status_code))
+    return response
+
+
+def _metric_lines(name: str, help_text: str, samples: list, labelnames: tuple = (), kind: str = 'gauge') -> list[str]:
+    lines = _metric_header(name, help_text, kind)
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(labelnames, labels)} {value:g}")
+    return lines
+
+
+def _collect_cache_metrics() -> list[str]:
+    phonetic = PHONETIC_CACHE.stats()
+    translation_hits = _CACHE_LOOKUPS.get('translation', 'hit') + _CACHE_LOOKUPS.get('translation', 'db_hit')
+    translation_total = translation_hits + _CACHE_LOOKUPS.get('translation', 'miss')
+    lines = _metric_lines('robo_cache_hit_ratio', 'Tỉ lệ tra cache trúng.', [
+        (('phonetic',), phonetic['hit_ratio']),
+        (('translation',), round(translation_hits / translation_total, 4) if translation_total else 0.0),
+    ], ('cache',))
+    lines += _metric_lines('robo_cache_entries', 'Số mục đang có trong cache (RAM).', [
+        (('phonetic',), phonetic['size']),
+        (('translation',), len(_TRANSLATION_CACHE)),
+    ], ('cache',))
+    lines += _metric_lines('robo_phonetic_cache_lookups_total', 'Số lần tra cache phiên âm theo kết quả.', [
+        (('hit',), phonetic['hits']),
+        (('negative_hit',), phonetic['negative_hits']),
+        (('miss',), phonetic['misses']),
+    ], ('result',), kind='counter')
+    return lines
+
+
+def _collect_state_metrics() -> list[str]:
+    try:
+        history_bytes = os.path.getsize(_HISTORY_FILE)
+    except OSError:
+        history_bytes = 0
+    lines = _metric_lines('robo_history_file_bytes', 'Kích thước file lịch sử làm bài.', [((), history_bytes)])
+    try:
+        sessions = CHAT_SESSIONS.stats()
+        lines += _metric_lines('robo_chat_sessions', 'Số phiên chat đang lưu.', [((sessions['backend'],), sessions['sessions'])], ('backend',))
+    except Exception:
+        pass
+    gates = [(gate.name, gate.stats()) for gate in _ADMISSION_GATES]
+    lines += _metric_lines('robo_admission_active', 'Số request nặng đang chạy.', [((n,), s['active']) for n, s in gates], ('gate',))
+    lines += _metric_lines('robo_admission_waiting', 'Số request nặng đang xếp hàng.', [((n,), s['waiting']) for n, s in gates], ('gate',))
+    lines += _metric_lines('robo_admission_shed_total', 'Số request bị từ chối/chấm rút gọn.', [
+        ((n, reason), s[f'shed_{reason}']) for n, s in gates for reason in ('queue_full', 'deadline')
+    ], ('gate', 'reason'), kind='counter')
+    deps = [(dep.name, dep.stats()) for dep in _OUTBOUND_DEPENDENCIES]
+    lines += _metric_lines('robo_outbound_calls_total', 'Số lần gọi dịch vụ ngoài.', [((n,), s['calls']) for n, s in deps], ('dependency',), kind='counter')
+    lines += _metric_lines('robo_outbound_errors_total', 'Số lần gọi dịch vụ ngoài bị lỗi.', [((n,), s['errors']) for n, s in deps], ('dependency',), kind='counter')
+    flights = [(flight.name, flight.stats()) for flight in _SINGLE_FLIGHTS]
+    lines += _metric_lines('robo_singleflight_calls_total', 'Số lần gọi qua singleflight: executed = chạy thật, shared = dùng chung kết quả.', [
+        ((n, result), s[result]) for n, s in flights for result in ('executed', 'shared')
+    ], ('flight', 'result'), kind='counter')
+    lines += _metric_lines('robo_singleflight_in_flight', 'Số key đang chạy trong singleflight.', [((n,), s['in_flight']) for n, s in flights], ('flight',))
+    lines += _metric_lines('robo_outbound_circuit_open', '1 nếu circuit breaker đang mở.', [((n,), 1 if s['state'] == 'open' else 0) for n, s in deps], ('dependency',))
+    return lines
+
+
+_METRIC_COLLECTORS.extend([_collect_cache_metrics, _collect_state_metrics])
+
+
+@app.route('/metrics')
+def metrics_api():
+    lines: list[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for collect in _METRIC_COLLECTORS:
+        try:
+            lines.extend(collect())
+        except Exception:
+            continue
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+# --- Profiling theo yêu cầu (mặc định tắt) ---
+# Bật bằng ROBO_PROFILE_SAMPLE_RATE=N (profile 1/N request) và/hoặc ROBO_PROFILE_TOKEN
+# (request có header X-Robo-Profile: <token> sẽ được profile). Khi tắt, không đăng ký hook nào
+# nên request thường không tốn thêm gì (cProfile/pstats cũng chỉ import khi cần).
+# Kết quả giữ trong ring buffer ROBO_PROFILE_KEEP bản gần nhất.
+_PROFILE_SAMPLE_RATE = int(os.getenv('ROBO_PROFILE_SAMPLE_RATE', '0'))
+_PROFILE_TOKEN = os.getenv('ROBO_PROFILE_TOKEN', '')
+_PROFILE_MODE = os.getenv('ROBO_PROFILE_MODE', 'cprofile').strip().lower()
+_PROFILE_PATHS = tuple(p.strip() for p in os.getenv('ROBO_PROFILE_PATHS', '/api/check').split(',') if p.strip())
+_PROFILE_INTERVAL = float(os.getenv('ROBO_PROFILE_INTERVAL_MS', '5')) / 1000
+_PROFILING_ENABLED = _PROFILE_SAMPLE_RATE > 0 or bool(_PROFILE_TOKEN)
+_PROFILES: deque = deque(maxlen=max(1, int(os.getenv('ROBO_PROFILE_KEEP', '20'))))
+_PROFILES_LOCK = threading.Lock()
+_PROFILE_IDS = itertools.count(1)
+_PROFILE_REQUESTS = itertools.count(1)
+
+
+class _StackSampler:
+    """Lấy mẫu stack của 1 thread theo wall-clock (cả lúc chờ I/O), gom thành dạng collapsed cho flame graph."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = max(0.001, interval)
+        self.counts: dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def collapsed(self) -> str:
+        return ''.join(f"{stack} {n}\n" for stack, n in sorted(self.counts.items()))
+
+
+class _ProfileRecord:
+    __slots__ = ('id', 'created_at', 'method', 'path', 'status', 'duration_ms', 'mode', 'trigger', 'stats', 'collapsed')
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'created_at': self.created_at,
+            'method': self.method,
+            'path': self.path,
+            'status': self.status,
+            'duration_ms': self.duration_ms,
+            'mode': self.mode,
+            'trigger': self.trigger,
+            'formats': ['pstats', 'text'] if self.stats is not None else ['collapsed'],
+        }
+
+
+def _profile_trigger() -> str | None:
+    if not request.path.startswith(_PROFILE_PATHS):
+        return None
+    header = request.headers.get('X-Robo-Profile', '')
+    if header and _PROFILE_TOKEN and hmac.compare_digest(header, _PROFILE_TOKEN):
+        return 'header'
+    if _PROFILE_SAMPLE_RATE > 0 and next(_PROFILE_REQUESTS) % _PROFILE_SAMPLE_RATE == 0:
+        return 'sample'
+    return None
+
+
+def _profile_start():
+    trigger = _profile_trigger()
+    if trigger is None:
+        return
+    mode = _PROFILE_MODE
+    if trigger == 'header':
+        mode = request.headers.get('X-Robo-Profile-Mode', mode).strip().lower()
+    if mode == 'sampler':
+        profiler = _StackSampler(threading.get_ident(), _PROFILE_INTERVAL)
+        profiler.start()
+    else:
+        import cProfile
+
+        mode = 'cprofile'
+        profiler = cProfile.Profile()
+        profiler.enable()
+    g.profile = (profiler, mode, trigger, time.perf_counter())
+
+
+def _profile_finish(response):
+    state = g.get('profile')
+    if state is None:
+        return response
+    g.profile = None
+    profiler, mode, trigger, started = state
+    duration_ms = (time.perf_counter() - started) * 1000
+    rec = _ProfileRecord()
+    rec.stats = None
+    rec.collapsed = None
+    if mode == 'sampler':
+        profiler.stop()
+        rec.collapsed = profiler.collapsed()
+    else:
+        import pstats
+
+        profiler.disable()
+        rec.stats = pstats.Stats(profiler)
+    rec.id = next(_PROFILE_IDS)
+    rec.created_at = datetime.now().isoformat(timespec='seconds')
+    rec.method = request.method
+    rec.path = request.full_path.rstrip('?')
+    rec.status = response.status_code
+    rec.duration_ms = round(duration_ms, 2)
+    rec.mode = mode
+    rec.trigger = trigger
+    with _PROFILES_LOCK:
+        _PROFILES.append(rec)
+    response.headers['X-Robo-Profile-Id'] = str(rec.id)
+    return response
+
+
+if _PROFILING_ENABLED:
+    app.before_request(_profile_start)
+    app.after_request(_profile_finish)
+
+
+def _profile_access_allowed() -> bool:
+    if _PROFILE_TOKEN:
+        return hmac.compare_digest(request.headers.get('X-Robo-Profile-Token', ''), _PROFILE_TOKEN)
+    # Không đặt token: chỉ cho xem từ chính máy chủ
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+
+@app.route('/api/profiles')
+def profiles_api():
+    if not _profile_access_allowed():
+        return jsonify({"error": "forbidden"}), 403
+    with _PROFILES_LOCK:
+        records = [rec.to_dict() for rec in reversed(_PROFILES)]
+    return jsonify({"enabled": _PROFILING_ENABLED, "profiles": records})
+
+
+@app.route('/api/profiles/<int:profile_id>')
+def profile_download_api(profile_id):
+    if not _profile_access_allowed():
+        return jsonify({"error": "forbidden"}), 403
+    with _PROFILES_LOCK:
+        rec = next((r for r in _PROFILES if r.id == profile_id), None)
+    if rec is None:
+        return jsonify({"error": "Không tìm thấy profile (có thể đã bị thay bởi bản mới hơn)"}), 404
+
+    fmt = request.args.get('format', 'pstats' if rec.stats is not None else 'collapsed')
+    if fmt == 'collapsed' and rec.collapsed is not None:
+        # Dùng với flamegraph.pl / speedscope
+        return Response(rec.collapsed, mimetype='text/plain; charset=utf-8', headers={
+            'Content-Disposition': f'attachment; filename=profile-{rec.id}.collapsed',
+        })
+    if fmt == 'pstats' and rec.stats is not None:
+        # Mở bằng: python -m pstats profile-<id>.pstats  hoặc snakeviz
+        return Response(marshal.dumps(rec.stats.stats), mimetype='application/octet-stream', headers={
+            'Content-Disposition': f'attachment; filename=profile-{rec.id}.pstats',
+        })
+    if fmt == 'text' and rec.stats is not None:
+        import pstats
+
+        buf = io.StringIO()
+        stats = pstats.Stats(stream=buf)
+        stats.add(rec.stats)
+        stats.sort_stats('cumulative').print_stats(int(request.args.get('limit', '40')))
+        return Response(buf.getvalue(), mimetype='text/plain; charset=utf-8')
+    return jsonify({"error": f"Profile {rec.id} ({rec.mode}) không có định dạng '{fmt}'", "formats": rec.to_dict()['formats']}), 400
+
+
+# Tracing cho route Flask: span gốc 'http.request' mở ở before_request, đóng + ghi ở after_request
+def _trace_start():
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    root = _start_trace('http.request', method=request.method, route=route, path=request.path)
+    root.__enter__()
+    g.trace_root = root
+
+
+def _trace_finish(response):
+    root = g.get('trace_root')
+    if root is None:
+        return response
+    g.trace_root = None
+    root.set(status=response.status_code)
+    if response.status_code >= 500 and root.error is None:
+        root.error = f"HTTP {response.status_code}"
+    root.__exit__(None, None, None)
+    response.headers['X-Trace-Id'] = root.trace.trace_id
+    _emit_trace(root)
+    return response
+
+
+if _TRACE_FILE:
+    app.before_request(_trace_start)
+    app.after_request(_trace_finish)
+
+
+# --- Production: nạp sẵn ở master rồi fork worker (gunicorn -c gunicorn.conf.py app:app) ---
+# Model SentenceTransformer, giáo trình đã biên dịch, từ điển song ngữ được nạp 1 lần ở master;
+# worker fork ra dùng chung các trang nhớ đó (copy-on-write). gc.freeze() đưa các object này ra khỏi
+# tầm quét của GC để GC trong worker không ghi vào (và làm nhân bản) các trang nhớ dùng chung.
+_PREFORK = os.getenv('ROBO_PREFORK', '').strip().lower() in ('1', 'true', 'yes')
+_FORK_RESET_POOLS = ('_OUTBOUND_POOL', '_PHONETIC_POOL', '_CHAT_ENRICH_POOL', '_ASGI_POOL', '_HISTORY_WRITER')
+
+
+def _start_background_threads() -> None:
+    _start_curriculum_watcher()
+    CHAT_SESSIONS.start_sweeper(_CHAT_SWEEP_INTERVAL)
+    PHONETIC_CACHE.start_saver()
+
+
+def preload_for_workers() -> None:
+    """Gọi ở master trước khi fork: nạp các phần nặng, chỉ đọc rồi đóng băng GC."""
+    _warm_up_curriculum_responses()
+    # Các thư viện import lười: import sẵn ở master để worker dùng chung
+    for module in ('gtts', 'deep_translator', 'http.client'):
+        try:
+            importlib.import_module(module)
+        except Exception:
+            pass
+    _get_ai_model_and_util()
+    _get_bilingual_lexicon()
+    _get_tts_engines()
+    gc.collect()
+    gc.freeze()
+
+
+def _reset_after_fork() -> None:
+    """Chạy trong process con ngay sau fork.
+
+    Thread và kết nối (SQLite, HTTPS keep-alive) của master không dùng được trong worker:
+    bỏ chúng đi để worker tự mở lại khi cần, rồi bật các thread nền của riêng worker.
+    """
+    global _TRANSLATION_DB_LOCAL, _DICTIONARY_API_LOCAL, _ASYNC_HTTP
+    _TRANSLATION_DB_LOCAL = threading.local()
+    _DICTIONARY_API_LOCAL = threading.local()
+    _IPA_DICT._local = threading.local()
+    if isinstance(CHAT_SESSIONS, _SQLiteChatSessionStore):
+        CHAT_SESSIONS._local = threading.local()
+    _ASYNC_HTTP = None
+    for name in _FORK_RESET_POOLS:
+        pool = globals()[name]
+        # Pool đã có thread ở master -> các thread đó không tồn tại trong worker, phải tạo pool mới
+        if pool._threads:
+            globals()[name] = ThreadPoolExecutor(
+                max_workers=pool._max_workers,
+                thread_name_prefix=pool._thread_name_prefix,
+            )
+    # Không đọc lại giáo trình ở đây (giữ trang nhớ dùng chung với master); watcher của worker
+    # tự nạp bản mới nếu file đã đổi từ lúc master đọc
+    _start_background_threads()
+
+
+# Chỉ ở chế độ prefork: fork khác (subprocess, tool/test) không được bật thread nền trong process con
+if _PREFORK and hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+# Chế độ prefork: master không chạy thread nền (tránh fork lúc thread đang giữ lock), mỗi worker tự bật sau fork
+if not _PREFORK:
+    _start_background_threads()
+    # Dựng response giáo trình ở thread nền: server nhận request ngay, request giáo trình đầu tiên
+    # (nếu đến sớm) chờ chung lần dựng này qua _CURRICULUM_RESPONSES_LOCK
+    threading.Thread(target=_warm_up_curriculum_responses, name='curriculum-warmup', daemon=True).start()
+
 
 if __name__ == '__main__':
     app.run(debug=True, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,27 @@
+# Cấu hình chạy production: gunicorn -c gunicorn.conf.py app:app
+# - preload_app: master import app + nạp model 1 lần, worker fork ra dùng chung bộ nhớ (copy-on-write)
+# - max_requests: worker tự khởi động lại sau N request (chặn rò rỉ bộ nhớ dần theo thời gian)
+# - kill -HUP <master>: thay worker mới lần lượt, worker cũ xử lý xong request đang chạy rồi mới thoát
+import multiprocessing
+import os
+
+# Báo cho app biết đang chạy prefork: master không bật thread nền, worker tự bật sau fork
+os.environ.setdefault('ROBO_PREFORK', '1')
+
+bind = os.getenv('ROBO_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('ROBO_WORKERS', str(max(2, multiprocessing.cpu_count()))))
+threads = int(os.getenv('ROBO_WORKER_THREADS', '4'))
+worker_class = 'gthread'
+preload_app = True
+max_requests = int(os.getenv('ROBO_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.getenv('ROBO_MAX_REQUESTS_JITTER', '200'))
+timeout = int(os.getenv('ROBO_WORKER_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('ROBO_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+
+def when_ready(server):
+    # Chạy ở master sau khi import app, trước khi fork worker đầu tiên
+    import app as robo_app
+    robo_app.preload_for_workers()
+    server.log.info('Robo English: đã nạp sẵn model/giáo trình, bắt đầu fork %s worker', workers)
@@ -7,6 +7,36 @@ let currentTopicId = null;
 let selectedMode = null; // 'self' | 'chat' | null
 
 const PHONETIC_CACHE = new Map();
+const PHONETIC_PENDING = new Map();
+
+// Tra phiên âm cho cả topic trong 1 request (/api/phonetic/batch)
+function prefetchPhonetics(words) {
+    const list = [];
+    (words || []).forEach(w => {
+        const word = String(w || '').trim();
+        const key = word.toLowerCase();
+        if (!key || PHONETIC_CACHE.has(key) || PHONETIC_PENDING.has(key)) return;
+        if (list.some(x => x.toLowerCase() === key)) return;
+        list.push(word);
+    });
+    if (!list.length) return Promise.resolve();
+
+    const req = fetch(`/api/phonetic/batch?words=${encodeURIComponent(list.join(','))}`)
+        .then(r => r.json())
+        .then(d => {
+            const map = (d && d.phonetics && typeof d.phonetics === 'object') ? d.phonetics : {};
+            // Server chỉ tra tối đa 50 từ/lần: từ không có trong kết quả để chưa cache, getPhoneticCached tra riêng sau
+            list.forEach(word => {
+                if (typeof map[word] === 'string') PHONETIC_CACHE.set(word.toLowerCase(), map[word]);
+            });
+        })
+        .catch(() => { /* fallback: getPhoneticCached sẽ gọi từng từ */ })
+        .finally(() => {
+            list.forEach(word => PHONETIC_PENDING.delete(word.toLowerCase()));
+        });
+    list.forEach(word => PHONETIC_PENDING.set(word.toLowerCase(), req));
+    return req;
+}
 
 function getPhoneticCached(word) {
     const key = String(word || '').trim().toLowerCase();
@@ -15,6 +45,12 @@ function getPhoneticCached(word) {
     if (PHONETIC_CACHE.has(key)) {
         return Promise.resolve(PHONETIC_CACHE.get(key) || '');
     }
+    if (PHONETIC_PENDING.has(key)) {
+        return PHONETIC_PENDING.get(key).then(() => {
+            if (PHONETIC_CACHE.has(key)) return PHONETIC_CACHE.get(key) || '';
+            return getPhoneticCached(word);
+        });
+    }
 
     return fetch(`/api/phonetic?word=${encodeURIComponent(word)}`)
         .then(r => r.json())
@@ -501,9 +537,19 @@ function awardTopicPointsOnce(category, itemId) {
 // --- HÀM TTS MỚI (Dùng gTTS từ Server) ---
 function playTTS(text) {
     const audio = document.getElementById('audio-player');
+    // Server quá tải (503) hoặc lỗi -> đọc bằng giọng của trình duyệt
+    audio.onerror = () => speakWithBrowser(text);
     // Gọi API backend
     audio.src = `/api/tts?text=${encodeURIComponent(text)}`;
-    audio.play();
+    audio.play().catch(() => {});
+}
+
+function speakWithBrowser(text) {
+    if (!('speechSynthesis' in window) || !text) return;
+    const u = new SpeechSynthesisUtterance(String(text));
+    u.lang = 'en-US';
+    window.speechSynthesis.cancel();
+    window.speechSynthesis.speak(u);
 }
 
 // Logic chuyển Tab
@@ -516,7 +562,8 @@ function switchTab(tabName) {
 
 async function loadCurriculum() {
     renderTotalScore();
-    const res = await fetch('/api/curriculum');
+    // Chỉ cần id/tiêu đề để vẽ danh sách; nội dung topic tải khi bé chọn bài
+    const res = await fetch('/api/curriculum?fields=index');
     const data = await res.json();
     const list = document.getElementById('curriculum-list');
     list.innerHTML = '';
@@ -535,6 +582,7 @@ async function loadTopic(gradeId, topicId) {
     currentData = await res.json();
     currentGradeId = gradeId;
     currentTopicId = topicId;
+    prefetchPhonetics((currentData.vocab || []).map(w => w && w.en));
 
     // Recompute/migrate score state for this topic based on completed items
     try {
@@ -1781,13 +1829,7 @@ async function sendChat() {
     appendMsg(msg, 'bg-blue-600 text-white self-end');
     input.value = '';
     try {
-        const data = await sendChatPayload(msg);
-        const botDiv = appendMsg(data.reply, 'bg-white text-slate-700 self-start border border-slate-200');
-        if (data && typeof data === 'object' && data.missing) {
-            initChatEventDelegation();
-            hydrateChatMissingUI(botDiv, data.missing);
-        }
-        renderChatActions(data.actions);
+        await sendChatPayload(msg);
     } catch(e) { appendMsg("Lỗi mạng", 'bg-red-100 text-red-600'); }
 }
 function appendMsg(text, cls) {
@@ -1980,6 +2022,33 @@ function actionToMessage(action) {
     }
 }
 
+function renderChatReply(data) {
+    const botDiv = appendMsg(data.reply, 'bg-white text-slate-700 self-start border border-slate-200');
+    if (data && typeof data === 'object' && data.missing) {
+        initChatEventDelegation();
+        hydrateChatMissingUI(botDiv, data.missing);
+    }
+    renderChatActions(data.actions);
+    return botDiv;
+}
+
+function parseSSEBlock(block) {
+    let event = 'message';
+    const dataLines = [];
+    for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) dataLines.push(line.slice(5).trimStart());
+    }
+    if (!dataLines.length) return null;
+    try {
+        return { event, data: JSON.parse(dataLines.join('\n')) };
+    } catch {
+        return null;
+    }
+}
+
+// Gửi tin nhắn qua /api/chat/stream: hiện phản hồi ngay ('reply'),
+// rồi thay nội dung khi phần chậm (dịch, phiên âm, gợi ý ngữ pháp) xong ('update').
 async function sendChatPayload(message) {
     const clientId = getChatClientId();
     const payload = {
@@ -1990,12 +2059,44 @@ async function sendChatPayload(message) {
             topicId: currentTopicId,
         }
     };
-    const res = await fetch('/api/chat', {
+    const res = await fetch('/api/chat/stream', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(payload)
     });
-    return await res.json();
+    if (!res.ok) throw new Error(`chat stream failed: ${res.status}`);
+
+    let botDiv = null;
+    const handleBlock = (block) => {
+        const evt = parseSSEBlock(block);
+        if (!evt) return;
+        if (evt.event === 'reply') {
+            botDiv = renderChatReply(evt.data);
+        } else if (evt.event === 'update' && botDiv && evt.data && evt.data.reply) {
+            botDiv.innerHTML = evt.data.reply;
+        }
+    };
+
+    if (!res.body || !res.body.getReader) {
+        (await res.text()).split('\n\n').forEach(handleBlock);
+        return botDiv;
+    }
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let sep;
+        while ((sep = buffer.indexOf('\n\n')) >= 0) {
+            handleBlock(buffer.slice(0, sep));
+            buffer = buffer.slice(sep + 2);
+        }
+    }
+    if (buffer.trim()) handleBlock(buffer);
+    return botDiv;
 }
 
 function runSpeechOnce(onResult, onError) {
@@ -2037,13 +2138,7 @@ async function handleChatAction(action, target) {
     // Gửi như một "lệnh" (không append như user chat thường)
     appendMsg(msg, 'bg-blue-600 text-white self-end');
     try {
-        const data = await sendChatPayload(msg);
-        const botDiv = appendMsg(data.reply, 'bg-white text-slate-700 self-start border border-slate-200');
-        if (data && typeof data === 'object' && data.missing) {
-            initChatEventDelegation();
-            hydrateChatMissingUI(botDiv, data.missing);
-        }
-        renderChatActions(data.actions);
+        await sendChatPayload(msg);
     } catch {
         appendMsg('Lỗi mạng', 'bg-red-100 text-red-600');
     }
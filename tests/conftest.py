@@ -0,0 +1,13 @@
+"""Môi trường chung cho test: lịch sử/cache ghi vào thư mục tạm, tắt thread nền (watcher, sweeper)."""
+import os
+import sys
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix='robo-test-')
+os.environ.setdefault('ROBO_HISTORY_FILE', os.path.join(_TMP, 'learning_history.json'))
+os.environ.setdefault('ROBO_TRANSLATION_CACHE_FILE', os.path.join(_TMP, 'translation_cache.sqlite'))
+os.environ.setdefault('ROBO_PHONETIC_CACHE_FILE', os.path.join(_TMP, 'phonetic_cache.json'))
+os.environ.setdefault('ROBO_CURRICULUM_POLL', '0')
+os.environ.setdefault('ROBO_CHAT_SWEEP_INTERVAL', '0')
+os.environ.setdefault('ROBO_PHONETIC_SAVE_INTERVAL', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,111 @@
+"""Cổng giới hạn tải (_AdmissionGate): từ chối khi hàng đợi đầy/quá deadline và chấm rút gọn ở /api/check."""
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('flask')
+
+import app  # noqa: E402
+
+
+def _hold(gate: 'app._AdmissionGate'):
+    """Chiếm 1 slot ở thread khác; trả về (event để nhả slot, thread)."""
+    entered, release = threading.Event(), threading.Event()
+
+    def run():
+        with gate.slot():
+            entered.set()
+            release.wait(5)
+
+    t = threading.Thread(target=run)
+    t.start()
+    assert entered.wait(2)
+    return release, t
+
+
+def test_queue_full_sheds_immediately():
+    gate = app._AdmissionGate('t', max_concurrent=1, max_queue=0, deadline=5)
+    release, t = _hold(gate)
+    try:
+        started = time.monotonic()
+        with pytest.raises(app._Overloaded) as exc:
+            with gate.slot():
+                pass
+        assert exc.value.reason == 'queue_full'
+        assert time.monotonic() - started < 0.5
+        assert gate.stats()['shed_queue_full'] == 1
+    finally:
+        release.set()
+        t.join()
+
+
+def test_deadline_sheds_queued_request():
+    gate = app._AdmissionGate('t', max_concurrent=1, max_queue=4, deadline=5)
+    release, t = _hold(gate)
+    try:
+        started = time.monotonic()
+        with pytest.raises(app._Overloaded) as exc:
+            with gate.slot(0.1):
+                pass
+        assert exc.value.reason == 'deadline'
+        assert 0.05 <= time.monotonic() - started < 1
+        assert gate.stats()['shed_deadline'] == 1
+        assert gate.stats()['waiting'] == 0
+    finally:
+        release.set()
+        t.join()
+
+
+def test_free_slot_reaches_next_waiter_after_a_deadline_shed():
+    gate = app._AdmissionGate('t', max_concurrent=1, max_queue=4, deadline=5)
+    release, t = _hold(gate)
+    outcome: dict = {}
+
+    def waiter(name, deadline):
+        try:
+            with gate.slot(deadline):
+                outcome[name] = time.monotonic()
+        except app._Overloaded as e:
+            outcome[name] = e.reason
+
+    short = threading.Thread(target=waiter, args=('short', 0.1))
+    long = threading.Thread(target=waiter, args=('long', 4))
+    short.start()
+    time.sleep(0.02)
+    long.start()
+    short.join()
+    released_at = time.monotonic()
+    release.set()
+    long.join()
+    t.join()
+    assert outcome['short'] == 'deadline'
+    assert outcome['long'] - released_at < 0.5
+
+
+def test_check_degrades_to_lexical_grading_when_overloaded(monkeypatch):
+    gate = app._AdmissionGate('check', max_concurrent=1, max_queue=0, deadline=5)
+    monkeypatch.setattr(app, '_CHECK_GATE', gate)
+    # Quá tải: chấm theo chữ, không được nạp model hay LanguageTool
+    monkeypatch.setattr(app, '_get_ai_model_and_util', lambda: pytest.fail('model khi quá tải'))
+    monkeypatch.setattr(app, '_get_grammar_tool', lambda: pytest.fail('LanguageTool khi quá tải'))
+    release, t = _hold(gate)
+    try:
+        resp = app.app.test_client().post('/api/check', json={
+            'mode': 'speaking', 'user_answer': 'apple', 'correct_answer': 'apple', 'question_text': 'apple',
+            'context': {'gradeId': 'degraded-test', 'topicId': 'fruit', 'category': 'speaking', 'itemId': 0},
+        })
+    finally:
+        release.set()
+        t.join()
+    assert resp.status_code == 200
+    assert resp.headers['X-Degraded'] == 'queue_full'
+    result = resp.get_json()
+    assert result['degraded'] is True
+    assert result['is_correct'] and result['score'] == 100
+    assert result['awarded_score'] == 0
+    assert 'chưa cộng điểm' in result['message']
+
+    app._HISTORY_WRITER.submit(lambda: None).result(5)
+    records = [r for r in app._load_history() if (r.get('context') or {}).get('gradeId') == 'degraded-test']
+    assert records and records[-1]['degraded'] is True
@@ -0,0 +1,115 @@
+"""Regression: /api/chat/stream (SSE) qua entrypoint ASGI phải chạy tới event 'done'."""
+import asyncio
+import json
+import threading
+
+import pytest
+
+pytest.importorskip('flask')
+
+import app  # noqa: E402
+
+
+def _post_stream(asgi, path: str, payload: dict, on_send=None) -> tuple[int, bytes]:
+    messages = [{'type': 'http.request', 'body': json.dumps(payload).encode('utf-8'), 'more_body': False}]
+    sent: list[dict] = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+        if on_send is not None:
+            on_send(message)
+
+    scope = {
+        'type': 'http',
+        'method': 'POST',
+        'path': path,
+        'query_string': b'',
+        'headers': [(b'content-type', b'application/json')],
+    }
+    asyncio.run(asgi(scope, receive, send))
+    status = next(m['status'] for m in sent if m['type'] == 'http.response.start')
+    body = b''.join(m.get('body', b'') for m in sent if m['type'] == 'http.response.body')
+    return status, body
+
+
+def test_chat_stream_reaches_done_under_asgi():
+    status, body = _post_stream(
+        app.create_asgi_app(),
+        '/api/chat/stream',
+        {'message': 'help', 'client_id': 'asgi-stream-test', 'context': {}},
+    )
+    assert status == 200
+    assert b'event: reply' in body
+    assert body.rstrip().endswith(b'event: done\ndata: {}')
+
+
+def test_chat_stream_reply_does_not_wait_for_translation(monkeypatch):
+    release = threading.Event()
+    order: list[str] = []
+
+    def slow_remote(text, dest):
+        order.append('translate-start')
+        release.wait(5)
+        order.append('translate-end')
+        return 'máy bay giấy khổng lồ'
+
+    def on_send(message):
+        if b'event: reply' in message.get('body', b''):
+            order.append('reply')
+            release.set()
+
+    monkeypatch.setattr(app, '_translate_remote', slow_remote)
+    status, body = _post_stream(
+        app.create_asgi_app(),
+        '/api/chat/stream',
+        {'message': 'dịch giant paper airplane zebra', 'client_id': 'asgi-stream-translate', 'context': {}},
+        on_send=on_send,
+    )
+    assert status == 200
+    assert order.index('reply') < order.index('translate-end')
+    assert 'máy bay giấy khổng lồ' in body.decode('utf-8')
+    assert body.rstrip().endswith(b'event: done\ndata: {}')
+
+
+def test_failed_translation_is_not_retried_right_away(monkeypatch):
+    calls: list[str] = []
+
+    def failing_remote(text, dest):
+        calls.append(text)
+        raise TimeoutError('translator timed out')
+
+    monkeypatch.setattr(app, '_translate_remote', failing_remote)
+    first = app.perform_translation('purple quantum octopus', 'vi')
+    second = app.perform_translation('purple quantum octopus', 'vi')
+    assert first == second == 'Lỗi kết nối server dịch.'
+    assert len(calls) == 1
+
+
+def test_chat_translation_checks_local_sources_once(monkeypatch):
+    local_calls: list = []
+    real = app._translate_without_network
+
+    def counting(text, dest):
+        local_calls.append(text)
+        return real(text, dest)
+
+    monkeypatch.setattr(app, '_translate_without_network', counting)
+    monkeypatch.setattr(app, '_translate_remote', lambda text, dest: f'<{text}>')
+
+    status, body = _post_stream(
+        app.create_asgi_app(),
+        '/api/chat/stream',
+        {'message': 'dịch tiny velvet lighthouse', 'client_id': 'stream-local-once', 'context': {}},
+    )
+    assert status == 200 and '&lt;tiny velvet lighthouse&gt;' in body.decode('utf-8')
+    assert local_calls == ['tiny velvet lighthouse']
+
+    local_calls.clear()
+    resp = app.app.test_client().post('/api/chat', json={
+        'message': 'dịch tiny velvet submarine', 'client_id': 'chat-local-once', 'context': {},
+    })
+    assert '&lt;tiny velvet submarine&gt;' in resp.get_json()['reply']
+    assert local_calls == ['tiny velvet submarine']
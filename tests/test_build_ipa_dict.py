@@ -0,0 +1,63 @@
+"""Chuyển ARPAbet -> IPA của tools/build_ipa_dict.py (dấu nhấn đặt trước cụm phụ âm đầu âm tiết) và file dựng sẵn."""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'tools'))
+
+from build_ipa_dict import arpabet_to_ipa, build  # noqa: E402
+
+
+@pytest.mark.parametrize('phones, expected', [
+    ('K AE1 T', 'kæt'),                        # 1 âm tiết: không có dấu nhấn
+    ('B AH0 N AE1 N AH0', 'bəˈnænə'),          # ə cho AH0, nhấn trước 1 phụ âm
+    ('K AH0 M P Y UW1 T ER0', 'kəmˈpjutɚ'),    # cụm 'pj' thuộc âm tiết nhấn
+    ('M Y UW1 Z IH0 K', 'ˈmjuzɪk'),            # phụ âm đầu từ thuộc âm tiết đầu
+    ('IH0 N S T R AH1 K T', 'ɪnˈstrʌkt'),      # cụm 3 phụ âm
+    ('IH0 K S P L EY1 N', 'ɪkˈspleɪn'),
+    ('AH2 N D ER0 S T AE1 N D', 'ˌʌndɚˈstænd'),  # nhấn phụ
+    ('L AE1 NG G W AH0 JH', 'ˈlæŋɡwədʒ'),
+    ('AH0 M AW1 N T', 'əˈmaʊnt'),
+    ('S IH1 NG ER0', 'ˈsɪŋɚ'),
+    ('B IH0 K AH1 M', 'bɪˈkʌm'),
+])
+def test_arpabet_to_ipa_stress_placement(phones, expected):
+    assert arpabet_to_ipa(phones.split()) == expected
+
+
+def test_unknown_phone_is_rejected():
+    with pytest.raises(ValueError):
+        arpabet_to_ipa(['K', 'XX1', 'T'])
+
+
+def test_build_keeps_first_pronunciation(tmp_path):
+    src = tmp_path / 'cmudict.dict'
+    src.write_text(
+        ';;; comment\n'
+        'computer K AH0 M P Y UW1 T ER0\n'
+        'read R IY1 D\n'
+        'read(2) R EH1 D\n'
+        'bad B AE1 D XX0 # phone lạ -> bỏ qua\n',
+        encoding='utf-8',
+    )
+    out = tmp_path / 'ipa.sqlite'
+    assert build(str(src), str(out)) == 2
+    import sqlite3
+
+    conn = sqlite3.connect(str(out))
+    try:
+        assert dict(conn.execute('SELECT word, ipa FROM ipa')) == {'computer': 'kəmˈpjutɚ', 'read': 'rid'}
+    finally:
+        conn.close()
+
+
+def test_shipped_dictionary_resolves_common_words():
+    pytest.importorskip('flask')
+    import app
+
+    ipa = app._IPADictionary(os.path.join(ROOT, 'data', 'ipa_dict.sqlite'))
+    assert ipa.available()
+    assert ipa.lookup('computer') == '/kəmˈpjutɚ/'
+    assert ipa.lookup('Good morning') == '/ɡʊd ˈmɔrnɪŋ/'
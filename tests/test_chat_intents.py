@@ -0,0 +1,98 @@
+"""Bảng intent biên dịch thành regex phải định tuyến y hệt chuỗi if/substring cũ của chat_bot."""
+import itertools
+import re
+
+import pytest
+
+pytest.importorskip('flask')
+
+import app  # noqa: E402
+
+
+# --- Bộ định tuyến cũ (trước khi có _CHAT_INTENT_RULES), chép nguyên logic để đối chiếu ---
+
+def _legacy_clean_input(text):
+    keywords = ["dịch câu", "dịch từ", "dịch sang tiếng anh", "dịch sang tiếng việt",
+                "dịch", "nghĩa là gì", "nghĩa là", "là gì", "tiếng anh là",
+                "tiếng việt là", "tiếng anh", "tiếng việt"]
+    text_lower = text.lower()
+    for kw in keywords:
+        text_lower = text_lower.replace(kw, "")
+    cleaned = re.sub(r'^[\W_]+|[\W_]+$', '', text_lower)
+    cleaned = cleaned.strip()
+    cleaned = re.sub(r'^(của|cua)\s+', '', cleaned).strip()
+    return cleaned
+
+
+def _legacy_route(raw_msg):
+    msg_lower = raw_msg.lower().strip()
+    if msg_lower in ['stop', 'dừng', 'thoát', 'reset']:
+        return ('stop', '', None)
+    if 'dịch' in msg_lower or 'nghĩa là' in msg_lower or 'tiếng anh là' in msg_lower or 'tiếng việt là' in msg_lower:
+        target_lang = None
+        if "nghĩa là" in msg_lower or "tiếng việt" in msg_lower:
+            target_lang = 'vi'
+        elif "tiếng anh" in msg_lower:
+            target_lang = 'en'
+        return ('translate', _legacy_clean_input(raw_msg), target_lang)
+    checks = (
+        ('help', msg_lower in ['help', 'giúp', 'giúp đỡ', 'hướng dẫn']),
+        ('start_vocab', ('từ vựng' in msg_lower) or ('vocab' in msg_lower)),
+        ('start_grammar', ('ngữ pháp' in msg_lower) or ('grammar' in msg_lower) or msg_lower.startswith('viết câu')),
+        ('start_pronounce', ('phát âm' in msg_lower) or ('luyện nói' in msg_lower) or ('pronounce' in msg_lower)),
+        ('start_missing', ('điền' in msg_lower) or ('missing' in msg_lower) or ('fill' in msg_lower)),
+        ('start_quiz', ('kiểm tra' in msg_lower) or ('quiz' in msg_lower) or ('test' in msg_lower)),
+    )
+    for name, hit in checks:
+        if hit:
+            return (name, '', None)
+    return (None, '', None)
+
+
+def _route(raw_msg):
+    intent = app._match_chat_intent(raw_msg)
+    if intent.name == 'translate':
+        return (intent.name, intent.payload, intent.target_lang)
+    return (intent.name, '', None)
+
+
+_KEYWORDS = sorted({kw for _, _, kws in app._CHAT_INTENT_RULES for kw in kws}
+                   | set(app._TRANSLATE_STRIP_KEYWORDS) | {'Dịch', 'TEST', 'Viết câu', 'của', 'là gì'})
+_FILLERS = ('', ' ', 'con mèo', 'apple', 'bé muốn', '?', 'hello world', 'xin chào')
+
+_SAMPLES = [
+    'stop', ' Reset ', 'dừng lại', 'help', 'giúp đỡ', 'giúp tớ với', 'Hướng dẫn',
+    'dịch con mèo', 'Dịch sang tiếng Anh: quả táo', 'apple nghĩa là gì?', 'cat tiếng việt là gì',
+    'con chó tiếng anh là gì', 'tiếng anh của con gà', 'dịch câu I love you', 'dịch từ school',
+    'học từ vựng', 'vocab please', 'ngữ pháp', 'viết câu với từ cat', 'tôi muốn viết câu',
+    'luyện phát âm', 'luyện nói', 'pronounce', 'điền từ', 'fill in the blank', 'missing word',
+    'kiểm tra', 'quiz', 'test từ vựng', 'luyện nói và kiểm tra', 'dịch từ vựng', 'latest news',
+    'contest', 'grammar quiz', 'điền vào chỗ trống rồi kiểm tra', '', '!!!', 'hello', 'xin chào',
+    'Tiếng Việt là gì', 'dịchdịch', 'nghĩa làlà gì', 'dịdịchch', 'tiếng anh là là gì',
+]
+
+
+def _generated():
+    for a, b in itertools.product(_KEYWORDS, repeat=2):
+        yield f'{a} {b}'
+    for kw, filler in itertools.product(_KEYWORDS, _FILLERS):
+        yield f'{filler} {kw}'
+        yield f'{kw} {filler}'
+        yield f'{kw}{filler}'
+
+
+@pytest.mark.parametrize('msg', _SAMPLES)
+def test_intent_matches_legacy_router(msg):
+    assert _route(msg) == _legacy_route(msg)
+
+
+def test_intent_matches_legacy_router_on_keyword_combinations():
+    mismatches = [(msg, _route(msg), _legacy_route(msg)) for msg in _generated() if _route(msg) != _legacy_route(msg)]
+    assert mismatches == []
+
+
+def test_rule_order_sets_precedence():
+    assert app._match_chat_intent('dịch từ vựng').name == 'translate'
+    assert app._match_chat_intent('test ngữ pháp').name == 'start_grammar'
+    assert app._match_chat_intent('tôi muốn viết câu').name is None
+    assert app._match_chat_intent('Viết câu với cat').name == 'start_grammar'
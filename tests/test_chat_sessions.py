@@ -0,0 +1,142 @@
+"""Kho phiên chat: SQLite compare-and-set gộp lượt ghi song song thay vì bỏ mất trạng thái."""
+import threading
+
+import pytest
+
+pytest.importorskip('flask')
+
+import app  # noqa: E402
+
+
+def test_sqlite_conflicting_saves_are_merged(tmp_path):
+    path = str(tmp_path / 'sessions.sqlite')
+    worker_a = app._SQLiteChatSessionStore(path, max_size=100, ttl=3600)
+    worker_b = app._SQLiteChatSessionStore(path, max_size=100, ttl=3600)
+
+    a = worker_a.load('kid')
+    b = worker_b.load('kid')
+    a.pending = {'type': 'vocab', 'vocabIndex': 1, 'en': 'apple', 'vi': 'quả táo'}
+    a.asked_quiz |= 1 << 1
+    b.asked_quiz |= 1 << 2
+    b.grade_id, b.topic_id = 'lop1', 'fruit'
+
+    worker_a.save('kid', a)
+    worker_b.save('kid', b)  # rev cũ -> phải gộp, không được ghi đè hay bỏ qua
+
+    final = worker_a.load('kid')
+    assert final.pending == a.pending
+    assert final.asked_quiz == (1 << 1) | (1 << 2)
+    assert (final.grade_id, final.topic_id) == ('lop1', 'fruit')
+    assert worker_b.stats()['conflicts'] == 1
+    assert final.rev == 2
+
+
+def test_sqlite_concurrent_turns_from_two_workers_keep_every_change(tmp_path):
+    path = str(tmp_path / 'sessions.sqlite')
+    workers = [app._SQLiteChatSessionStore(path, max_size=100, ttl=3600) for _ in range(2)]
+    barrier = threading.Barrier(2)
+
+    def run(store, bits):
+        barrier.wait()
+        for bit in bits:
+            with store.turn('kid') as sess:
+                sess.asked_missing |= 1 << bit
+
+    threads = [
+        threading.Thread(target=run, args=(workers[0], range(0, 20, 2))),
+        threading.Thread(target=run, args=(workers[1], range(1, 20, 2))),
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert workers[0].load('kid').asked_missing == (1 << 20) - 1
+
+
+def test_sqlite_store_migrates_file_without_rev_column(tmp_path):
+    import json
+    import sqlite3
+    import time
+
+    path = str(tmp_path / 'old.sqlite')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE chat_sessions (key TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)')
+    conn.execute('INSERT INTO chat_sessions VALUES (?, ?, ?)', ('kid', json.dumps({'asked_quiz': 5}), time.time()))
+    conn.commit()
+    conn.close()
+
+    store = app._SQLiteChatSessionStore(path, max_size=100, ttl=3600)
+    with store.turn('kid') as sess:
+        assert sess.asked_quiz == 5
+        sess.asked_quiz = 7
+    assert store.load('kid').asked_quiz == 7
+
+
+def test_memory_store_evicts_least_recently_used_per_shard():
+    store = app._ChatSessionStore(max_size=3, ttl=3600, shards=1)
+    for key in ('a', 'b', 'c'):
+        store.get_or_create(key)
+    store.get_or_create('a')  # 'a' thành mới dùng nhất -> 'b' cũ nhất
+    store.get_or_create('d')
+    assert store.get('b') is None
+    assert all(store.get(k) is not None for k in ('a', 'c', 'd'))
+    assert store.evicted == 1 and len(store) == 3
+
+
+def test_memory_store_bounds_every_shard():
+    store = app._ChatSessionStore(max_size=32, ttl=3600, shards=4)
+    for i in range(500):
+        store.get_or_create(f'kid-{i}')
+    assert all(len(shard) <= store._shard_max for shard in store._shards)
+    assert len(store) <= 32
+    assert store.evicted == 500 - len(store)
+    assert store.stats()['max_size'] == 32
+
+
+def test_memory_store_expired_session_is_replaced():
+    store = app._ChatSessionStore(max_size=10, ttl=60, shards=2)
+    sess = store.get_or_create('kid')
+    sess.pending = {'type': 'vocab'}
+    sess.touched -= 61
+    fresh = store.get_or_create('kid')
+    assert fresh is not sess and fresh.pending is None
+    assert store.expired == 1
+
+
+def test_memory_store_sweep_removes_only_idle_sessions():
+    store = app._ChatSessionStore(max_size=100, ttl=60, shards=4)
+    for i in range(10):
+        store.get_or_create(f'kid-{i}')
+    for i in range(5):  # 5 phiên đầu bỏ quên; LRU giữ chúng ở đầu shard
+        store.get(f'kid-{i}').touched -= 61
+    assert store.sweep() == 5
+    assert sorted(k for shard in store._shards for k in shard) == [f'kid-{i}' for i in range(5, 10)]
+    assert store.stats()['expired'] == 5
+
+
+def test_memory_store_turns_of_one_client_are_serialised():
+    store = app._ChatSessionStore(max_size=100, ttl=3600)
+    barrier = threading.Barrier(8)
+
+    def run(bit):
+        barrier.wait()
+        with store.turn('kid') as sess:
+            seen = sess.asked_quiz
+            threading.Event().wait(0.001)  # nhường CPU giữa đọc và ghi
+            sess.asked_quiz = seen | (1 << bit)
+
+    threads = [threading.Thread(target=run, args=(bit,)) for bit in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert store.get('kid').asked_quiz == (1 << 8) - 1
+
+
+def test_session_dict_round_trip():
+    sess = app._ChatSession()
+    sess.pending = {'type': 'quiz', 'quizIndex': 3}
+    sess.asked_quiz, sess.asked_missing = 0b1010, 0b1
+    sess.grade_id, sess.topic_id = 'lop2', 'animals'
+    assert app._ChatSession.from_dict(sess.to_dict()).to_dict() == sess.to_dict()
+    assert app._ChatSession.from_dict({'pending': 'bad', 'asked_quiz': None}).to_dict()['pending'] is None
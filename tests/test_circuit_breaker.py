@@ -0,0 +1,105 @@
+"""_OutboundDependency: timeout và circuit breaker (closed -> open -> half_open -> closed/open)."""
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('flask')
+
+import app  # noqa: E402
+
+
+def _boom():
+    raise ConnectionError('down')
+
+
+def _dep(**kwargs):
+    opts = {'timeout': None, 'failure_threshold': 2, 'reset_timeout': 0.2}
+    opts.update(kwargs)
+    return app._OutboundDependency('test', **opts)
+
+
+def _fail(dep, n):
+    for _ in range(n):
+        with pytest.raises(ConnectionError):
+            dep.call(_boom)
+
+
+def test_opens_after_consecutive_failures_and_rejects_fast():
+    dep = _dep()
+    _fail(dep, 1)
+    assert dep.stats()['state'] == 'closed'
+    _fail(dep, 1)
+    assert dep.stats()['state'] == 'open' and dep.is_open()
+
+    called = []
+    with pytest.raises(app._CircuitOpenError):
+        dep.call(lambda: called.append(1))
+    assert called == []
+    assert dep.stats()['rejected'] == 1
+
+
+def test_success_resets_the_failure_count():
+    dep = _dep()
+    _fail(dep, 1)
+    assert dep.call(lambda: 'ok') == 'ok'
+    _fail(dep, 1)
+    assert dep.stats()['state'] == 'closed'
+
+
+def test_half_open_probe_success_closes():
+    dep = _dep()
+    _fail(dep, 2)
+    time.sleep(0.25)
+    assert not dep.is_open()
+    assert dep.call(lambda: 'ok') == 'ok'
+    assert dep.stats()['state'] == 'closed'
+
+
+def test_half_open_probe_failure_reopens():
+    dep = _dep(failure_threshold=3)
+    _fail(dep, 3)
+    time.sleep(0.25)
+    _fail(dep, 1)  # 1 lần thử lỗi là mở lại ngay, không cần đủ failure_threshold
+    assert dep.stats()['state'] == 'open'
+    with pytest.raises(app._CircuitOpenError):
+        dep.call(lambda: 'ok')
+
+
+def test_half_open_allows_a_single_probe():
+    dep = _dep()
+    _fail(dep, 2)
+    time.sleep(0.25)
+    entered, release = threading.Event(), threading.Event()
+
+    def probe():
+        entered.set()
+        release.wait(2)
+        return 'ok'
+
+    t = threading.Thread(target=dep.call, args=(probe,))
+    t.start()
+    assert entered.wait(2)
+    try:
+        with pytest.raises(app._CircuitOpenError):
+            dep.call(lambda: 'second probe')
+    finally:
+        release.set()
+        t.join()
+    assert dep.stats()['state'] == 'closed'
+
+
+def test_timeout_counts_as_failure():
+    dep = _dep(timeout=0.05, failure_threshold=1)
+    with pytest.raises(TimeoutError):
+        dep.call(time.sleep, 0.5)
+    stats = dep.stats()
+    assert stats['timeouts'] == 1 and stats['state'] == 'open'
+
+
+def test_open_translator_breaker_answers_without_calling_out(monkeypatch):
+    dep = _dep(failure_threshold=1, reset_timeout=60)
+    _fail(dep, 1)
+    monkeypatch.setattr(app, '_TRANSLATOR_DEP', dep)
+    monkeypatch.setattr(app, '_translate_remote', lambda *a: pytest.fail('không được gọi dịch khi mạch mở'))
+    assert 'chưa dịch được' in app.perform_translation('breaker open sentence', 'vi')
@@ -0,0 +1,124 @@
+"""/api/curriculum và /api/topic: response dựng sẵn, ETag theo từng content-coding, 304."""
+import gzip
+import json
+
+import pytest
+
+pytest.importorskip('flask')
+
+import app  # noqa: E402
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Không tra phiên âm thật khi mở topic
+    monkeypatch.setattr(app, '_prefetch_topic_phonetics', lambda topic: None)
+    return app.app.test_client()
+
+
+def _first_topic():
+    for grade_id, grade in app.CURRICULUM.items():
+        for topic_id in (grade.get('topics') or {}):
+            return grade_id, topic_id
+    pytest.skip('giáo trình rỗng')
+
+
+def _etag(resp):
+    return resp.headers['ETag'].strip('"')
+
+
+def test_identity_and_gzip_have_distinct_etags():
+    with app.app.test_client() as c:
+        plain = c.get('/api/curriculum', headers={'Accept-Encoding': 'identity'})
+        gz = c.get('/api/curriculum', headers={'Accept-Encoding': 'gzip'})
+    assert plain.status_code == gz.status_code == 200
+    assert 'Content-Encoding' not in plain.headers
+    assert gz.headers['Content-Encoding'] == 'gzip'
+    assert _etag(gz) == _etag(plain) + '-gz'
+    assert gzip.decompress(gz.data) == plain.data
+    assert json.loads(plain.data) == app.CURRICULUM
+    for resp in (plain, gz):
+        assert resp.headers['Vary'] == 'Accept-Encoding'
+        assert 'max-age=' in resp.headers['Cache-Control']
+
+
+def test_brotli_variant_when_available():
+    brotli = pytest.importorskip('brotli')
+    with app.app.test_client() as c:
+        plain = c.get('/api/curriculum', headers={'Accept-Encoding': 'identity'})
+        br = c.get('/api/curriculum', headers={'Accept-Encoding': 'gzip, br'})
+    assert br.headers['Content-Encoding'] == 'br'
+    assert _etag(br) == _etag(plain) + '-br'
+    assert brotli.decompress(br.data) == plain.data
+
+
+@pytest.mark.parametrize('suffix', ['', '-gz', '-br'])
+@pytest.mark.parametrize('encoding', ['identity', 'gzip'])
+def test_any_variant_etag_revalidates(client, suffix, encoding):
+    etag = _etag(client.get('/api/curriculum', headers={'Accept-Encoding': 'identity'}))
+    resp = client.get('/api/curriculum', headers={
+        'Accept-Encoding': encoding,
+        'If-None-Match': f'"{etag}{suffix}"',
+    })
+    assert resp.status_code == 304
+    assert resp.data == b''
+    assert resp.headers['ETag'].startswith(f'"{etag}')
+    assert resp.headers['Vary'] == 'Accept-Encoding'
+
+
+def test_stale_etag_gets_full_body(client):
+    resp = client.get('/api/curriculum', headers={'If-None-Match': '"deadbeef"'})
+    assert resp.status_code == 200 and resp.data
+
+
+def test_topic_etag_and_304(client):
+    grade_id, topic_id = _first_topic()
+    url = f'/api/topic/{grade_id}/{topic_id}'
+    first = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert first.status_code == 200
+    assert json.loads(gzip.decompress(first.data)) == app.CURRICULUM[grade_id]['topics'][topic_id]
+    again = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_topic_304_skips_phonetic_prefetch(monkeypatch):
+    prefetched = []
+    monkeypatch.setattr(app, '_prefetch_topic_phonetics', lambda topic: prefetched.append(topic))
+    grade_id, topic_id = _first_topic()
+    url = f'/api/topic/{grade_id}/{topic_id}'
+    with app.app.test_client() as c:
+        etag = c.get(url).headers['ETag']
+        assert c.get(url, headers={'If-None-Match': etag}).status_code == 304
+    assert len(prefetched) == 1
+
+
+def test_index_is_smaller_and_lists_every_topic(client):
+    full = client.get('/api/curriculum', headers={'Accept-Encoding': 'identity'})
+    index = client.get('/api/curriculum?fields=index', headers={'Accept-Encoding': 'identity'})
+    assert index.status_code == 200
+    assert len(index.data) < len(full.data)
+    assert _etag(index) != _etag(full)
+
+    data = json.loads(index.data)
+    assert set(data) == set(app.CURRICULUM)
+    for grade_id, grade in app.CURRICULUM.items():
+        topics = grade.get('topics') or {}
+        assert set(data[grade_id]['topics']) == set(topics)
+        for topic_id, topic in topics.items():
+            entry = data[grade_id]['topics'][topic_id]
+            assert entry['title'] == topic.get('title', '')
+            assert entry['counts'] == {s: len(topic.get(s) or []) for s in ('vocab', 'quiz', 'grammar')}
+
+
+def test_index_revalidates_with_its_own_etag(client):
+    etag = client.get('/api/curriculum?fields=index').headers['ETag']
+    assert client.get('/api/curriculum?fields=index', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/api/curriculum', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_unknown_topic_is_404(client):
+    grade_id, _ = _first_topic()
+    for url in (f'/api/topic/{grade_id}/no-such-topic', '/api/topic/no-such-grade/x'):
+        resp = client.get(url)
+        assert resp.status_code == 404
+        assert 'error' in resp.get_json()
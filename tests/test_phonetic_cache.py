@@ -0,0 +1,116 @@
+"""_PhoneticCache: TTL / negative TTL, LRU, peek không tính thống kê và gộp file khi lưu."""
+import json
+
+import pytest
+
+pytest.importorskip('flask')
+
+import app  # noqa: E402
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(app.time, 'time', lambda: now[0])
+    return now
+
+
+def _cache(path, **kwargs):
+    opts = {'max_size': 100, 'ttl': 100.0, 'negative_ttl': 10.0, 'save_interval': 0}
+    opts.update(kwargs)
+    return app._PhoneticCache(str(path), **opts)
+
+
+def test_positive_and_negative_ttl(tmp_path, clock):
+    cache = _cache(tmp_path / 'c.json')
+    cache.put('apple', '/ˈæpəl/')
+    cache.put('xyzzy', '')
+    assert cache.get('apple') == '/ˈæpəl/'
+    assert cache.get('xyzzy') == ''
+
+    clock[0] += 11  # quá negative_ttl, chưa quá ttl
+    assert cache.get('xyzzy') is None
+    assert cache.get('apple') == '/ˈæpəl/'
+
+    clock[0] += 100
+    assert cache.get('apple') is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['negative_hits'], stats['misses'], stats['expired']) == (2, 1, 2, 2)
+
+
+def test_lru_eviction(tmp_path):
+    cache = _cache(tmp_path / 'c.json', max_size=10)
+    for i in range(10):
+        cache.put(f'w{i}', f'/{i}/')
+    cache.get('w0')  # w0 vừa dùng -> w1 là mục cũ nhất
+    cache.put('w10', '/10/')
+    assert cache.peek('w1') is None
+    assert cache.peek('w0') == '/0/'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_peek_does_not_touch_stats(tmp_path):
+    cache = _cache(tmp_path / 'c.json')
+    cache.put('apple', '/ˈæpəl/')
+    before = cache.stats()
+    assert cache.peek('apple') == '/ˈæpəl/'
+    assert cache.peek('missing') is None
+    assert cache.stats() == before
+
+
+def test_put_does_not_write_to_disk(tmp_path):
+    path = tmp_path / 'c.json'
+    cache = _cache(path, save_interval=0.0001)
+    cache.put('apple', '/ˈæpəl/')
+    assert not path.exists()
+    cache.save()
+    assert path.exists()
+
+
+def test_save_merges_entries_from_other_workers(tmp_path, clock):
+    path = tmp_path / 'c.json'
+    worker_a, worker_b = _cache(path), _cache(path)
+    worker_a.put('apple', '/ˈæpəl/')
+    worker_b.put('banana', '/bəˈnænə/')
+    worker_b.put('apple', '')  # mục hết hạn sớm hơn không được đè mục tốt của worker khác
+    worker_a.save()
+    worker_b.save()
+
+    entries = {k: v for k, v, _ in json.loads(path.read_text(encoding='utf-8'))['entries']}
+    assert entries == {'apple': '/ˈæpəl/', 'banana': '/bəˈnænə/'}
+
+    fresh = _cache(path)
+    fresh.load()
+    assert fresh.get('banana') == '/bəˈnænə/'
+
+
+def test_load_skips_expired_and_corrupt_entries(tmp_path, clock):
+    path = tmp_path / 'c.json'
+    path.write_text(json.dumps({'version': 1, 'entries': [
+        ['ok', '/ok/', clock[0] + 50],
+        ['old', '/old/', clock[0] - 1],
+        ['bad', 3, clock[0] + 50],
+        'not-a-list',
+    ]}), encoding='utf-8')
+    cache = _cache(path)
+    cache.load()
+    assert len(cache) == 1 and cache.get('ok') == '/ok/'
+
+
+def test_batch_counts_each_miss_once(tmp_path, monkeypatch):
+    cache = _cache(tmp_path / 'c.json')
+    cache.put('apple', '/ˈæpəl/')
+    fetched = []
+    monkeypatch.setattr(app, 'PHONETIC_CACHE', cache)
+    monkeypatch.setattr(app._IPA_DICT, 'lookup', lambda text: None)
+    monkeypatch.setattr(app, '_fetch_phonetic_from_dictionary_api',
+                        lambda word: fetched.append(word) or f'/{word}/')
+
+    result = app._get_phonetics_batch(['apple', 'zorblax', 'quuxle'])
+    assert result == {'apple': '/ˈæpəl/', 'zorblax': '/zorblax/', 'quuxle': '/quuxle/'}
+    assert sorted(fetched) == ['quuxle', 'zorblax']
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 2)
+
+    assert app._get_phonetics_batch(['zorblax']) == {'zorblax': '/zorblax/'}
+    assert cache.stats()['hits'] == 2 and len(fetched) == 2
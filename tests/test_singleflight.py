@@ -0,0 +1,91 @@
+"""Singleflight: các lần gọi trùng key đang chạy song song dùng chung 1 lần thực thi (cả lỗi)."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('flask')
+
+import app  # noqa: E402
+
+
+def _run_concurrently(flight, fn, n=8):
+    started = threading.Barrier(n)
+    results: list = [None] * n
+
+    def call(i):
+        started.wait()
+        try:
+            results[i] = flight.do('key', fn)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = app._SingleFlight('test')
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return 'ipa'
+
+    results = _run_concurrently(flight, slow)
+    assert results == ['ipa'] * 8
+    assert len(calls) == 1
+    stats = flight.stats()
+    assert stats == {'in_flight': 0, 'executed': 1, 'shared': 7}
+
+
+def test_error_is_propagated_to_every_waiter_and_not_cached():
+    flight = app._SingleFlight('test')
+    calls = []
+
+    def failing():
+        calls.append(1)
+        time.sleep(0.2)
+        raise TimeoutError('upstream timed out')
+
+    results = _run_concurrently(flight, failing)
+    assert len(calls) == 1
+    assert all(isinstance(r, TimeoutError) for r in results)
+    # Lần gọi sau (không còn ai đang chạy) phải chạy lại, không dùng lỗi cũ
+    assert flight.do('key', lambda: 'ok') == 'ok'
+    assert flight.stats()['executed'] == 2
+
+
+def test_sequential_calls_are_not_coalesced():
+    flight = app._SingleFlight('test')
+    assert [flight.do('key', lambda i=i: i) for i in range(3)] == [0, 1, 2]
+    assert flight.stats()['shared'] == 0
+
+
+def test_async_singleflight_shares_task():
+    flight = app._AsyncSingleFlight('test')
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'ipa'
+
+    async def main():
+        return await asyncio.gather(*(flight.do('key', fetch) for _ in range(5)))
+
+    assert asyncio.run(main()) == ['ipa'] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {'in_flight': 0, 'executed': 1, 'shared': 4}
+
+
+def test_singleflight_stats_are_exported_on_metrics():
+    body = app.app.test_client().get('/metrics').get_data(as_text=True)
+    assert 'robo_singleflight_calls_total{flight="tts",result="executed"}' in body
+    assert 'robo_singleflight_in_flight{flight="phonetic_async"}' in body
@@ -0,0 +1,68 @@
+"""Dịch không qua mạng: từ điển song ngữ dựng từ giáo trình và cache dịch 2 tầng (RAM + SQLite)."""
+import pytest
+
+pytest.importorskip('flask')
+
+import app  # noqa: E402
+
+
+@pytest.fixture
+def no_remote(monkeypatch):
+    calls: list = []
+
+    def remote(text, dest):
+        calls.append((text, dest))
+        return f'<{text}>'
+
+    monkeypatch.setattr(app, '_translate_remote', remote)
+    return calls
+
+
+def test_lexicon_covers_curriculum_both_directions(no_remote):
+    for topic in app._CURRICULUM_COMPILED.topics.values():
+        for it in topic.vocab:
+            assert app.perform_translation(it['vi'], 'en')
+            assert app.perform_translation(it['en'], 'vi')
+    assert no_remote == []
+
+
+def test_lexicon_key_ignores_case_spacing_and_punctuation(no_remote):
+    topic = next(iter(app._CURRICULUM_COMPILED.topics.values()))
+    item = topic.vocab[0]
+    assert app.perform_translation(f"  {item['vi'].upper()} ?! ", 'en') == app.perform_translation(item['vi'], 'en')
+    assert no_remote == []
+
+
+def test_fixed_translations_win_over_remote(no_remote):
+    vi, en = next(iter(app.FIXED_TRANSLATIONS.items()))
+    assert app.perform_translation(vi, 'en') == en
+    assert no_remote == []
+
+
+def test_remote_result_is_cached_in_memory_and_sqlite(monkeypatch):
+    calls: list = []
+
+    class FakeTranslator:
+        def translate(self, text):
+            calls.append(text)
+            return 'con bạch tuộc tím'
+
+    monkeypatch.setattr(app, '_get_translator', lambda dest: FakeTranslator())
+    assert app.perform_translation('Purple Octopus Cache', 'vi') == 'con bạch tuộc tím'
+    assert app.perform_translation('purple octopus cache', 'vi') == 'con bạch tuộc tím'
+    assert calls == ['Purple Octopus Cache']
+
+    # Tầng RAM mất (vd. restart) -> vẫn đọc lại được từ SQLite
+    app._TRANSLATION_CACHE.pop(('purple octopus cache', 'vi'), None)
+    db_hits = app._CACHE_LOOKUPS.get('translation', 'db_hit')
+    assert app._translation_cache_get(('purple octopus cache', 'vi')) == 'con bạch tuộc tím'
+    assert app._CACHE_LOOKUPS.get('translation', 'db_hit') == db_hits + 1
+    assert ('purple octopus cache', 'vi') in app._TRANSLATION_CACHE
+
+
+def test_memory_tier_is_bounded(monkeypatch):
+    monkeypatch.setattr(app, '_TRANSLATION_CACHE_MAX', 10)
+    for i in range(25):
+        app._translation_cache_put((f'bounded {i}', 'vi'), f'giới hạn {i}', persist=False)
+    assert len(app._TRANSLATION_CACHE) <= 10
+    assert ('bounded 24', 'vi') in app._TRANSLATION_CACHE
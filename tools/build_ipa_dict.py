@@ -0,0 +1,157 @@
+"""Tạo từ điển phiên âm IPA offline (SQLite) từ CMUdict.
+
+Cách dùng:
+    python tools/build_ipa_dict.py cmudict.dict -o data/ipa_dict.sqlite
+    python tools/build_ipa_dict.py                 # dùng cmudict.dict trong gói pip `cmudict` (nếu đã cài)
+
+File CMUdict tải tại https://github.com/cmusphinx/cmudict (cmudict.dict).
+Repo đã kèm sẵn data/ipa_dict.sqlite (giấy phép CMUdict: data/ipa_dict.LICENSE); chỉ cần chạy lại khi
+đổi cách chuyển ARPAbet -> IPA hoặc cập nhật CMUdict.
+app.py mở file kết quả ở chế độ chỉ đọc (biến môi trường ROBO_IPA_DICT_FILE).
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+
+ARPABET_TO_IPA = {
+    'AA': 'ɑ', 'AE': 'æ', 'AH': 'ʌ', 'AO': 'ɔ', 'AW': 'aʊ', 'AY': 'aɪ',
+    'EH': 'ɛ', 'ER': 'ɝ', 'EY': 'eɪ', 'IH': 'ɪ', 'IY': 'i', 'OW': 'oʊ',
+    'OY': 'ɔɪ', 'UH': 'ʊ', 'UW': 'u',
+    'B': 'b', 'CH': 'tʃ', 'D': 'd', 'DH': 'ð', 'F': 'f', 'G': 'ɡ',
+    'HH': 'h', 'JH': 'dʒ', 'K': 'k', 'L': 'l', 'M': 'm', 'N': 'n',
+    'NG': 'ŋ', 'P': 'p', 'R': 'r', 'S': 's', 'SH': 'ʃ', 'T': 't',
+    'TH': 'θ', 'V': 'v', 'W': 'w', 'Y': 'j', 'Z': 'z', 'ZH': 'ʒ',
+}
+# Nguyên âm không nhấn
+UNSTRESSED_VOWELS = {'AH': 'ə', 'ER': 'ɚ'}
+STRESS_MARKS = {'1': 'ˈ', '2': 'ˌ'}
+VOWELS = {'AA', 'AE', 'AH', 'AO', 'AW', 'AY', 'EH', 'ER', 'EY', 'IH', 'IY', 'OW', 'OY', 'UH', 'UW'}
+# Các cụm phụ âm có thể đứng đầu âm tiết tiếng Anh. Dấu nhấn đặt trước cụm dài nhất (onset maximisation):
+# computer K AH0 M P Y UW1 ... -> kəmˈpjutɚ (cụm 'pj', không phải kəmpˈjutɚ)
+ONSET_CLUSTERS = {
+    # phụ âm + l/r/w
+    ('P', 'L'), ('P', 'R'), ('B', 'L'), ('B', 'R'), ('T', 'R'), ('D', 'R'),
+    ('K', 'L'), ('K', 'R'), ('K', 'W'), ('G', 'L'), ('G', 'R'), ('G', 'W'),
+    ('F', 'L'), ('F', 'R'), ('TH', 'R'), ('TH', 'W'), ('SH', 'R'), ('T', 'W'), ('D', 'W'),
+    # phụ âm + j (cute, music, few, view, human, beauty)
+    ('P', 'Y'), ('B', 'Y'), ('K', 'Y'), ('G', 'Y'), ('F', 'Y'), ('V', 'Y'), ('M', 'Y'), ('HH', 'Y'),
+    # s + phụ âm
+    ('S', 'P'), ('S', 'T'), ('S', 'K'), ('S', 'M'), ('S', 'N'), ('S', 'L'), ('S', 'W'), ('S', 'F'),
+    # 3 phụ âm
+    ('S', 'P', 'R'), ('S', 'T', 'R'), ('S', 'K', 'R'), ('S', 'P', 'L'), ('S', 'K', 'L'),
+    ('S', 'K', 'W'), ('S', 'P', 'Y'), ('S', 'K', 'Y'),
+}
+# Phụ âm không đứng đầu âm tiết được
+NON_ONSET = {'NG'}
+
+_ENTRY_RE = re.compile(r"^([^\s(]+)(?:\(\d+\))?\s+(.+?)\s*(?:#.*)?$")
+
+
+def arpabet_to_ipa(phones: list[str]) -> str:
+    """Chuyển 1 chuỗi phone ARPAbet (có số nhấn 0/1/2) sang IPA."""
+    symbols: list[str] = []
+    bases: list[str] = []
+    vowel_count = sum(1 for p in phones if p[-1:].isdigit())
+    for p in phones:
+        base, stress = (p[:-1], p[-1]) if p[-1:].isdigit() else (p, '')
+        if base not in ARPABET_TO_IPA:
+            raise ValueError(f"phone không hợp lệ: {p}")
+        ipa = ARPABET_TO_IPA[base]
+        if stress == '0' and base in UNSTRESSED_VOWELS:
+            ipa = UNSTRESSED_VOWELS[base]
+        if stress in STRESS_MARKS and vowel_count > 1:
+            symbols.insert(len(symbols) - _onset_length(bases), STRESS_MARKS[stress])
+        symbols.append(ipa)
+        bases.append(base)
+    return ''.join(symbols)
+
+
+def _onset_length(bases: list[str]) -> int:
+    """Số phụ âm ngay trước nguyên âm thuộc về âm tiết của nguyên âm đó (cụm hợp lệ dài nhất)."""
+    consonants = 0
+    for base in reversed(bases):
+        if base in VOWELS:
+            break
+        consonants += 1
+    if consonants == len(bases):
+        # Âm tiết đầu từ: toàn bộ phụ âm đứng đầu thuộc âm tiết này
+        return consonants
+    for n in range(min(consonants, 3), 1, -1):
+        if tuple(bases[-n:]) in ONSET_CLUSTERS:
+            return n
+    return 1 if consonants and bases[-1] not in NON_ONSET else 0
+
+
+def iter_cmudict(path: str):
+    """Đọc CMUdict, trả về (word, phones) cho cách đọc đầu tiên của mỗi từ."""
+    seen = set()
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            if not line.strip() or line.startswith(';;;'):
+                continue
+            m = _ENTRY_RE.match(line.strip())
+            if not m:
+                continue
+            word = m.group(1).lower()
+            if word in seen:
+                continue
+            seen.add(word)
+            yield word, m.group(2).split()
+
+
+def build(src: str, out: str) -> int:
+    folder = os.path.dirname(out) or '.'
+    os.makedirs(folder, exist_ok=True)
+    tmp_path = out + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    count = 0
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("CREATE TABLE ipa (word TEXT PRIMARY KEY, ipa TEXT NOT NULL) WITHOUT ROWID")
+        rows = []
+        for word, phones in iter_cmudict(src):
+            try:
+                rows.append((word, arpabet_to_ipa(phones)))
+            except ValueError:
+                continue
+        rows.sort()
+        conn.executemany("INSERT INTO ipa (word, ipa) VALUES (?, ?)", rows)
+        conn.commit()
+        count = len(rows)
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp_path, out)
+    return count
+
+
+def _packaged_cmudict() -> str | None:
+    """cmudict.dict đi kèm gói pip `cmudict`, nếu có cài."""
+    try:
+        import cmudict  # type: ignore
+    except ImportError:
+        return None
+    path = os.path.join(os.path.dirname(cmudict.__file__), 'data', 'cmudict.dict')
+    return path if os.path.exists(path) else None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('cmudict', nargs='?', help='đường dẫn tới cmudict.dict (mặc định: lấy từ gói pip cmudict)')
+    parser.add_argument('-o', '--output', default=os.path.join('data', 'ipa_dict.sqlite'))
+    args = parser.parse_args(argv)
+
+    src = args.cmudict or _packaged_cmudict()
+    if not src:
+        parser.error('cần đường dẫn cmudict.dict (hoặc pip install cmudict)')
+    count = build(src, args.output)
+    print(f"Đã ghi {count} từ vào {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
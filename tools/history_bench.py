@@ -0,0 +1,215 @@
+"""Đo chi phí lịch sử học tập (learning_history.json) theo số bản ghi.
+
+Cách dùng:
+    python tools/history_bench.py                              # 1k, 10k, 100k, 1M bản ghi
+    python tools/history_bench.py --sizes 1000,10000 --repeat 5
+    python tools/history_bench.py --data-dir /tmp/robo-hist --json history_bench.json
+
+Với mỗi kích thước, script sinh file lịch sử giả đúng schema bản ghi thật (mode, question, question_id,
+context, user_answer, score, base_score, counted, result, timestamp) rồi đo:
+- _load_history: đọc + parse toàn bộ file
+- _has_been_correct_before: 'miss' (câu chưa từng đúng -> quét hết) và 'hit' (câu chỉ đúng 1 lần, ở bản ghi size // 2)
+- save_to_history: thêm 1 bản ghi (đọc lại cả file + ghi lại cả file)
+- peak_mb: bộ nhớ Python cấp phát lớn nhất trong lúc gọi (tracemalloc, đo ở 1 lần chạy riêng)
+
+Mỗi lần chấm bài gọi cả _has_been_correct_before lẫn save_to_history nên chi phí 1 request tăng tuyến tính
+theo n, và tổng chi phí để lịch sử đạt n bản ghi tăng theo n². 'growth' trong kết quả là số mũ k
+ước lượng giữa 2 kích thước liền nhau (thời gian ~ n^k). Dùng file JSON kết quả để so sánh với backend khác.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SIZES = '1000,10000,100000,1000000'
+
+# Mode và category giống bản ghi do /api/check và /api/chat tạo ra
+_MODES = (
+    ('Speaking', 'speaking', 'vocab', 'Đọc từ: {en}'),
+    ('Writing', 'writing', 'vocab', 'Viết từ: {en}'),
+    ('Quiz', 'quiz', 'quiz', 'Câu hỏi: {en} nghĩa là gì?'),
+    ('Grammar', 'grammar', 'grammar', 'Viết câu: {en}'),
+    ('Chat Vocab', 'chat::vocab', 'chat_vocab', "Tiếng Anh của '{vi}'"),
+)
+_MISS_QID = 'benchmark::never-answered'
+# Chỉ xuất hiện 1 lần (bản ghi đúng ở giữa file) -> 'hit' phải quét ~n/2 bản ghi
+_HIT_QID = 'benchmark::answered-once'
+
+
+def _vocab_items(curriculum: dict) -> list[tuple[str, str, int, str, str]]:
+    items = []
+    for grade_id, grade in curriculum.items():
+        for topic_id, topic in grade.get('topics', {}).items():
+            for i, it in enumerate(topic.get('vocab', [])):
+                items.append((grade_id, topic_id, i, str(it.get('en', '')), str(it.get('vi', ''))))
+    return items or [('lop1', 'demo', 0, 'apple', 'quả táo')]
+
+
+def make_record(n: int, items: list, start: datetime, *, hit: bool = False) -> dict:
+    """Bản ghi thứ n, cố định theo n (chạy lại cho cùng file). hit=True: bản ghi đúng duy nhất của _HIT_QID."""
+    grade_id, topic_id, item_id, en, vi = items[n % len(items)]
+    mode, qid_mode, category, label = _MODES[(n // len(items)) % len(_MODES)]
+    correct = hit or n % 3 != 0
+    base_score = 100 if correct else (n * 37) % 60
+    counted = correct and n < len(items) * len(_MODES)
+    return {
+        "timestamp": (start + timedelta(seconds=7 * n)).strftime("%Y-%m-%d %H:%M:%S"),
+        "mode": mode,
+        "question": label.format(en=en, vi=vi),
+        "question_id": _HIT_QID if hit else '::'.join([qid_mode, grade_id, topic_id, category, str(item_id), en.lower()]),
+        "context": {"gradeId": grade_id, "topicId": topic_id, "category": category, "itemId": item_id},
+        "user_answer": en.lower() if correct else en[:-1].lower(),
+        "score": base_score if counted else 0,
+        "base_score": base_score,
+        "counted": counted,
+        "result": "Đúng" if correct else "Sai",
+    }
+
+
+def generate_history(path: str, size: int, items: list) -> None:
+    """Ghi file cùng định dạng với _write_history (json indent=2), từng bản ghi một để không tốn RAM."""
+    start = datetime(2025, 9, 5, 7, 30, 0)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for n in range(size):
+            text = json.dumps(make_record(n, items, start, hit=n == size // 2), ensure_ascii=False, indent=2)
+            f.write(',\n  ' if n else '\n  ')
+            f.write(text.replace('\n', '\n  '))
+        f.write('\n]' if size else ']')
+    os.replace(tmp_path, path)
+
+
+def _timed(fn, repeat: int) -> dict:
+    samples = []
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {'median': round(statistics.median(samples), 3), 'min': round(min(samples), 3), 'runs': len(samples)}
+
+
+def _peak_mb(fn) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / (1024 * 1024), 2)
+
+
+def bench_size(app_module, path: str, size: int, items: list, repeat: int) -> dict:
+    hit_qid = _HIT_QID if size else _MISS_QID
+    ops = {
+        'load_history': lambda: app_module._load_history(),
+        'has_been_correct_before_miss': lambda: app_module._has_been_correct_before(question_id=_MISS_QID),
+        'has_been_correct_before_hit': lambda: app_module._has_been_correct_before(question_id=hit_qid),
+        'save_to_history': lambda: app_module.save_to_history(
+            'Quiz', 'Câu hỏi: benchmark', 'apple', 0, False,
+            question_id=_MISS_QID, base_score=0, counted=False,
+            context={'gradeId': 'lop1', 'topicId': 'benchmark', 'category': 'quiz', 'itemId': 0},
+        ),
+    }
+    result = {'records': size, 'file_bytes': os.path.getsize(path), 'ms': {}, 'peak_mb': {}}
+    for name, fn in ops.items():
+        result['ms'][name] = _timed(fn, repeat)
+    # Đo bộ nhớ ở lần chạy riêng: tracemalloc làm chậm nên không lẫn vào số đo thời gian
+    for name, fn in ops.items():
+        result['peak_mb'][name] = _peak_mb(fn)
+    return result
+
+
+def growth(results: list[dict]) -> list[dict]:
+    """Số mũ k giữa 2 kích thước liền nhau: thời gian ~ n^k (1 = tuyến tính, 2 = bậc hai)."""
+    out = []
+    for a, b in zip(results, results[1:]):
+        if not a['records'] or not b['records']:
+            continue
+        ratio = math.log(b['records'] / a['records'])
+        item = {'from': a['records'], 'to': b['records']}
+        for name in b['ms']:
+            ta, tb = a['ms'][name]['median'], b['ms'][name]['median']
+            item[name] = round(math.log(tb / ta) / ratio, 2) if ta > 0 and tb > 0 else None
+        out.append(item)
+    return out
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='số bản ghi, cách nhau dấu phẩy')
+    parser.add_argument('--repeat', type=int, default=3, help='số lần đo mỗi thao tác (lấy median)')
+    parser.add_argument('--data-dir', help='giữ lại file lịch sử đã sinh ở đây (dùng lại cho lần chạy sau)')
+    parser.add_argument('--json', dest='json_out', default='history_bench.json', help='file JSON kết quả')
+    args = parser.parse_args(argv)
+    sizes = sorted({int(s) for s in args.sizes.split(',') if s.strip()})
+
+    workdir = args.data_dir or tempfile.mkdtemp(prefix='robo-history-')
+    os.makedirs(workdir, exist_ok=True)
+    # Mọi file app ghi đều nằm trong workdir: không đụng cache/lịch sử thật của máy dev
+    os.environ['ROBO_HISTORY_FILE'] = os.path.join(workdir, 'learning_history.json')
+    os.environ['ROBO_TRANSLATION_CACHE_FILE'] = os.path.join(workdir, 'translation_cache.sqlite')
+    os.environ['ROBO_PHONETIC_CACHE_FILE'] = os.path.join(workdir, 'phonetic_cache.json')
+    os.environ['ROBO_CHAT_SESSION_DB'] = os.path.join(workdir, 'chat_sessions.sqlite')
+    os.environ.setdefault('ROBO_CURRICULUM_POLL', '0')
+    os.environ.setdefault('ROBO_CHAT_SWEEP_INTERVAL', '0')
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    items = _vocab_items(app_module.CURRICULUM)
+    results = []
+    try:
+        for size in sizes:
+            # v2: có bản ghi _HIT_QID ở giữa; file sinh bởi bản cũ (không có) không được dùng lại
+            source = os.path.join(workdir, f"history_v2_{size}.json")
+            started = time.perf_counter()
+            if not os.path.exists(source):
+                generate_history(source, size, items)
+            generate_s = time.perf_counter() - started
+            # Đo trên bản sao: save_to_history ghi thêm bản ghi, file gốc giữ nguyên để dùng lại
+            target = os.path.join(workdir, 'learning_history.json')
+            shutil.copyfile(source, target)
+            app_module._HISTORY_FILE = target
+
+            r = bench_size(app_module, target, size, items, args.repeat)
+            r['generate_s'] = round(generate_s, 3)
+            results.append(r)
+            ms = r['ms']
+            print(
+                f"n={size:<8} {r['file_bytes'] / 1e6:>8.1f} MB  "
+                f"load={ms['load_history']['median']:>10.2f}  "
+                f"correct_before(miss)={ms['has_been_correct_before_miss']['median']:>10.2f}  "
+                f"save={ms['save_to_history']['median']:>10.2f} ms  "
+                f"peak(save)={r['peak_mb']['save_to_history']:>8.1f} MB"
+            )
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'results': results,
+        'growth': growth(results),
+    }
+    with open(args.json_out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    for g in report['growth']:
+        print(f"growth {g['from']}->{g['to']}: " + ', '.join(f"{k}=n^{v}" for k, v in g.items() if k not in ('from', 'to')))
+    print(f"đã ghi {args.json_out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,478 @@
+"""Benchmark tải cho HTTP API, chạy không cần mạng/GPU.
+
+Cách dùng:
+    python tools/load_bench.py --concurrency 1,8,32 --requests 200
+    python tools/load_bench.py --scenarios check_grammar,chat --latency translator=80,tts=200
+    python tools/load_bench.py --target server --json bench.json
+    python tools/load_bench.py --baseline bench.json --tolerance 0.2   # exit 1 nếu chậm đi
+
+Kịch bản (--scenarios, mặc định chạy hết):
+- check_speaking / check_writing / check_grammar / check_quiz: POST /api/check theo từng mode
+- chat: 1 đoạn hội thoại /api/chat (chào -> từ vựng -> trả lời -> dịch -> viết câu -> dừng)
+- topic: GET /api/topic/<lớp>/<chủ đề>
+- tts: GET /api/tts
+
+Dịch vụ ngoài được thay bằng bản giả cục bộ, kết quả cố định theo input, độ trễ cấu hình qua --latency (ms):
+translator (deep-translator), dictionary (dictionaryapi.dev), languagetool, tts (gTTS), model (sentence-transformers).
+--jitter lệch độ trễ ±x% (cố định theo input, chạy lại cho cùng con số).
+
+--target client (mặc định): Flask test client trong process.
+--target server: chạy app (đã thay engine giả) trên cổng local, gọi qua HTTP.
+--url http://host:port: gọi server đang chạy sẵn (engine giả không áp dụng cho server đó).
+Lịch sử, cache dịch/phiên âm được ghi vào thư mục tạm, không đụng dữ liệu thật.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ('check_speaking', 'check_writing', 'check_grammar', 'check_quiz', 'chat', 'topic', 'tts')
+DEFAULT_LATENCY_MS = {'translator': 60, 'dictionary': 80, 'languagetool': 30, 'tts': 150, 'model': 5}
+
+# Lỗi ngữ pháp giả: cụm sai -> gợi ý sửa
+_GRAMMAR_RULES = (
+    ('i has', 'I have'),
+    ('she have', 'she has'),
+    ('he have', 'he has'),
+    ('he go ', 'he goes '),
+    ('she go ', 'she goes '),
+    ('they is', 'they are'),
+    ('we is', 'we are'),
+)
+
+
+# --- Engine giả (thay cho dịch vụ ngoài) ---
+class _Latency:
+    def __init__(self, ms: dict[str, float], jitter: float):
+        self.ms = ms
+        self.jitter = jitter
+
+    def sleep(self, name: str, key: str) -> None:
+        base = self.ms.get(name, 0) / 1000
+        if base <= 0:
+            return
+        # Lệch cố định theo input: cùng key -> cùng độ trễ ở mọi lần chạy
+        frac = (zlib.crc32(key.encode('utf-8')) % 1000) / 1000
+        time.sleep(base * (1 + self.jitter * (frac * 2 - 1)))
+
+
+class _StubTranslator:
+    def __init__(self, dest: str, latency: _Latency):
+        self.dest = dest
+        self.latency = latency
+
+    def translate(self, text: str) -> str:
+        self.latency.sleep('translator', text)
+        return f"[{self.dest}] {text}"
+
+
+class _StubMatch:
+    def __init__(self, message: str, replacement: str):
+        self.message = message
+        self.replacements = [replacement]
+
+
+class _StubGrammarTool:
+    def __init__(self, latency: _Latency):
+        self.latency = latency
+
+    def check(self, text: str) -> list:
+        self.latency.sleep('languagetool', text)
+        lower = f"{text.lower()} "
+        return [_StubMatch(f"Possible agreement error: '{bad.strip()}'", good.strip()) for bad, good in _GRAMMAR_RULES if bad in lower]
+
+
+class _StubModel:
+    def __init__(self, base, latency: _Latency):
+        self.base = base
+        self.latency = latency
+
+    def encode(self, text, convert_to_tensor=True):
+        self.latency.sleep('model', str(text))
+        return self.base.encode(text, convert_to_tensor=convert_to_tensor)
+
+
+def _stub_phonetic_body(path: str) -> bytes:
+    word = urllib.parse.unquote(path.rsplit('/', 1)[-1])
+    return json.dumps([{'word': word, 'phonetic': f"/{word.lower()}/"}]).encode('utf-8')
+
+
+def install_stubs(app_module, latency: _Latency) -> None:
+    """Thay mọi lời gọi ra ngoài của app bằng bản giả (gọi sau khi import app)."""
+    translators: dict[str, _StubTranslator] = {}
+
+    def get_translator(dest):
+        if dest not in translators:
+            translators[dest] = _StubTranslator(dest, latency)
+        return translators[dest]
+
+    def dictionary_get(path):
+        latency.sleep('dictionary', path)
+        return 200, _stub_phonetic_body(path)
+
+    async def dictionary_get_async(client, path):
+        import asyncio
+
+        await asyncio.to_thread(latency.sleep, 'dictionary', path)
+        return 200, _stub_phonetic_body(path)
+
+    class StubTTSEngine(app_module._TTSEngine):
+        name = 'stub'
+
+        def available(self) -> bool:
+            return True
+
+        def synthesize(self, text: str) -> tuple[bytes, str]:
+            latency.sleep('tts', text)
+            return b'ID3' + text.encode('utf-8') * 8, 'mp3'
+
+    grammar_tool = _StubGrammarTool(latency)
+    model = _StubModel(app_module._FallbackSTModel(), latency)
+    util = app_module._FallbackSTUtil()
+
+    app_module._get_translator = get_translator
+    app_module._dictionary_api_get = dictionary_get
+    app_module._dictionary_api_get_async = dictionary_get_async
+    app_module._get_grammar_tool = lambda: grammar_tool
+    app_module._get_ai_model_and_util = lambda: (model, util)
+    app_module._TTS_ENGINES = [StubTTSEngine()]
+
+
+def load_app(workdir: str, history: str | None):
+    """Import app với dữ liệu ghi ra thư mục tạm và không bật thread nền."""
+    history_file = os.path.join(workdir, 'learning_history.json')
+    if history:
+        shutil.copyfile(history, history_file)
+    os.environ['ROBO_HISTORY_FILE'] = history_file
+    os.environ['ROBO_TRANSLATION_CACHE_FILE'] = os.path.join(workdir, 'translation_cache.sqlite')
+    os.environ['ROBO_PHONETIC_CACHE_FILE'] = os.path.join(workdir, 'phonetic_cache.json')
+    os.environ['ROBO_CHAT_SESSION_BACKEND'] = 'memory'
+    os.environ['ROBO_TTS_FORMAT'] = 'mp3'
+    os.environ.setdefault('ROBO_CURRICULUM_POLL', '0')
+    os.environ.setdefault('ROBO_CHAT_SWEEP_INTERVAL', '0')
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    return app_module
+
+
+# --- Cách gửi request ---
+class ClientTransport:
+    """Flask test client, mỗi thread 1 client riêng."""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.local = threading.local()
+
+    def request(self, method: str, path: str, body: dict | None = None) -> tuple[int, dict, bytes]:
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.flask_app.test_client()
+        resp = client.open(path, method=method, json=body)
+        return resp.status_code, dict(resp.headers), resp.get_data()
+
+    def close(self) -> None:
+        pass
+
+
+class HTTPTransport:
+    """HTTP/1.1 keep-alive, mỗi thread giữ 1 kết nối."""
+
+    def __init__(self, base_url: str):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host = parsed.hostname or '127.0.0.1'
+        self.port = parsed.port or 80
+        self.local = threading.local()
+
+    def request(self, method: str, path: str, body: dict | None = None) -> tuple[int, dict, bytes]:
+        payload = None if body is None else json.dumps(body).encode('utf-8')
+        headers = {'Content-Type': 'application/json'} if payload is not None else {}
+        for attempt in range(2):
+            conn = getattr(self.local, 'conn', None)
+            if conn is None:
+                conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+                if resp.getheader('Connection', '').lower() == 'close':
+                    conn.close()
+                    self.local.conn = None
+                return resp.status, dict(resp.getheaders()), data
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self.local.conn = None
+                if attempt:
+                    raise
+        raise RuntimeError('unreachable')
+
+    def close(self) -> None:
+        pass
+
+
+class LocalServer(HTTPTransport):
+    """Chạy app (đã thay engine giả) bằng server đa luồng của werkzeug trên cổng ngẫu nhiên."""
+
+    def __init__(self, flask_app):
+        from werkzeug.serving import make_server
+
+        self.server = make_server('127.0.0.1', 0, flask_app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        super().__init__(f"http://127.0.0.1:{self.server.server_port}")
+
+    def close(self) -> None:
+        self.server.shutdown()
+
+
+# --- Workload dựng từ giáo trình ---
+def _typo(word: str) -> str:
+    return word[:-1] if len(word) > 3 else f"{word}x"
+
+
+def build_workload(curriculum: dict) -> dict[str, list]:
+    """Mỗi kịch bản -> list thao tác; 1 thao tác là list (method, path, body, label).
+
+    Cứ 3 câu thì 1 câu trả lời sai/gần đúng để đi qua cả nhánh chấm sai.
+    """
+    ops: dict[str, list] = {name: [] for name in SCENARIOS}
+    n = 0
+    for grade_id, grade in curriculum.items():
+        for topic_id, topic in grade.get('topics', {}).items():
+            ctx = {'gradeId': grade_id, 'topicId': topic_id}
+            ops['topic'].append([('GET', f"/api/topic/{grade_id}/{topic_id}", None, 'topic')])
+            for i, item in enumerate(topic.get('vocab', [])):
+                n += 1
+                word = str(item.get('en', ''))
+                wrong = n % 3 == 0
+                answer = _typo(word) if wrong else word
+                item_ctx = dict(ctx, category='vocab', itemId=i)
+                ops['check_speaking'].append([('POST', '/api/check', {
+                    'mode': 'speaking', 'user_answer': answer.lower(), 'correct_answer': word, 'context': item_ctx,
+                }, 'check_speaking')])
+                ops['check_writing'].append([('POST', '/api/check', {
+                    'mode': 'writing', 'user_answer': answer, 'correct_answer': word, 'context': item_ctx,
+                }, 'check_writing')])
+                ops['tts'].append([('GET', f"/api/tts?text={urllib.parse.quote(word)}", None, 'tts')])
+            for i, item in enumerate(topic.get('grammar', [])):
+                n += 1
+                sentence = str(item.get('answer', ''))
+                answer = sentence
+                if n % 3 == 0:
+                    # Câu có lỗi ngữ pháp để engine giả trả về gợi ý
+                    answer = f"I has {sentence[0].lower()}{sentence[1:]}" if sentence else 'I has a cat'
+                ops['check_grammar'].append([('POST', '/api/check', {
+                    'mode': 'grammar', 'user_answer': answer, 'correct_answer': sentence,
+                    'question_text': item.get('prompt_vi', ''), 'context': dict(ctx, category='grammar', itemId=i),
+                }, 'check_grammar')])
+            for i, item in enumerate(topic.get('quiz', [])):
+                n += 1
+                options = [o for o in item.get('options', []) if o != item.get('answer')]
+                answer = options[0] if n % 3 == 0 and options else item.get('answer', '')
+                ops['check_quiz'].append([('POST', '/api/check', {
+                    'mode': 'quiz', 'user_answer': answer, 'correct_answer': item.get('answer', ''),
+                    'question_text': item.get('question', ''), 'context': dict(ctx, category='quiz', itemId=i),
+                }, 'check_quiz')])
+            vocab = topic.get('vocab') or [{'en': 'hello', 'vi': 'xin chào'}]
+            first = vocab[0]
+            ops['chat'].append([
+                ('POST', '/api/chat', {'message': message, 'context': ctx}, 'chat')
+                for message in (
+                    'xin chào',
+                    'học từ vựng',
+                    str(first.get('en', '')),
+                    f"dịch {first.get('vi', '')} sang tiếng anh",
+                    'viết câu',
+                    'I has a pet.',
+                    'stop',
+                )
+            ])
+    return ops
+
+
+# --- Chạy + thống kê ---
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def run_scenario(transport, scenario: str, ops: list, concurrency: int, total: int) -> dict:
+    """Chạy `total` thao tác với `concurrency` luồng (closed loop) và trả về thống kê."""
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+    counters = {'errors': 0, 'degraded': 0, 'shed': 0, 'requests': 0}
+    lock = threading.Lock()
+    conversation = itertools.count()
+
+    def run_op(op: list) -> None:
+        client_id = f"bench-{scenario}-{next(conversation)}"
+        for method, path, body, _label in op:
+            if body is not None and 'message' in body:
+                body = dict(body, client_id=client_id)
+            started = time.perf_counter()
+            try:
+                status, headers, _data = transport.request(method, path, body)
+            except Exception:
+                status, headers = 0, {}
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                counters['requests'] += 1
+                latencies.append(elapsed)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if status == 503:
+                    counters['shed'] += 1
+                elif status == 0 or status >= 400:
+                    counters['errors'] += 1
+                if any(k.lower() == 'x-degraded' for k in headers):
+                    counters['degraded'] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(run_op, itertools.islice(itertools.cycle(ops), total)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'operations': total,
+        'requests': counters['requests'],
+        'errors': counters['errors'],
+        'shed': counters['shed'],
+        'degraded': counters['degraded'],
+        'status': statuses,
+        'wall_s': round(wall, 3),
+        'rps': round(counters['requests'] / wall, 2) if wall > 0 else 0.0,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 2),
+            'p90': round(percentile(latencies, 90), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'max': round(latencies[-1], 2) if latencies else 0.0,
+        },
+    }
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    """So với lần chạy trước: p95 tăng hoặc rps giảm quá `tolerance` -> báo regression."""
+    base = {(r['scenario'], r['concurrency']): r for r in baseline}
+    problems = []
+    for r in results:
+        old = base.get((r['scenario'], r['concurrency']))
+        if old is None:
+            continue
+        label = f"{r['scenario']}@{r['concurrency']}"
+        if old['latency_ms']['p95'] > 0 and r['latency_ms']['p95'] > old['latency_ms']['p95'] * (1 + tolerance):
+            problems.append(f"{label}: p95 {old['latency_ms']['p95']} -> {r['latency_ms']['p95']} ms")
+        if old['rps'] > 0 and r['rps'] < old['rps'] * (1 - tolerance):
+            problems.append(f"{label}: rps {old['rps']} -> {r['rps']}")
+        if r['errors'] > old['errors']:
+            problems.append(f"{label}: errors {old['errors']} -> {r['errors']}")
+    return problems
+
+
+def parse_latency(spec: str) -> dict[str, float]:
+    latency = dict(DEFAULT_LATENCY_MS)
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        name, _, value = part.partition('=')
+        if name not in latency:
+            raise argparse.ArgumentTypeError(f"không có engine '{name}' (chọn: {', '.join(latency)})")
+        latency[name] = float(value)
+    return latency
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', default='1,8,32', help='các mức đồng thời, cách nhau dấu phẩy')
+    parser.add_argument('--requests', type=int, default=200, help='số thao tác mỗi kịch bản ở mỗi mức')
+    parser.add_argument('--warmup', type=int, default=10, help='số thao tác chạy trước (không tính)')
+    parser.add_argument('--latency', type=parse_latency, default=parse_latency(''),
+                        help='độ trễ engine giả (ms), vd. translator=60,tts=150')
+    parser.add_argument('--jitter', type=float, default=0.2)
+    parser.add_argument('--target', choices=('client', 'server'), default='client')
+    parser.add_argument('--url', help='gọi server đang chạy sẵn thay vì app trong process')
+    parser.add_argument('--history', help='file learning_history.json làm dữ liệu ban đầu')
+    parser.add_argument('--json', dest='json_out', help='ghi kết quả ra file JSON')
+    parser.add_argument('--baseline', help='file JSON của lần chạy trước để so sánh')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"kịch bản không hợp lệ: {', '.join(unknown)}")
+    levels = [max(1, int(c)) for c in args.concurrency.split(',') if c.strip()]
+
+    workdir = tempfile.mkdtemp(prefix='robo-bench-')
+    try:
+        app_module = load_app(workdir, args.history)
+        if args.url:
+            transport = HTTPTransport(args.url)
+        else:
+            install_stubs(app_module, _Latency(args.latency, args.jitter))
+            transport = LocalServer(app_module.app) if args.target == 'server' else ClientTransport(app_module.app)
+        workload = build_workload(app_module.CURRICULUM)
+
+        results = []
+        try:
+            for scenario in scenarios:
+                ops = workload[scenario]
+                if not ops:
+                    continue
+                if args.warmup:
+                    run_scenario(transport, scenario, ops, 1, args.warmup)
+                for level in levels:
+                    r = run_scenario(transport, scenario, ops, level, args.requests)
+                    results.append(r)
+                    lat = r['latency_ms']
+                    print(
+                        f"{scenario:<15} c={level:<3} {r['rps']:>8.1f} req/s  "
+                        f"p50={lat['p50']:>7.1f}  p95={lat['p95']:>7.1f}  p99={lat['p99']:>7.1f}  max={lat['max']:>7.1f} ms  "
+                        f"err={r['errors']} shed={r['shed']} degraded={r['degraded']}"
+                    )
+        finally:
+            transport.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'target': args.url or args.target,
+        'latency_ms': args.latency if not args.url else None,
+        'jitter': args.jitter,
+        'results': results,
+    }
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f).get('results', [])
+        problems = compare(results, baseline, args.tolerance)
+        if problems:
+            print(f"REGRESSION (tolerance {args.tolerance:.0%}):")
+            for p in problems:
+                print(f"  {p}")
+            return 1
+        print(f"không có regression so với {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,342 @@
+"""Phát lại learning_history.json thành traffic thật cho /api/check và /api/chat.
+
+Cách dùng:
+    python tools/replay_history.py --url http://127.0.0.1:8000 --speed 60 --learners 20
+    python tools/replay_history.py --url http://staging:8000 --speed 0 --learners 50 --json replay.json
+    python tools/replay_history.py --in-process --speed 0          # gọi app trong process (engine thật)
+
+Mỗi bản ghi lịch sử -> request:
+- Speaking / Writing / Grammar / Quiz: POST /api/check với mode, đáp án bé đã trả lời, đáp án đúng, context
+  (đáp án đúng lấy từ nhãn câu hỏi, riêng Quiz tra trong giáo trình của server theo câu hỏi).
+- Chat Vocab / Chat Grammar / Chat Quiz / Chat Missing: 2 lượt /api/chat (lệnh bắt đầu bài + câu trả lời đã ghi).
+  Server chọn câu hỏi ngẫu nhiên nên chat chỉ dùng để tạo tải, không so điểm.
+
+Tốc độ:
+- --speed N: nén thời gian N lần theo timestamp đã ghi (60 = 1 phút ghi lại chạy trong 1 giây).
+  Khoảng nghỉ dài hơn --max-gap giây (mặc định 60) bị cắt bớt để không phải chờ qua đêm.
+- --speed 0: chạy nhanh nhất có thể (mỗi learner gửi request kế tiếp ngay khi có response).
+--learners N: N bé ảo cùng phát lại lịch sử (client_id chat riêng), bắt đầu rải đều trong --ramp giây.
+
+Báo cáo: req/s, độ trễ p50/p95/p99/max và số lỗi theo loại request, độ trễ lịch (request gửi muộn so với lịch),
+và chênh lệch điểm /api/check so với base_score đã ghi. Response bị chấm nhanh (X-Degraded) và bản ghi
+có "degraded": true không tính vào phần so điểm.
+Exit code 1 nếu có câu lệch quá --drift-tolerance điểm hoặc đổi kết quả đúng/sai.
+
+Lưu ý: server sẽ ghi thêm lịch sử cho mọi request phát lại -> nên chạy với ROBO_HISTORY_FILE riêng hoặc server staging.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from load_bench import ClientTransport, HTTPTransport, load_app, percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# mode của bản ghi /api/check -> (mode gửi lên, tiền tố nhãn câu hỏi)
+_CHECK_MODES = {
+    'Speaking': ('speaking', 'Đọc từ: '),
+    'Writing': ('writing', 'Viết từ: '),
+    'Grammar': ('grammar', 'Viết câu: '),
+    'Quiz': ('quiz', 'Câu hỏi: '),
+}
+# mode của bản ghi chat -> lệnh bắt đầu bài tương ứng
+_CHAT_MODES = {
+    'Chat Vocab': 'từ vựng',
+    'Chat Grammar': 'ngữ pháp',
+    'Chat Quiz': 'kiểm tra',
+    'Chat Missing': 'điền chữ',
+}
+
+
+def _parse_ts(value) -> float | None:
+    try:
+        return datetime.strptime(str(value), '%Y-%m-%d %H:%M:%S').timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _quiz_answer(curriculum: dict, context: dict, question_text: str) -> str | None:
+    """Đáp án đúng của câu quiz: ưu tiên topic trong context, không có thì tìm trong cả giáo trình."""
+    grades = curriculum.items()
+    grade = curriculum.get(context.get('gradeId')) if isinstance(context, dict) else None
+    topic = grade.get('topics', {}).get(context.get('topicId')) if isinstance(grade, dict) else None
+    topics = [topic] if isinstance(topic, dict) else [t for _, g in grades for t in g.get('topics', {}).values()]
+    for t in topics:
+        for item in t.get('quiz', []):
+            if str(item.get('question', '')).strip() == question_text:
+                return str(item.get('answer', ''))
+    return None
+
+
+def build_replay(records: list, curriculum: dict, max_gap: float) -> tuple[list[dict], dict[str, int]]:
+    """Chuyển bản ghi -> list request theo thứ tự, mỗi request có offset (giây, đã cắt khoảng nghỉ dài)."""
+    items: list[dict] = []
+    skipped: dict[str, int] = {}
+    offset = 0.0
+    prev_ts = None
+
+    def skip(reason: str) -> None:
+        skipped[reason] = skipped.get(reason, 0) + 1
+
+    for index, rec in enumerate(records):
+        if not isinstance(rec, dict):
+            skip('invalid')
+            continue
+        mode = rec.get('mode')
+        context = rec.get('context') if isinstance(rec.get('context'), dict) else {}
+        user_answer = '' if rec.get('user_answer') is None else str(rec.get('user_answer'))
+        question = str(rec.get('question') or '')
+
+        if mode in _CHECK_MODES:
+            check_mode, prefix = _CHECK_MODES[mode]
+            label = question[len(prefix):].strip() if question.startswith(prefix) else ''
+            body = {'mode': check_mode, 'user_answer': user_answer, 'context': context}
+            if check_mode == 'quiz':
+                correct = user_answer if rec.get('result') == 'Đúng' else _quiz_answer(curriculum, context, label)
+                if correct is None:
+                    skip('quiz_not_in_curriculum')
+                    continue
+                body.update(correct_answer=correct, question_text=label)
+            else:
+                if not label:
+                    skip('no_correct_answer')
+                    continue
+                body['correct_answer'] = label
+            steps = [('/api/check', body)]
+            kind = f"check:{check_mode}"
+        elif mode in _CHAT_MODES:
+            chat_context = {'gradeId': context.get('gradeId'), 'topicId': context.get('topicId')}
+            steps = [
+                ('/api/chat', {'message': _CHAT_MODES[mode], 'context': chat_context}),
+                ('/api/chat', {'message': user_answer, 'context': chat_context}),
+            ]
+            kind = f"chat:{mode.split(' ', 1)[1].lower()}"
+        else:
+            skip(f"mode:{mode}")
+            continue
+
+        ts = _parse_ts(rec.get('timestamp'))
+        if ts is not None:
+            if prev_ts is not None:
+                offset += min(max(0.0, ts - prev_ts), max_gap)
+            prev_ts = ts
+        items.append({
+            'index': index,
+            'kind': kind,
+            'offset': offset,
+            'steps': steps,
+            # Bản ghi chấm nhanh lúc quá tải (degraded) không phải điểm chuẩn -> chỉ tạo tải, không so điểm
+            'base_score': None if rec.get('degraded') else rec.get('base_score'),
+            'result': rec.get('result'),
+        })
+    return items, skipped
+
+
+class ReplayStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.lag: list[float] = []
+        self.scores: dict[int, dict] = {}
+        self.degraded = 0
+
+    def request(self, kind: str, elapsed_ms: float, ok: bool) -> None:
+        with self.lock:
+            self.latency.setdefault(kind, []).append(elapsed_ms)
+            if not ok:
+                self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def schedule_lag(self, lag_ms: float) -> None:
+        with self.lock:
+            self.lag.append(lag_ms)
+
+    def check_result(self, item: dict, result: dict, degraded: bool) -> None:
+        with self.lock:
+            if degraded:
+                self.degraded += 1
+                return
+            # Điểm không phụ thuộc bé ảo nào -> mỗi bản ghi chỉ cần 1 kết quả
+            self.scores.setdefault(item['index'], {
+                'index': item['index'],
+                'kind': item['kind'],
+                'user_answer': item['steps'][-1][1].get('user_answer'),
+                'correct_answer': item['steps'][-1][1].get('correct_answer'),
+                'recorded': item['base_score'],
+                'recorded_correct': item['result'] == 'Đúng',
+                'replayed': result.get('score'),
+                'replayed_correct': bool(result.get('is_correct')),
+            })
+
+
+def run_learner(learner: int, items: list[dict], transport, speed: float, start_at: float, stats: ReplayStats) -> None:
+    client_id = f"replay-{learner}-{uuid.uuid4().hex[:8]}"
+    for item in items:
+        if speed > 0:
+            due = start_at + item['offset'] / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            stats.schedule_lag(max(0.0, -delay) * 1000)
+        for path, body in item['steps']:
+            if path == '/api/chat':
+                body = dict(body, client_id=client_id)
+            started = time.perf_counter()
+            try:
+                status, headers, data = transport.request('POST', path, body)
+            except Exception:
+                status, headers, data = 0, {}, b''
+            stats.request(item['kind'], (time.perf_counter() - started) * 1000, 200 <= status < 300)
+            if path == '/api/check' and status == 200:
+                try:
+                    result = json.loads(data)
+                except ValueError:
+                    continue
+                degraded = any(k.lower() == 'x-degraded' for k in headers)
+                stats.check_result(item, result, degraded)
+
+
+def score_drift(stats: ReplayStats, tolerance: float) -> dict:
+    compared = list(stats.scores.values())
+    drifted = []
+    diffs = []
+    for s in compared:
+        if not isinstance(s['recorded'], (int, float)) or not isinstance(s['replayed'], (int, float)):
+            continue
+        diff = s['replayed'] - s['recorded']
+        diffs.append(abs(diff))
+        if abs(diff) > tolerance or s['recorded_correct'] != s['replayed_correct']:
+            drifted.append(dict(s, diff=diff))
+    drifted.sort(key=lambda s: abs(s['diff']), reverse=True)
+    return {
+        'compared': len(diffs),
+        'exact': sum(1 for d in diffs if d == 0),
+        'mean_abs_diff': round(sum(diffs) / len(diffs), 2) if diffs else 0.0,
+        'max_abs_diff': max(diffs) if diffs else 0,
+        'verdict_flips': sum(1 for s in drifted if s['recorded_correct'] != s['replayed_correct']),
+        'degraded_skipped': stats.degraded,
+        'tolerance': tolerance,
+        'drifted': drifted,
+    }
+
+
+def _latency_summary(values: list[float]) -> dict:
+    values = sorted(values)
+    return {
+        'p50': round(percentile(values, 50), 2),
+        'p95': round(percentile(values, 95), 2),
+        'p99': round(percentile(values, 99), 2),
+        'max': round(values[-1], 2) if values else 0.0,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--history', default=os.path.join(ROOT, 'learning_history.json'))
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--in-process', action='store_true', help='gọi app trong process qua Flask test client')
+    parser.add_argument('--speed', type=float, default=60.0, help='hệ số nén thời gian; 0 = nhanh nhất có thể')
+    parser.add_argument('--max-gap', type=float, default=60.0, help='cắt khoảng nghỉ giữa 2 bản ghi (giây, trước khi nén)')
+    parser.add_argument('--learners', type=int, default=1, help='số bé ảo phát lại song song')
+    parser.add_argument('--ramp', type=float, default=0.0, help='rải thời điểm bắt đầu của các bé ảo trong N giây')
+    parser.add_argument('--limit', type=int, default=0, help='chỉ phát lại N bản ghi đầu')
+    parser.add_argument('--drift-tolerance', type=float, default=5.0, help='số điểm lệch cho phép so với base_score')
+    parser.add_argument('--show', type=int, default=10, help='số câu lệch điểm nhiều nhất cần in')
+    parser.add_argument('--json', dest='json_out', help='ghi kết quả ra file JSON')
+    args = parser.parse_args(argv)
+
+    with open(args.history, 'r', encoding='utf-8') as f:
+        records = json.load(f)
+    if not isinstance(records, list):
+        parser.error(f"{args.history} không phải list bản ghi")
+    if args.limit:
+        records = records[:args.limit]
+
+    workdir = None
+    if args.in_process:
+        workdir = tempfile.mkdtemp(prefix='robo-replay-')
+        app_module = load_app(workdir, None)
+        transport = ClientTransport(app_module.app)
+        curriculum = app_module.CURRICULUM
+    else:
+        transport = HTTPTransport(args.url)
+        status, _headers, data = transport.request('GET', '/api/curriculum')
+        if status != 200:
+            print(f"không lấy được /api/curriculum từ {args.url} (HTTP {status})")
+            return 2
+        curriculum = json.loads(data)
+
+    items, skipped = build_replay(records, curriculum, args.max_gap)
+    if not items:
+        print('không có bản ghi nào phát lại được', skipped)
+        return 2
+
+    learners = max(1, args.learners)
+    stats = ReplayStats()
+    started = time.monotonic()
+    threads = []
+    for learner in range(learners):
+        start_at = started + (args.ramp * learner / learners if learners > 1 else 0.0)
+        t = threading.Thread(target=run_learner, args=(learner, items, transport, args.speed, start_at, stats), daemon=True)
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+    wall = time.monotonic() - started
+    if workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    total = sum(len(v) for v in stats.latency.values())
+    by_kind = {
+        kind: dict(_latency_summary(values), requests=len(values), errors=stats.errors.get(kind, 0))
+        for kind, values in sorted(stats.latency.items())
+    }
+    drift = score_drift(stats, args.drift_tolerance)
+    report = {
+        'target': 'in-process' if args.in_process else args.url,
+        'records': len(records),
+        'replayed_records': len(items),
+        'skipped': skipped,
+        'learners': learners,
+        'speed': args.speed,
+        'wall_s': round(wall, 3),
+        'requests': total,
+        'rps': round(total / wall, 2) if wall > 0 else 0.0,
+        'by_kind': by_kind,
+        'schedule_lag_ms': _latency_summary(stats.lag) if stats.lag else None,
+        'drift': drift,
+    }
+
+    print(f"{len(items)}/{len(records)} bản ghi x {learners} bé ảo -> {total} request trong {wall:.1f}s ({report['rps']} req/s)")
+    if skipped:
+        print(f"  bỏ qua: {skipped}")
+    for kind, s in by_kind.items():
+        print(f"  {kind:<16} n={s['requests']:<6} p50={s['p50']:>8.1f}  p95={s['p95']:>8.1f}  p99={s['p99']:>8.1f}  max={s['max']:>8.1f} ms  err={s['errors']}")
+    if report['schedule_lag_ms']:
+        lag = report['schedule_lag_ms']
+        print(f"  trễ lịch        p50={lag['p50']:.1f}  p95={lag['p95']:.1f}  max={lag['max']:.1f} ms")
+    print(
+        f"điểm: so {drift['compared']} câu, khớp {drift['exact']}, lệch TB {drift['mean_abs_diff']}, "
+        f"lệch max {drift['max_abs_diff']}, đổi đúng/sai {drift['verdict_flips']}, bỏ qua (degraded) {drift['degraded_skipped']}"
+    )
+    for s in drift['drifted'][:args.show]:
+        print(
+            f"  #{s['index']:<6} {s['kind']:<15} {s['recorded']} -> {s['replayed']} ({s['diff']:+})  "
+            f"{s['user_answer']!r} vs {s['correct_answer']!r}"
+        )
+
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if drift['drifted'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
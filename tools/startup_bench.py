@@ -0,0 +1,124 @@
+"""Đo thời gian khởi động của app.py (import + request đầu tiên).
+
+Cách dùng:
+    python tools/startup_bench.py --runs 5 --top 15
+    python tools/startup_bench.py --json startup.json
+
+Mỗi lần chạy là 1 process Python mới với `-X importtime`:
+- import_ms: thời gian `import app` (tương đương thời gian boot 1 worker)
+- first_response_ms: thời gian request đầu tiên (mặc định /api/curriculum?fields=index) qua Flask test client
+- total_ms: từ lúc process bắt đầu import tới khi có response đầu tiên
+Kèm theo danh sách module tốn thời gian import nhất (cộng dồn, lấy từ `-X importtime`).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_CHILD = r"""
+import json, sys, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+resp = app.app.test_client().get({path!r})
+resp.get_data()
+t2 = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (t1 - t0) * 1000,
+    'first_response_ms': (t2 - t1) * 1000,
+    'total_ms': (t2 - t0) * 1000,
+    'status': resp.status_code,
+    'loaded': sorted(m for m in ('gtts', 'deep_translator', 'asyncio', 'http.client', 'sentence_transformers')
+                     if m in sys.modules),
+}}))
+"""
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    """Đọc output của -X importtime -> {module: cumulative_us}."""
+    result: dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        try:
+            cumulative = int(parts[1])
+        except ValueError:
+            continue
+        name = parts[2].strip()
+        result[name] = max(result.get(name, 0), cumulative)
+    return result
+
+
+def run_once(path: str) -> tuple[dict, dict[str, int]]:
+    env = dict(os.environ)
+    # Không bật thread nền/đọc lại giáo trình trong lúc đo
+    env.setdefault('ROBO_CURRICULUM_POLL', '0')
+    env.setdefault('ROBO_CHAT_SWEEP_INTERVAL', '0')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _CHILD.format(root=ROOT, path=path)],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=ROOT,
+        check=False,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'process lỗi')
+    timings = json.loads(proc.stdout.strip().splitlines()[-1])
+    return timings, parse_importtime(proc.stderr)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='số module import chậm nhất cần in')
+    parser.add_argument('--path', default='/api/curriculum?fields=index', help='URL của request đầu tiên')
+    parser.add_argument('--json', dest='json_out', help='ghi kết quả ra file JSON')
+    args = parser.parse_args(argv)
+
+    runs = []
+    modules: dict[str, list[int]] = {}
+    for _ in range(max(1, args.runs)):
+        timings, imports = run_once(args.path)
+        runs.append(timings)
+        for name, us in imports.items():
+            modules.setdefault(name, []).append(us)
+
+    summary = {
+        key: round(statistics.median(r[key] for r in runs), 2)
+        for key in ('import_ms', 'first_response_ms', 'total_ms')
+    }
+    top = sorted(
+        ((name, statistics.median(values) / 1000) for name, values in modules.items() if name != 'app'),
+        key=lambda item: item[1],
+        reverse=True,
+    )[:args.top]
+
+    print(f"runs={len(runs)}  status={runs[-1]['status']}  (median)")
+    for key, value in summary.items():
+        print(f"  {key:<18} {value:>9.2f} ms")
+    print(f"  loaded on start    {', '.join(runs[-1]['loaded']) or '-'}")
+    print(f"top {len(top)} imports (cumulative):")
+    for name, ms in top:
+        print(f"  {ms:>9.2f} ms  {name}")
+
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump({
+                'summary': summary,
+                'runs': runs,
+                'top_imports_ms': [{'module': n, 'ms': round(ms, 3)} for n, ms in top],
+            }, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())